@@ -4,24 +4,30 @@ from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 import os
 from dotenv import load_dotenv
-import re
+import string
 
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 base_url = os.getenv("OPENAI_API_BASE")
+MODEL = "moonshot-v1-8k"
+TEMPERATURE = 0.7
 deepseek_api_key = os.getenv("Deepseek_API_KEY")
 deepseek_api_base = os.getenv("Deepseek_API_BASE")
 
 
-def build_action_agent():
+def build_action_agent(model=MODEL, temperature=TEMPERATURE, base_url=base_url, http_client=None,
+                       http_async_client=None):
     llm = ChatOpenAI(
         openai_api_key=api_key,
         base_url=base_url,
-        model="moonshot-v1-8k",
+        model=model,
         # openai_api_key=deepseek_api_key,  # DeepSeek platform API Key
         # base_url=deepseek_api_base,  # DeepSeek official API address
         # model="deepseek-chat",  # Model name
-        temperature=0.7
+        temperature=temperature,
+        # Shared keep-alive HTTP clients, see agent_registry.py
+        http_client=http_client,
+        http_async_client=http_async_client,
     )
     prompt = PromptTemplate(
         input_variables=["desc"],
@@ -64,42 +70,128 @@ def build_action_agent():
     chain = prompt | llm
     return chain
 
+# Tokens searched by HtmlStreamExtractor, in ASCII lower case
+_DOCTYPE = "<!doctype html>"
+_HTML_OPEN = "<html"
+_HTML_CLOSE = "</html>"
+_HTML_FENCE = "```html"
+_FENCE = "```"
+_OVERLAP = len(_DOCTYPE) - 1  # Longest token minus one, kept between chunks
+# ASCII-only lowercasing keeps the offsets of the text unchanged, unlike str.lower()
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _has_tag(text):
+    """Returns True if text contains something like a tag, i.e. matches <[^>]+>"""
+    start = text.find("<")
+    while start != -1:
+        end = text.find(">", start + 1)
+        if end == -1:
+            return False
+        if end > start + 1:
+            return True
+        start = text.find("<", end + 1)
+    return False
+
+
+class HtmlStreamExtractor(object):
+    """
+    Extracts the HTML game from a model response fed chunk by chunk. In order
+    of preference, the result is:
+
+    1. The first <!DOCTYPE html> up to the first </html> after it
+    2. The first <html up to the first </html> after it
+    3. The content of the first ```html fenced block
+    4. The content of the first ``` fenced block, if it contains a tag
+    5. The whole response, if it contains a tag
+
+    feed() only scans the new chunk (and the few characters before it) for the
+    boundaries of case 1, and returns the document as soon as its </html>
+    arrives, since nothing fed afterwards can change it. The other cases are
+    only looked for by finish(), in one more pass, when case 1 failed.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._length = 0
+        self._tail = ""
+        self.doctype = None  # Offset of the first <!DOCTYPE html>
+        self.document = None
+
+    @property
+    def text(self):
+        """Text fed so far"""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def feed(self, chunk):
+        """Adds a chunk of the response
+
+        Returns:
+            The document the first time it is complete, None otherwise
+        """
+        if not chunk:
+            return None
+        self._parts.append(chunk)
+        if self.document is not None:
+            self._length += len(chunk)
+            return None
+        # The window starts with the end of the previous chunks, for tokens split across chunks
+        start = self._length - len(self._tail)
+        window = self._tail + chunk.translate(_ASCII_LOWER)
+        self._length += len(chunk)
+        self._tail = window[-_OVERLAP:]
+
+        if self.doctype is None:
+            index = window.find(_DOCTYPE)
+            if index == -1:
+                return None
+            self.doctype = start + index
+        end = window.find(_HTML_CLOSE, max(self.doctype + len(_DOCTYPE) - start, 0))
+        if end == -1:
+            return None
+        self.document = self.text[self.doctype:start + end + len(_HTML_CLOSE)]
+        return self.document
+
+    def finish(self):
+        """Returns the extracted HTML of the complete response, None if there is none"""
+        if self.document is not None:
+            return self.document
+        text = self.text
+        lowered = text.translate(_ASCII_LOWER)
+        start = lowered.find(_HTML_OPEN)
+        if start != -1:
+            end = lowered.find(_HTML_CLOSE, start + len(_HTML_OPEN))
+            if end != -1:
+                return text[start:end + len(_HTML_CLOSE)]
+        start = lowered.find(_HTML_FENCE)
+        if start != -1:
+            end = lowered.find(_FENCE, start + len(_HTML_FENCE))
+            if end != -1:
+                return text[start + len(_HTML_FENCE):end].strip()
+        start = lowered.find(_FENCE)
+        if start != -1:
+            end = lowered.find(_FENCE, start + len(_FENCE))
+            if end != -1:
+                code_content = text[start + len(_FENCE):end].strip()
+                if _has_tag(code_content):
+                    return code_content
+        if _has_tag(text):
+            return text
+        return None
+
+
 def extract_html(text):
     # Automatically compatible with dict and AIMessage input
     if hasattr(text, 'content'):
         text = text.content
     if isinstance(text, dict):
         text = text.get("content") or text.get("text") or str(text)
-    
-    # First try to find complete HTML document
-    match = re.search(r'<!DOCTYPE html>[\s\S]*?</html>', text, re.IGNORECASE)
-    if match:
-        return match.group(0)
-    
-    # If no DOCTYPE, try to find HTML document
-    match = re.search(r'<html[\s\S]*?</html>', text, re.IGNORECASE)
-    if match:
-        return match.group(0)
-    
-    # If no complete HTML document, try to find HTML code blocks
-    # Look for code blocks with HTML language specification
-    match = re.search(r'```html\s*([\s\S]*?)```', text, re.IGNORECASE)
-    if match:
-        return match.group(1).strip()
-    
-    # Look for code blocks without language specification
-    match = re.search(r'```\s*([\s\S]*?)```', text, re.IGNORECASE)
-    if match:
-        code_content = match.group(1).strip()
-        # Check if it contains HTML tags
-        if re.search(r'<[^>]+>', code_content):
-            return code_content
-    
-    # If still no match, return the entire text if it contains HTML tags
-    if re.search(r'<[^>]+>', text):
-        return text
-    
-    return None
+
+    extractor = HtmlStreamExtractor()
+    extractor.feed(text)
+    return extractor.finish()
 
 if __name__ == "__main__":
     agent = build_action_agent()
@@ -0,0 +1,226 @@
+# agent_pipeline.py
+# Async multi-agent pipeline behind the Send button: the action agent's HTML is
+# streamed token by token while the perception and decision agents run
+# concurrently. The decision agent always answers GENERATE_H5_GAME, so the
+# action agent never waits for it.
+import asyncio
+import os
+import queue
+import time
+from collections import namedtuple
+
+import action_agent
+import decision_agent
+from agent_registry import registry
+from multi_agent_framework import get_content
+from perception_agent import build_perception_agent
+from decision_agent import build_decision_agent
+from action_agent import build_action_agent, HtmlStreamExtractor
+from html_postprocess import postprocess
+
+CANDIDATES = int(os.getenv("ACTION_CANDIDATES", "1"))  # Concurrent generations per request
+CANDIDATE_TIMEOUT = float(os.getenv("ACTION_CANDIDATE_TIMEOUT", "0")) or None  # Seconds, 0 for none
+# Result of the perception and decision agents when they fail, the game is kept
+FALLBACK_TYPE = "Unclassified"
+FALLBACK_DECISION = "GENERATE_H5_GAME"
+# Seconds between two on_chunk calls of a stream, the text so far is only joined for them
+STREAM_INTERVAL = float(os.getenv("ACTION_STREAM_INTERVAL", "0.2"))
+
+PipelineResult = namedtuple(
+    "PipelineResult",
+    ["type", "decision", "raw", "html", "first_token_seconds", "total_seconds", "cold", "processed", "candidate"],
+)
+
+
+def get_agent(name):
+    """Returns (agent, cold) from the process-wide agent registry. The endpoint is
+    read from OPENAI_API_BASE on every call, so the agents are rebuilt when it changes
+    """
+    base_url = os.getenv("OPENAI_API_BASE")
+    if name == "perception":
+        return registry.get(name, build_perception_agent, base_url=base_url)
+    if name == "decision":
+        return registry.get(name, build_decision_agent, model=decision_agent.MODEL,
+                            temperature=decision_agent.TEMPERATURE, base_url=base_url)
+    return registry.get(name, build_action_agent, model=action_agent.MODEL,
+                        temperature=action_agent.TEMPERATURE, base_url=base_url)
+
+
+def chunk_text(chunk):
+    """Returns the text of a streamed chunk (AIMessageChunk, dict or str)"""
+    if hasattr(chunk, "content"):
+        return chunk.content or ""
+    if isinstance(chunk, dict):
+        return chunk.get("content") or chunk.get("text") or ""
+    return str(chunk)
+
+
+async def run_perception_decision(full_prompt):
+    """Runs the perception agent, then the decision agent on its answer
+
+    Returns:
+        (type_str, decision_str)
+    """
+    perception, _ = get_agent("perception")
+    type_result = await perception.ainvoke({"desc": full_prompt})
+    type_str = get_content(type_result)
+    decision, _ = get_agent("decision")
+    decision_result = await decision.ainvoke({"type": type_str})
+    return type_str, get_content(decision_result)
+
+
+async def stream_action(full_prompt, on_chunk=None, interval=STREAM_INTERVAL):
+    """Streams the action agent's response
+
+    Arguments:
+        full_prompt (str): Prompt built from the task configuration
+        on_chunk (callable): Called as on_chunk(text_so_far) at most every interval
+            seconds, and once more with the final text
+        interval (float): Seconds between two on_chunk calls
+
+    Returns:
+        (raw response text, extracted HTML, seconds until the first token)
+    """
+    action, _ = get_agent("action")
+    start = time.perf_counter()
+    first_token = None
+    extractor = HtmlStreamExtractor()
+    # Joining the text so far on every chunk would be quadratic in the response length
+    last_update = None
+    pending = False
+    stream = action.astream({"desc": full_prompt})
+    try:
+        async for chunk in stream:
+            text = chunk_text(chunk)
+            if not text:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter() - start
+            document = extractor.feed(text)
+            pending = True
+            now = time.monotonic()
+            if on_chunk is not None and (last_update is None or now - last_update >= interval):
+                last_update = now
+                pending = False
+                on_chunk(extractor.text)
+            if document is not None:
+                # The game is complete, the rest would only be comments on it
+                break
+    finally:
+        await stream.aclose()
+    if on_chunk is not None and pending:
+        on_chunk(extractor.text)
+    return extractor.text, extractor.finish(), first_token
+
+
+async def best_candidate(full_prompt, candidates=CANDIDATES, timeout=CANDIDATE_TIMEOUT, on_chunk=None):
+    """Streams several action agent generations concurrently and keeps the first
+    usable one. The sampling temperature makes the candidates differ, so one
+    that fails extraction or validation does not cost another full round.
+
+    Arguments:
+        full_prompt (str): Prompt built from the task configuration
+        candidates (int): Number of concurrent generations
+        timeout (float): Seconds after which a generation is abandoned, None for no limit
+        on_chunk (callable): Called with the text so far of the leading candidate,
+            the first one to stream that is still running, see stream_action()
+
+    Returns:
+        (raw, html, first token seconds, PostprocessResult, candidate index) of
+        the first candidate accepted by postprocess(), else of the last one to
+        finish. The other candidates are cancelled.
+    """
+    leader = [None]
+
+    async def generate(index):
+        def show(text):
+            if leader[0] is None:
+                leader[0] = index
+            if leader[0] == index and on_chunk is not None:
+                on_chunk(text)
+
+        try:
+            raw, html, first_token = await asyncio.wait_for(stream_action(full_prompt, show), timeout)
+        finally:
+            if leader[0] == index:
+                leader[0] = None
+        return raw, html, first_token, postprocess(html), index
+
+    tasks = [asyncio.ensure_future(generate(index)) for index in range(max(candidates, 1))]
+    fallback = error = None
+    try:
+        for finished in asyncio.as_completed(tasks):
+            try:
+                candidate = await finished
+            except Exception as exception:  # Timeouts and failed requests
+                error = exception
+                continue
+            if candidate[3].accepted:
+                return candidate
+            fallback = candidate
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Let the cancelled candidates close their streams
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if fallback is None:
+        raise error
+    return fallback
+
+
+async def run_pipeline(full_prompt, on_chunk=None, candidates=CANDIDATES, timeout=CANDIDATE_TIMEOUT):
+    """Runs the three agents, streaming the action agent on the critical path
+
+    Arguments:
+        full_prompt (str): Prompt built from the task configuration
+        on_chunk (callable): Called with the action agent's text so far, see stream_action()
+        candidates (int): Concurrent action agent generations, see best_candidate()
+        timeout (float): Seconds after which a generation is abandoned, None for no limit
+
+    Returns:
+        A PipelineResult. If the perception or decision agent fails, its type and
+        decision are FALLBACK_TYPE and FALLBACK_DECISION, the game is not lost.
+    """
+    start = time.perf_counter()
+    # Building the agents on this request makes it a cold one
+    cold = any([get_agent(name)[1] for name in ("perception", "decision", "action")])
+    side = asyncio.ensure_future(run_perception_decision(full_prompt))
+    try:
+        raw, html, first_token, processed, candidate = await best_candidate(
+            full_prompt, candidates, timeout, on_chunk
+        )
+    except BaseException:
+        side.cancel()
+        raise
+    try:
+        type_str, decision_str = await side
+    except Exception as exception:
+        # Only labels the request, the decision agent always answers GENERATE_H5_GAME
+        print(f"Perception/decision agents failed, keeping the generated game: {exception!r}")
+        type_str, decision_str = FALLBACK_TYPE, FALLBACK_DECISION
+    total = time.perf_counter() - start
+    registry.record_latency(cold, total)
+    return PipelineResult(type_str, decision_str, raw, html, first_token, total, cold, processed, candidate)
+
+
+def run_pipeline_sync(full_prompt, on_chunk=None, candidates=CANDIDATES, timeout=CANDIDATE_TIMEOUT):
+    """run_pipeline for synchronous callers such as the Streamlit script thread.
+
+    The pipeline runs on the registry's background event loop, which owns the
+    pooled connections; on_chunk is still called from the calling thread.
+    """
+    chunks = queue.Queue()
+    future = registry.run(run_pipeline(full_prompt, chunks.put, candidates, timeout))
+    while True:
+        try:
+            text = chunks.get(timeout=0.05)
+        except queue.Empty:
+            if future.done():
+                break
+            continue
+        # Only the latest text matters, skip the ones already superseded
+        while not chunks.empty():
+            text = chunks.get_nowait()
+        if on_chunk is not None:
+            on_chunk(text)
+    return future.result()
@@ -0,0 +1,120 @@
+# agent_registry.py
+# Process-wide registry of the built agent chains, shared by every Streamlit
+# session and rerun. All agents talk to the LLM endpoint through one pair of
+# pooled keep-alive HTTP clients, and all async LLM calls run on one background
+# event loop, so connections (and their TLS sessions) are reused between requests.
+import asyncio
+import collections
+import inspect
+import threading
+import time
+
+import httpx
+
+# Connection pool shared by every agent
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 60.0  # Seconds an idle connection is kept open
+REQUEST_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+
+class AgentRegistry(object):
+    """
+    Caches built agent chains by name and configuration. An entry is rebuilt
+    when the model, base URL or temperature it was built with changes, and can
+    be invalidated explicitly. Also records cold (first build) and warm request
+    latencies.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agents = {}
+        self._clients = None
+        self._loop = None
+        self.build_times = {}
+        self.latencies = {"cold": collections.deque(maxlen=1000), "warm": collections.deque(maxlen=1000)}
+
+    def http_clients(self):
+        """Returns the shared (httpx.Client, httpx.AsyncClient) pair"""
+        with self._lock:
+            if self._clients is None:
+                limits = httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                )
+                self._clients = (
+                    httpx.Client(limits=limits, timeout=REQUEST_TIMEOUT),
+                    httpx.AsyncClient(limits=limits, timeout=REQUEST_TIMEOUT),
+                )
+            return self._clients
+
+    def loop(self):
+        """Returns the background event loop running every async agent call.
+        The async HTTP client's connections belong to this loop, so it has to
+        outlive the requests instead of a new loop being created per request.
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever, name="agent-loop", daemon=True)
+                thread.start()
+            return self._loop
+
+    def run(self, coroutine):
+        """Schedules a coroutine on the background loop and returns its future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop())
+
+    def get(self, name, builder, **config):
+        """Returns the agent built by builder(**config), building it on first use.
+
+        Arguments:
+            name (str): Agent name, e.g. "action"
+            builder (callable): build_*_agent function
+            config: model, base_url, temperature... the agent was built with;
+                an entry built with another configuration is replaced
+
+        Returns:
+            (agent, cold) where cold is true if the agent has just been built
+        """
+        key = tuple(sorted(config.items()))
+        with self._lock:
+            entry = self._agents.get(name)
+            if entry is not None and entry[0] == key:
+                return entry[1], False
+
+        # Builders only get the options they accept, the others only key the cache entry
+        parameters = inspect.signature(builder).parameters
+        kwargs = {option: value for option, value in config.items() if option in parameters}
+        if "http_client" in parameters:
+            kwargs["http_client"], kwargs["http_async_client"] = self.http_clients()
+        start = time.perf_counter()
+        agent = builder(**kwargs)
+        with self._lock:
+            self.build_times[name] = time.perf_counter() - start
+            self._agents[name] = (key, agent)
+        return agent, True
+
+    def invalidate(self, name=None):
+        """Drops the agent called name, or every agent, rebuilt on next use"""
+        with self._lock:
+            if name is None:
+                self._agents.clear()
+            else:
+                self._agents.pop(name, None)
+
+    def record_latency(self, cold, seconds):
+        """Records the latency of a request, cold if it had to build an agent"""
+        with self._lock:
+            self.latencies["cold" if cold else "warm"].append(seconds)
+
+    def latency_report(self):
+        """Returns the count and mean latency of cold and warm requests"""
+        with self._lock:
+            return {
+                kind: {"count": len(values), "mean_seconds": sum(values) / len(values) if values else None}
+                for kind, values in self.latencies.items()
+            }
+
+
+registry = AgentRegistry()
@@ -3,167 +3,24 @@
 import streamlit as st
 import os
 from multi_agent_framework import multi_agent_process
+import task_config
 
 st.set_page_config(page_title="LangChain + Streamlit Agent Dialogue Demo", layout="centered")
 
 st.title("LangChain + Streamlit Agent Dialogue Demo")
 
-# Pagination: Dialogue, Mini Games, Camera Recording
-# New pagination (Streamlit 1.10+)
-tabs = st.tabs(["Dialogue", "Mini Game", "Camera Recording", "Tetris", "2048", "Sokoban"])
+# Pagination: Dialogue, Mini Games, and the camera recording and attention detection in the sidebar
+# Page router: unlike st.tabs, only the selected page is computed and sent on a rerun.
+PAGES = ["Dialogue", "Mini Game", "Tetris", "2048", "Sokoban"]
+page = st.radio("Page", PAGES, horizontal=True, key="page", label_visibility="collapsed")
 
-# For storing the latest generated HTML code
-if 'latest_html' not in st.session_state:
-    st.session_state['latest_html'] = None
+# Widgets of the pages not rendered in a run lose their state, keep the task configuration
+for key in ("task_what", "task_how", "task_level", "task_user_input"):
+    if key in st.session_state:
+        st.session_state[key] = st.session_state[key]
 
-# Globally disable page scrollbars to prevent arrow keys from scrolling the page
-st.markdown("""
-<style>
-body, html {
-    overflow: hidden !important;
-}
-</style>
-""", unsafe_allow_html=True)
-
-# Dialogue page
-with tabs[0]:
-    st.header("Multi-Agent Dialogue Area")
-    if 'history' not in st.session_state:
-        st.session_state['history'] = []
-    
-    # Add prompt selection area
-    st.subheader("🎯 Task Configuration")
-    
-    # By cognitive/functional goal (WHAT)
-    st.write("**1. Cognitive/Functional Goal (WHAT)**")
-    what_options = {
-        "Perceptual Training": "Task Type: Auditory discrimination, visual tracking, tactile exploration; Functional Goal: Enhance sensory input processing ability; Game Example: Color block dragging",
-        "Emotion Recognition and Regulation": "Task Type: Facial expression matching, emotion classification, self-emotion reporting; Functional Goal: Recognize others/self emotional states; Game Example: Simulated expression selection, emotion bar adjustment task",
-        "Social Communication Skills": "Task Type: Turn-taking dialogue, greeting practice, virtual interaction; Functional Goal: Enhance understanding of social interaction rules; Game Example: NPC dialogue imitation practice",
-        "Attention and Executive Function": "Task Type: Attention maintenance, working memory, multitasking; Functional Goal: Improve task completion and organizational ability; Game Example: Spot the difference, sorting game",
-        "Interest-Guided Learning": "Task Type: Embed specific interest content in tasks; Functional Goal: Increase motivation, improve task acceptance; Game Example: Train number recognition, dinosaur matching"
-    }
-    selected_what = st.selectbox("Select Cognitive/Functional Goal:", list(what_options.keys()))
-    
-    # By interaction form (HOW)
-    st.write("**2. Interaction Form (HOW)**")
-    how_options = {
-        "Gamified Task": "Task Feature: Emphasize rules, feedback, and scores; Game Example: Snake, 2048, matching game",
-        "Story-based Task": "Task Feature: Scenario-driven, guide social reasoning; Game Example: 'Go shopping' interactive story",
-        "Daily Simulation Task": "Task Feature: Simulate real-life scenarios; Game Example: Dressing, tooth brushing task guidance"
-    }
-    selected_how = st.selectbox("Select Interaction Form:", list(how_options.keys()))
-    
-    # By task difficulty and level (LEVEL)
-    st.write("**3. Task Difficulty and Level (LEVEL)**")
-    level_options = {
-        "Low Difficulty": "Task Feature: Single modality, reactive, no social logic; Game Example: Click the appearing image",
-        "Medium Difficulty": "Task Feature: Multimodal, with sequence/feedback rules; Game Example: Drag image to sequence position",
-        "High Difficulty": "Task Feature: Intent reasoning, role-playing; Game Example: Choose the correct response in dialogue"
-    }
-    selected_level = st.selectbox("Select Task Difficulty:", list(level_options.keys()))
-    
-    # Show the combined full prompt
-    prompt1 = what_options[selected_what]
-    prompt2 = how_options[selected_how]
-    prompt3 = level_options[selected_level]
-    combined_prompt = f"{prompt1} | {prompt2} | {prompt3}"
-    
-    st.write("**📋 Full Prompt Preview:**")
-    st.info(combined_prompt)
-    
-    # User input area
-    st.subheader("💬 User Requirement")
-    user_input = st.text_input("Please enter specific requirement:", placeholder="For example: I want a game about dinosaurs")
-    
-    # New: Normative prefix
-    prompt_prefix = (
-        "Please generate a high-quality H5 web mini-game with the following requirements:"
-        "1. The game must have clear start and end buttons;"
-        "2. The game must have basic functions such as scoring and replay;"
-        "3. The game must disable arrow key scrolling of the webpage, and arrow keys are only for game operation;"
-        "4. When the game ends, only a popup on the current page is allowed, and no popup when switching tabs."
-        "Please strictly follow the above requirements."
-    )
-    
-    # Combine all prompts
-    full_prompt = f"{prompt_prefix} | Task Configuration: {combined_prompt} | User Requirement: {user_input}"
-    
-    if st.button("Send", key="chat_send"):
-        progress = st.progress(0)
-        st.info("Perception Agent running...")
-        progress.progress(33)
-        # --- New: Stepwise output from each Agent ---
-        from multi_agent_framework import get_content
-        from perception_agent import build_perception_agent
-        from decision_agent import build_decision_agent
-        from action_agent import build_action_agent, extract_html
-        # Perception Agent
-        perception_agent = build_perception_agent()
-        type_result = perception_agent.invoke({"desc": full_prompt})
-        type_str = get_content(type_result)
-        st.info(f"Perception Agent: {type_str}")
-        progress.progress(40)
-        # Decision Agent
-        decision_agent = build_decision_agent()
-        decision = decision_agent.invoke({"type": type_str})
-        decision_str = get_content(decision)
-        st.info(f"Decision Agent: {decision_str}")
-        progress.progress(60)
-        # Action Agent - Always generate H5 game
-        html_code = None
-        st.info("Action Agent: Starting HTML generation...")
-        action_agent = build_action_agent()
-        html_code_raw = action_agent.invoke({"desc": full_prompt})
-        
-        # Debug: Show raw response info
-        st.info(f"Action Agent: Raw response type: {type(html_code_raw)}")
-        st.info(f"Action Agent: Raw response length: {len(str(html_code_raw))}")
-        
-        html_code = extract_html(html_code_raw)
-        if html_code:
-            st.info("Action Agent: HTML code generated successfully!")
-            st.info(f"Action Agent: Extracted HTML length: {len(html_code)}")
-            st.code(html_code[:500] + "..." if len(html_code) > 500 else html_code, language="html")
-        else:
-            st.warning("Action Agent: Failed to extract HTML code from response.")
-            st.error("Action Agent: Raw response for debugging:")
-            st.code(str(html_code_raw)[:1000] + "..." if len(str(html_code_raw)) > 1000 else str(html_code_raw), language="text")
-        progress.progress(90)
-        progress.progress(100)
-        st.success("Multi-agent process completed!")
-        # Save all Agent outputs to history
-        st.session_state['history'].append({
-            "user": user_input,
-            "what": selected_what,
-            "how": selected_how,
-            "level": selected_level,
-            "full_prompt": full_prompt,
-            "type": type_str,
-            "decision": decision_str,
-            "html": html_code
-        })
-        # If there is html, save to session_state for mini game page
-        if html_code:
-            st.session_state['latest_html'] = html_code
-            st.success("HTML code saved to session state!")
-        else:
-            st.warning("No HTML code to save.")
-    
-    # Show dialogue history
-    st.markdown("### Dialogue History:")
-    for item in st.session_state['history']:
-        st.write(f"**You:** {item['user']}")
-        st.write(f"**Task Configuration:** WHAT={item['what']}, HOW={item['how']}, LEVEL={item['level']}")
-        st.write(f"**Full Prompt:** {item['full_prompt']}")
-        st.write(f"**Perception Agent:** {item['type']}")
-        st.write(f"**Decision Agent:** {item['decision']}")
-        if item['html']:
-            st.write("**[H5 Game HTML Snippet]**")
-            st.code(item['html'], language="html")
-        st.markdown("---")
-    # Disable arrow key scrolling
-    st.components.v1.html("""
+# Blocks the arrow keys from scrolling the page, for the documents it is embedded in
+ARROW_KEY_SCRIPT = """
     <script>
     document.addEventListener('keydown', function(e) {
         if([37,38,39,40].indexOf(e.keyCode) > -1) {
@@ -171,49 +28,49 @@ with tabs[0]:
         }
     }, false);
     </script>
-    """, height=0)
+    """
 
-# Mini Game page
-with tabs[1]:
-    st.header("Web Mini Game Demo")
-    st.info("H5 mini games can be embedded here, AI-generated supported.")
-    
-    # Add debug information
-    st.write(f"**Debug: latest_html exists:** {st.session_state.get('latest_html') is not None}")
-    if st.session_state.get('latest_html'):
-        st.write(f"**Debug: latest_html length:** {len(st.session_state['latest_html'])}")
-    
-    # If there is the latest generated HTML, embed and display
-    if st.session_state.get('latest_html'):
-        st.success("Found HTML code! Displaying game...")
-        st.components.v1.html(st.session_state['latest_html'], height=500)
-    else:
-        st.warning("No AI-generated H5 game HTML snippet yet. Please generate in the dialogue area for automatic display.")
-    # Disable arrow key scrolling
-    st.components.v1.html("""
-    <script>
-    document.addEventListener('keydown', function(e) {
-                 if([37,38,39,40].indexOf(e.keyCode) > -1) {
-            e.preventDefault();
-        }
-    }, false);
-    </script>
-    """, height=0)
+# Id of the latest generated game in the game store (game_store.py), the HTML itself stays on disk
+from game_store import store as game_store, add_history_entry, HISTORY_PAGE_SIZE
+if 'latest_html_id' not in st.session_state:
+    st.session_state['latest_html_id'] = None
+
+# Static server of the stored games (GAME_SERVER=1, off by default): the tabs embed a game by URL,
+# and the browser caches it, instead of receiving the whole document on every rerun
+import game_server
+games_served = game_server.GAME_SERVER and game_server.start_background() is not None
+
+# Pre-generate the game library in the background (GAME_LIBRARY_AUTOFILL=1), once per process
+if os.getenv("GAME_LIBRARY_AUTOFILL") == "1":
+    import game_library
+    game_library.start_background()
+
+# Globally disable page scrollbars to prevent arrow keys from scrolling the page
+st.markdown("""
+<style>
+body, html {
+    overflow: hidden !important;
+}
+</style>
+""", unsafe_allow_html=True)
 
-# Camera Recording page
-with tabs[2]:
+# Camera recording and attention detection, in the sidebar rather than a page: they stay
+# mounted whatever the page, so attention is monitored while the child plays on the Mini
+# Game page. Their components are identical on every rerun, so the browser keeps the
+# running iframes instead of reloading them.
+with st.sidebar:
     st.header("Camera Recording Agent (Local Save)")
     st.info("Click the button below to start recording. The video will be saved locally when you close the page or click stop.")
-    html_code = """
+    camera_html = """
     # Page structure
     <div>
-      <video id='video' width='320' height='240' autoplay muted></video> #Show camera  
+      <video id='video' width='320' height='240' autoplay muted style='width:100%;height:auto;'></video> #Show camera  
       <br>
       <button id='startBtn'>Start Recording</button> #Start recording
       <button id='stopBtn' disabled>Stop Recording</button> #Stop recording 
       <div id='progress' style='display:none;'>
         <p>Saving recording...</p> #Saving recording
-        <progress id='saveProgress' value='0' max='100' style='width:320px;'></progress> #Progress bar  
+        <progress id='saveProgress' value='0' max='100' style='width:100%;'></progress> #Progress bar  
       </div>
     </div>
     # Script
@@ -286,24 +143,13 @@ with tabs[2]:
     }
     </script>
     """
-    st.components.v1.html(html_code, height=400)
-    # Disable arrow key scrolling
-    st.components.v1.html("""
-    <script>
-    document.addEventListener('keydown', function(e) {
-        if([37,38,39,40].indexOf(e.keyCode) > -1) {
-            e.preventDefault();
-        }
-    }, false);
-    </script>
-    """, height=0)
+    st.components.v1.html(camera_html, height=400)
 
-    # New: Attention detection function
     st.header("Attention Detection (WebSocket Real-time Feedback)")
-    st.info("This page will detect your attention status in real time. If distracted, a popup will appear. Please allow camera permission. Click the button below to start detection.")
+    st.info("Detects your attention status in real time, whatever the page. If distracted, a popup will appear. Please allow camera permission. Click the button below to start detection.")
     attention_html = '''
     <div>
-      <video id="attention_video" width="320" height="240" autoplay muted style="border:1px solid #aaa;"></video>
+      <video id="attention_video" width="320" height="240" autoplay muted style="border:1px solid #aaa;width:100%;height:auto;"></video>
       <canvas id="attention_canvas" width="320" height="240" style="display:none;"></canvas>
       <br>
       <button id="start_attention_btn">Start Detection</button>
@@ -313,13 +159,89 @@ with tabs[2]:
     let warned_attention = false;
     let attention_stream = null;
     let attention_timer = null;
+    // Frame-id acks: never have more than MAX_IN_FLIGHT unanswered frames
+    const MAX_IN_FLIGHT = 2;
+    const ACK_TIMEOUT_MS = 2000; // Resume sending if the server stops acking
+    let attention_sent_id = 0;
+    let attention_acked_id = 0;
+    let attention_last_ack = 0;
+    // Binary frames (see frame_transport.py): 'jpeg', 'gray' (raw luma) or 'json' for the legacy data URL
+    const ATTENTION_ENCODING = 'jpeg';
+    const FRAME_ENCODINGS = { jpeg: 0, png: 1, gray: 2 };
+    const FRAME_HEADER_SIZE = 20;
+    function frameMessage(frame_id, width, height, encoding, payload) {
+      const message = new Uint8Array(FRAME_HEADER_SIZE + payload.byteLength);
+      const header = new DataView(message.buffer);
+      header.setUint8(0, 71); // 'G'
+      header.setUint8(1, 90); // 'Z'
+      header.setUint8(2, 1);  // version
+      header.setUint8(3, FRAME_ENCODINGS[encoding]);
+      header.setUint32(4, frame_id, true);
+      header.setUint16(8, width, true);
+      header.setUint16(10, height, true);
+      header.setFloat64(12, Date.now(), true);
+      message.set(new Uint8Array(payload), FRAME_HEADER_SIZE);
+      return message.buffer;
+    }
+    function sendAttentionFrame(ctx, canvas, frame_id) {
+      if (ATTENTION_ENCODING === 'json') {
+        ws_attention.send(JSON.stringify({ image: canvas.toDataURL('image/jpeg'), frame_id: frame_id, ts: Date.now() }));
+      } else if (ATTENTION_ENCODING === 'gray') {
+        const rgba = ctx.getImageData(0, 0, canvas.width, canvas.height).data;
+        const luma = new Uint8Array(canvas.width * canvas.height);
+        for (let i = 0, j = 0; j < luma.length; i += 4, j++) {
+          luma[j] = (77 * rgba[i] + 150 * rgba[i + 1] + 29 * rgba[i + 2]) >> 8;
+        }
+        ws_attention.send(frameMessage(frame_id, canvas.width, canvas.height, 'gray', luma.buffer));
+      } else {
+        canvas.toBlob(blob => {
+          blob.arrayBuffer().then(jpeg => {
+            if (ws_attention && ws_attention.readyState === 1) {
+              ws_attention.send(frameMessage(frame_id, canvas.width, canvas.height, 'jpeg', jpeg));
+            }
+          });
+        }, 'image/jpeg', 0.8);
+      }
+    }
+    // Stable id of this browser: its reconnections reach the same server process
+    // and get back their calibration (see attention_supervisor.py)
+    function attentionSessionId() {
+      try {
+        let id = localStorage.getItem('attention_session_id');
+        if (!id) {
+          id = window.crypto && crypto.randomUUID ? crypto.randomUUID()
+            : Date.now().toString(36) + Math.random().toString(36).slice(2);
+          localStorage.setItem('attention_session_id', id);
+        }
+        return id;
+      } catch (e) {
+        return null; // Storage blocked, the server numbers the session
+      }
+    }
     function connectWSAttention() {
-      ws_attention = new WebSocket('ws://localhost:8765/attention');
+      const session_id = attentionSessionId();
+      ws_attention = new WebSocket('ws://localhost:8765/attention' +
+        (session_id ? '?session=' + encodeURIComponent(session_id) : ''));
+      ws_attention.binaryType = 'arraybuffer';
       ws_attention.onopen = function() {
         console.log('WebSocket for attention connected');
+        attention_acked_id = attention_sent_id;
+        attention_last_ack = Date.now();
       };
       ws_attention.onmessage = function(event) {
         let data = JSON.parse(event.data);
+        if(data.frame_id !== undefined) {
+          attention_acked_id = Math.max(attention_acked_id, data.frame_id);
+          attention_last_ack = Date.now();
+          if(data.ts !== undefined) {
+            console.debug('attention lag', Date.now() - data.ts, 'ms, dropped', data.dropped);
+          }
+        }
+        if(data.type === 'rate') {
+          // Server-driven capture rate and resolution
+          setAttentionRate(data.fps, data.width, data.height);
+          return;
+        }
         if(data.status === 'distracted' && !warned_attention) {
           warned_attention = true;
           alert('Attention not focused, please focus on the screen!');
@@ -330,75 +252,267 @@ with tabs[2]:
         setTimeout(connectWSAttention, 1000); // Reconnect on disconnect
       };
     }
+    let attention_fps = 5;
+    function captureAttentionFrame() {
+      const attention_video = document.getElementById('attention_video');
+      const attention_canvas = document.getElementById('attention_canvas');
+      const attention_ctx = attention_canvas.getContext('2d');
+      if(!ws_attention || ws_attention.readyState !== 1) return;
+      if(attention_sent_id - attention_acked_id >= MAX_IN_FLIGHT &&
+         Date.now() - attention_last_ack < ACK_TIMEOUT_MS) return; // Server is behind, skip this frame
+      attention_ctx.drawImage(attention_video, 0, 0, attention_canvas.width, attention_canvas.height);
+      attention_sent_id += 1;
+      sendAttentionFrame(attention_ctx, attention_canvas, attention_sent_id);
+    }
+    function setAttentionRate(fps, width, height) {
+      const attention_canvas = document.getElementById('attention_canvas');
+      if (width && height && (attention_canvas.width !== width || attention_canvas.height !== height)) {
+        attention_canvas.width = width;
+        attention_canvas.height = height;
+      }
+      if (fps && fps !== attention_fps) {
+        attention_fps = fps;
+        if (attention_timer) {
+          clearInterval(attention_timer);
+          attention_timer = setInterval(captureAttentionFrame, 1000 / attention_fps);
+        }
+      }
+    }
     document.getElementById('start_attention_btn').onclick = function() {
       if (ws_attention && ws_attention.readyState === 1) return;
       connectWSAttention();
       const attention_video = document.getElementById('attention_video');
-      const attention_canvas = document.getElementById('attention_canvas');
-      const attention_ctx = attention_canvas.getContext('2d');
       navigator.mediaDevices.getUserMedia({ video: true }).then(stream => {
         attention_video.srcObject = stream;
         attention_stream = stream;
         if (attention_timer) clearInterval(attention_timer);
-        attention_timer = setInterval(() => {
-          attention_ctx.drawImage(attention_video, 0, 0, attention_canvas.width, attention_canvas.height);
-          let dataURL = attention_canvas.toDataURL('image/jpeg');
-          if(ws_attention && ws_attention.readyState === 1) {
-            ws_attention.send(JSON.stringify({ image: dataURL }));
-          }
-        }, 200); // 5fps
+        // 5fps until the server sends a rate
+        attention_timer = setInterval(captureAttentionFrame, 1000 / attention_fps);
       });
     }
     </script>
     '''
     st.components.v1.html(attention_html, height=300)
 
+# Dialogue page
+if page == "Dialogue":
+    st.header("Multi-Agent Dialogue Area")
+    if 'history' not in st.session_state:
+        st.session_state['history'] = []
+    
+    # Add prompt selection area
+    st.subheader("🎯 Task Configuration")
+    
+    what_options = task_config.WHAT_OPTIONS
+    how_options = task_config.HOW_OPTIONS
+    level_options = task_config.LEVEL_OPTIONS
+
+    # By cognitive/functional goal (WHAT)
+    st.write("**1. Cognitive/Functional Goal (WHAT)**")
+    selected_what = st.selectbox("Select Cognitive/Functional Goal:", list(what_options.keys()), key="task_what")
+    
+    # By interaction form (HOW)
+    st.write("**2. Interaction Form (HOW)**")
+    selected_how = st.selectbox("Select Interaction Form:", list(how_options.keys()), key="task_how")
+    
+    # By task difficulty and level (LEVEL)
+    st.write("**3. Task Difficulty and Level (LEVEL)**")
+    selected_level = st.selectbox("Select Task Difficulty:", list(level_options.keys()), key="task_level")
+    
+    # Show the combined full prompt
+    combined_prompt = task_config.combined_prompt(selected_what, selected_how, selected_level)
+    
+    st.write("**📋 Full Prompt Preview:**")
+    st.info(combined_prompt)
+    
+    # User input area
+    st.subheader("💬 User Requirement")
+    user_input = st.text_input("Please enter specific requirement:", placeholder="For example: I want a game about dinosaurs", key="task_user_input")
+    
+    # Combine all prompts (normative prefix, task configuration and requirement)
+    full_prompt = task_config.full_prompt(selected_what, selected_how, selected_level, user_input)
+    
+    new_variant = st.checkbox("Generate a new variant instead of a stored game", key="chat_new_variant")
+    import agent_pipeline
+    candidates = st.number_input("Parallel candidates (the first valid game wins)", min_value=1, max_value=5,
+                                 value=max(1, min(agent_pipeline.CANDIDATES, 5)), key="chat_candidates")
+    if st.button("Send", key="chat_send"):
+        progress = st.progress(0)
+        import time
+        import action_agent
+        from game_cache import cache as game_cache, cache_key
+        # --- Game cache: a repeated task configuration is served from disk ---
+        lookup_start = time.perf_counter()
+        game_key = cache_key(full_prompt, model=action_agent.MODEL, temperature=action_agent.TEMPERATURE)
+        # --- Game library: without a free-text requirement, the pre-generated game of the cell ---
+        library_game = None
+        if not user_input.strip() and not new_variant:
+            from game_library import library as game_library
+            library_game = game_library.get(selected_what, selected_how, selected_level)
+        cached = None if new_variant or library_game is not None else game_cache.get(game_key)
+        if library_game is not None:
+            type_str = "Library game"
+            decision_str = "GENERATE_H5_GAME"
+            html_code_raw = html_code = library_game["html"]
+            st.info(f"Game library: Pre-generated game served in {(time.perf_counter() - lookup_start) * 1000:.0f} ms")
+        elif cached is not None:
+            type_str = cached["type"]
+            decision_str = cached["decision"]
+            html_code_raw = html_code = cached["html"]
+            st.info(f"Game cache: Stored game served in {(time.perf_counter() - lookup_start) * 1000:.0f} ms")
+            st.info(f"Perception Agent: {type_str}")
+            st.info(f"Decision Agent: {decision_str}")
+        else:
+            st.info("Action Agent: Starting HTML generation (Perception and Decision Agents run alongside)...")
+            progress.progress(10)
+            # --- Async pipeline: the action agent streams while the other agents run concurrently ---
+            stream_placeholder = st.empty()
+
+            def show_stream(text):
+                # Called every agent_pipeline.STREAM_INTERVAL seconds, each update is a message to the browser
+                progress.progress(min(10 + len(text) // 200, 85))
+                stream_placeholder.code(text[-1500:], language="html")
+
+            result = agent_pipeline.run_pipeline_sync(full_prompt, on_chunk=show_stream, candidates=int(candidates))
+            stream_placeholder.empty()
+            type_str = result.type
+            decision_str = result.decision
+            html_code_raw = result.raw
+            html_code = result.html
+            # --- Post-processing: reject broken games, strip network references, minify ---
+            if html_code:
+                processed = result.processed
+                if candidates > 1:
+                    st.info(f"Action Agent: Candidate {result.candidate + 1} of {candidates} kept")
+                if processed.external:
+                    st.warning(f"Post-processing: External references removed: {', '.join(processed.external[:5])}")
+                st.info(f"Post-processing: {processed.original_bytes} -> {processed.bytes} bytes")
+                if processed.accepted:
+                    html_code = processed.html
+                    game_cache.put(game_key, html_code, type_str, decision_str)
+                else:
+                    st.error(f"Post-processing: Game rejected, missing: {', '.join(processed.missing)}")
+                    html_code = None
+            st.info(f"Perception Agent: {type_str}")
+            st.info(f"Decision Agent: {decision_str}")
+
+            # Debug: Show raw response info
+            st.info(f"Action Agent: First token after {result.first_token_seconds or 0:.1f}s, "
+                    f"done after {result.total_seconds:.1f}s")
+            from agent_registry import registry as agent_registry
+            latency = agent_registry.latency_report()
+            st.caption(" | ".join(
+                f"{kind} requests: {report['count']}, mean {report['mean_seconds'] or 0:.1f}s"
+                for kind, report in latency.items()
+            ) + (" (this one was cold: agents were built)" if result.cold else ""))
+        cache_stats = game_cache.stats()
+        st.caption(f"Game cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                   f"{cache_stats['entries']} games stored")
+        st.info(f"Action Agent: Raw response length: {len(html_code_raw)}")
+
+        if html_code:
+            st.info("Action Agent: HTML code generated successfully!")
+            st.info(f"Action Agent: Extracted HTML length: {len(html_code)}")
+            st.code(html_code[:500] + "..." if len(html_code) > 500 else html_code, language="html")
+        else:
+            st.warning("Action Agent: Failed to extract HTML code from response.")
+            st.error("Action Agent: Raw response for debugging:")
+            st.code(str(html_code_raw)[:1000] + "..." if len(str(html_code_raw)) > 1000 else str(html_code_raw), language="text")
+        progress.progress(90)
+        progress.progress(100)
+        st.success("Multi-agent process completed!")
+        # Save all Agent outputs to history, the game itself goes to the game store
+        html_id = game_store.put(html_code) if html_code else None
+        add_history_entry(st.session_state['history'], {
+            "user": user_input,
+            "what": selected_what,
+            "how": selected_how,
+            "level": selected_level,
+            "full_prompt": full_prompt,
+            "type": type_str,
+            "decision": decision_str,
+            "html_id": html_id,
+            "html_bytes": len(html_code.encode("utf-8")) if html_code else 0,
+        })
+        # If there is html, save its id to session_state for mini game page
+        if html_id:
+            st.session_state['latest_html_id'] = html_id
+            st.success("HTML code saved to the game store!")
+        else:
+            st.warning("No HTML code to save.")
+    
+    # Show dialogue history, one page at a time and newest first, so a rerun
+    # costs the same however long the session has lasted
+    st.markdown("### Dialogue History:")
+    history = st.session_state['history']
+    pages = max(1, -(-len(history) // HISTORY_PAGE_SIZE))
+    history_page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1,
+                                   key="history_page") if pages > 1 else 1
+    first = len(history) - (history_page - 1) * HISTORY_PAGE_SIZE
+    for index in range(first - 1, max(first - HISTORY_PAGE_SIZE, 0) - 1, -1):
+        item = history[index]
+        st.write(f"**You:** {item['user']}")
+        st.write(f"**Task Configuration:** WHAT={item['what']}, HOW={item['how']}, LEVEL={item['level']}")
+        st.write(f"**Full Prompt:** {item['full_prompt']}")
+        st.write(f"**Perception Agent:** {item['type']}")
+        st.write(f"**Decision Agent:** {item['decision']}")
+        if item['html_id']:
+            # The HTML is only read from disk and sent when asked for
+            if st.checkbox(f"Show H5 game HTML ({item['html_bytes'] // 1024} KB)", key=f"history_html_{item['html_id']}_{index}"):
+                html = game_store.get(item['html_id'])
+                st.code(html if html is not None else "Game no longer stored.", language="html")
+        st.markdown("---")
+
+# Mini Game page
+elif page == "Mini Game":
+    st.header("Web Mini Game Demo")
+    st.info("H5 mini games can be embedded here, AI-generated supported.")
+    
+    # Add debug information
+    latest_html_id = st.session_state.get('latest_html_id')
+    latest_html_bytes = game_store.size(latest_html_id) if latest_html_id else None
+    st.write(f"**Debug: latest_html exists:** {latest_html_bytes is not None}")
+    if latest_html_bytes is not None:
+        st.write(f"**Debug: latest_html length:** {latest_html_bytes}")
+    
+    # If there is the latest generated HTML, embed and display
+    if latest_html_bytes is not None:
+        st.success("Found HTML code! Displaying game...")
+        if games_served:
+            # Only the URL goes through the websocket, the browser fetches (and caches) the game
+            st.components.v1.iframe(game_server.game_url(latest_html_id), height=500)
+        else:
+            st.components.v1.html(game_store.get(latest_html_id), height=500)
+    else:
+        st.warning("No AI-generated H5 game HTML snippet yet. Please generate in the dialogue area for automatic display.")
+
 # Tetris page
-with tabs[3]:
+elif page == "Tetris":
     st.header("Tetris")
     st.info("Classic Tetris game, use arrow keys to move.")
     tetris_html = '''
     <iframe src="https://www.xarg.org/project/tetris/" style="width:100vw;height:100vh;border:none;" frameborder="0" scrolling="no"></iframe>
-    <script>
-    document.addEventListener('keydown', function(e) {
-        if([37,38,39,40].indexOf(e.keyCode) > -1) {
-            e.preventDefault();
-        }
-    }, false);
-    </script>
-    '''
+    ''' + ARROW_KEY_SCRIPT
     st.components.v1.html(tetris_html, height=1000)
 
 # 2048 page
-with tabs[4]:
+elif page == "2048":
     st.header("2048 Puzzle Game")
     st.info("2048 merge number game, use arrow keys to move.")
     game2048_html = '''
     <iframe src="https://2048game.com/" width="400" height="600" frameborder="0" scrolling="no"></iframe>
-    <script>
-    document.addEventListener('keydown', function(e) {
-        if([37,38,39,40].indexOf(e.keyCode) > -1) {
-            e.preventDefault();
-        }
-    }, false);
-    </script>
-    '''
+    ''' + ARROW_KEY_SCRIPT
     st.components.v1.html(game2048_html, height=620)
 
 # Sokoban page
-with tabs[5]:
+elif page == "Sokoban":
     st.header("Sokoban")
     st.info("Classic Sokoban puzzle game, use arrow keys to move.")
    
     sokoban_html = '''
     <iframe src="https://kippenjungle.nl/COI/sokoban.html" style="width:100vw;height:95vh;min-height:600px;border:none;display:block;margin:0 auto;" frameborder="0" scrolling="no"></iframe>
-    <script>
-    document.addEventListener('keydown', function(e) {
-        if([37,38,39,40].indexOf(e.keyCode) > -1) {
-            e.preventDefault();
-        }
-    }, false);
-    </script>
-    '''
+    ''' + ARROW_KEY_SCRIPT
     st.components.v1.html(sokoban_html, height=1000)
 
+# Disable arrow key scrolling, emitted once whatever the page
+st.components.v1.html(ARROW_KEY_SCRIPT, height=0)
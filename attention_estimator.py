@@ -0,0 +1,116 @@
+# attention_estimator.py
+# Streaming focused/distracted estimate of a session, smoothed over recent frames
+# and debounced with hysteresis so that a single blink or noisy frame does not flip it.
+import collections
+import statistics
+
+SMOOTHING_MODES = ("median", "ema")
+
+
+class AttentionEstimator(object):
+    """
+    Keeps a fixed-size ring buffer of the recent horizontal gaze ratios and
+    blink flags of a session and derives a "focused" / "distracted" state.
+
+    The gaze deviation |horizontal_ratio - 0.5| is smoothed (median of the
+    window or exponential moving average). The state switches to "distracted"
+    when the smoothed deviation rises above distracted_above, or when more than
+    blink_fraction of the window is blinking, and back to "focused" only once
+    the deviation falls below focused_below. A switch also has to be confirmed
+    by min_dwell consecutive frames.
+    """
+
+    def __init__(self, window=10, smoothing="median", alpha=0.3, distracted_above=0.2,
+                 focused_below=0.15, blink_fraction=0.5, min_dwell=3):
+        """
+        Arguments:
+            window (int): Number of recent frames kept
+            smoothing (str): "median" or "ema"
+            alpha (float): Weight of the newest frame for the "ema" smoothing
+            distracted_above (float): Smoothed deviation from the center (0.5)
+                above which the child is considered distracted
+            focused_below (float): Smoothed deviation below which a distracted
+                child is considered focused again, lower than distracted_above
+            blink_fraction (float): Fraction of blinking frames in the window
+                above which the child is considered distracted
+            min_dwell (int): Consecutive frames needed to confirm a state change
+        """
+        if smoothing not in SMOOTHING_MODES:
+            raise ValueError(f"Unknown smoothing: {smoothing}")
+        if focused_below > distracted_above:
+            raise ValueError("focused_below must not be above distracted_above")
+        self.smoothing = smoothing
+        self.alpha = alpha
+        self.distracted_above = distracted_above
+        self.focused_below = focused_below
+        self.blink_fraction = blink_fraction
+        self.min_dwell = min_dwell
+
+        self.state = "focused"
+        self.transitions = 0
+        self._deviations = collections.deque(maxlen=window)
+        self._blinks = collections.deque(maxlen=window)
+        self._ema = None
+        self._pending = 0
+
+    @property
+    def deviation(self):
+        """Smoothed deviation of the gaze from the center, None before any gaze"""
+        if not self._deviations:
+            return None
+        if self.smoothing == "ema":
+            return self._ema
+        return statistics.median(self._deviations)
+
+    @property
+    def blink_rate(self):
+        """Fraction of the recent frames where the eyes were closed"""
+        if not self._blinks:
+            return 0.0
+        return sum(self._blinks) / len(self._blinks)
+
+    def _target_state(self):
+        deviation = self.deviation
+        if self.blink_rate > self.blink_fraction:
+            return "distracted"
+        if deviation is None:
+            return self.state
+        if self.state == "focused" and deviation > self.distracted_above:
+            return "distracted"
+        if self.state == "distracted" and deviation < self.focused_below:
+            return "focused"
+        return self.state
+
+    def update(self, horizontal_ratio, blinking):
+        """Adds the measurements of a frame
+
+        Arguments:
+            horizontal_ratio (float): GazeTracking.horizontal_ratio(), None without pupils
+            blinking (bool): GazeTracking.is_blinking(), None without pupils
+
+        Returns:
+            The new state if this frame changed it, None otherwise
+        """
+        if horizontal_ratio is None and blinking is None:
+            # No face or no pupils, nothing to learn from this frame
+            return None
+        if horizontal_ratio is not None:
+            deviation = abs(horizontal_ratio - 0.5)
+            self._deviations.append(deviation)
+            if self._ema is None:
+                self._ema = deviation
+            else:
+                self._ema = self.alpha * deviation + (1 - self.alpha) * self._ema
+        self._blinks.append(bool(blinking))
+
+        if self._target_state() == self.state:
+            self._pending = 0
+            return None
+        self._pending += 1
+        if self._pending < self.min_dwell:
+            return None
+
+        self._pending = 0
+        self.state = "distracted" if self.state == "focused" else "focused"
+        self.transitions += 1
+        return self.state
@@ -0,0 +1,387 @@
+# attention_metrics.py
+# Metrics of the attention WebSocket server in the Prometheus text format, and
+# a sampling profiler that can be switched on while the server runs:
+#
+#   ATTENTION_METRICS_PORT=9108 python example.py
+#   curl localhost:9108/metrics
+#   curl localhost:9108/profile/start; sleep 30; curl localhost:9108/profile/stop
+#   curl localhost:9108/profile > stacks.txt   # collapsed stacks, for flamegraph.pl
+#
+# The metrics are updated from the event loop thread only and read by the HTTP
+# thread, so they take no lock; a scrape may see a histogram one frame behind
+# its count, which Prometheus tolerates.
+import bisect
+import collections
+import math
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from a raw frame decode to a stalled socket
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric(object):
+    """Base of the metric types: a name, a help text and optional labels.
+    A labelled metric holds one child per combination of label values."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        """Returns the child metric of a combination of label values"""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def remove(self, *values):
+        """Forgets the child of a combination of label values, e.g. of a closed session"""
+        self._children.pop(tuple(str(value) for value in values), None)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _items(self):
+        if self.labelnames:
+            return list(self._children.items())
+        return [((), self)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._items():
+            lines.extend(child._samples(self.name, self.labelnames, values))
+        return lines
+
+
+class Counter(_Metric):
+    """A value that only goes up"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0
+
+    def _new_child(self):
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def _samples(self, name, labelnames, values):
+        return [f"{name}_total{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down. With a function, the value is computed
+    at every scrape; a labelled gauge's function returns {label values: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0
+        self.function = function
+
+    def _new_child(self):
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def _items(self):
+        if self.function is None:
+            return super()._items()
+        result = self.function()
+        if not self.labelnames:
+            return [((), _Constant(result))]
+        return [(tuple(str(value) for value in values), _Constant(value))
+                for values, value in sorted(result.items())]
+
+    def _samples(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class _Constant(object):
+    """Sample of a function gauge"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    _samples = Gauge._samples
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (latencies, in seconds) over fixed buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def time(self):
+        """Returns a context manager observing the time spent in its block"""
+        return _Timer(self)
+
+    def _samples(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            le = _format_labels(labelnames, values, [("le", _format_value(bound))])
+            lines.append(f"{name}_bucket{le} {cumulative}")
+        labels = _format_labels(labelnames, values)
+        lines.append(f"{name}_sum{labels} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+
+class _Timer(object):
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class MetricsRegistry(object):
+    """Holds the metrics of a process and renders them in the Prometheus text format"""
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self._metrics = collections.OrderedDict()
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self.prefix + name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self._register(Gauge(self.prefix + name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self.prefix + name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler(object):
+    """
+    Statistical profiler: a daemon thread records the Python stack of every
+    other thread each interval seconds, through sys._current_frames(). Unlike
+    cProfile it adds nothing to the profiled code, only the sampling thread's
+    own cost (a few microseconds per thread per sample), so it can be switched
+    on in production. The stacks are reported in the collapsed format of
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.01, max_depth=64):
+        """
+        Arguments:
+            interval (float): Seconds between two samples
+            max_depth (int): Innermost frames kept per stack
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.started_at = None
+        self.seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Starts sampling, does nothing if the profiler already runs"""
+        with self._lock:
+            if self.running:
+                return False
+            self._stop.clear()
+            self.started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Stops sampling, the recorded stacks are kept until reset()"""
+        with self._lock:
+            if not self.running:
+                return False
+            self._stop.set()
+            self._thread.join()
+            self.seconds += time.monotonic() - self.started_at
+            return True
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+            self.seconds = 0.0
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            del frame
+
+    def collapsed(self):
+        """Returns the recorded stacks, one "frame;frame;... count" line per stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit=20):
+        """Returns the (function, share of the samples) pairs of the innermost
+        frames seen most often, a quick answer to "where is the time spent" """
+        leaves = collections.Counter()
+        for stack, count in list(self.stacks.items()):
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = float(sum(leaves.values())) or 1.0
+        return [(leaf, count / total) for leaf, count in leaves.most_common(limit)]
+
+
+registry = MetricsRegistry(prefix="attention_")
+profiler = SamplingProfiler(interval=float(os.getenv("ATTENTION_PROFILE_INTERVAL", "0.01")))
+
+frames_received = registry.counter("frames_received", "Frames received, by transport", ["transport"])
+frames_dropped = registry.counter("frames_dropped", "Frames replaced by a newer one before analysis")
+frames_invalid = registry.counter("frames_invalid", "Messages that could not be parsed or decoded")
+frames_analysed = registry.counter("frames_analysed", "Frames analysed, by outcome (face or no_face)", ["outcome"])
+status_total = registry.counter("status", "Attention status of the analysed frames", ["status"])
+transitions_total = registry.counter("transitions", "Attention status changes sent to the clients")
+messages_sent = registry.counter("messages_sent", "Messages sent to the clients, by type", ["type"])
+parse_seconds = registry.histogram("parse_seconds", "Parsing of a WebSocket message into a frame request")
+decode_seconds = registry.histogram("decode_seconds", "Decoding of a frame payload into an image")
+refresh_seconds = registry.histogram("refresh_seconds", "GazeTracking.refresh() of a frame")
+status_seconds = registry.histogram("status_seconds", "Attention status decision of a frame")
+send_seconds = registry.histogram("send_seconds", "websocket.send() of a reply")
+lag_seconds = registry.histogram("lag_seconds", "Time from the reception of a frame to its reply")
+connections = registry.counter("connections", "WebSocket connections accepted")
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves GET /metrics, and /profile, /profile/top, /profile/start,
+    /profile/stop and /profile/reset to drive the sampling profiler"""
+
+    metrics = registry
+    sampler = profiler
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        sampler = self.sampler
+        if path == "/metrics":
+            self._send(200, self.metrics.render(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/profile":
+            self._send(200, sampler.collapsed())
+        elif path == "/profile/top":
+            lines = [f"{share:6.1%}  {leaf}" for leaf, share in sampler.top()]
+            header = f"{sampler.samples} samples, profiler {'running' if sampler.running else 'stopped'}"
+            self._send(200, "\n".join([header] + lines) + "\n")
+        elif path == "/profile/start":
+            started = sampler.start()
+            self._send(200, "started\n" if started else "already running\n")
+        elif path == "/profile/stop":
+            stopped = sampler.stop()
+            self._send(200, f"stopped, {sampler.samples} samples\n" if stopped else "not running\n")
+        elif path == "/profile/reset":
+            sampler.reset()
+            self._send(200, "reset\n")
+        else:
+            self._send(404, "Not found\n")
+
+    def _send(self, status, text, content_type="text/plain; charset=utf-8"):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_background(host="127.0.0.1", port=9108):
+    """Serves the metrics and the profiler in a daemon thread.
+    Returns the server, or None if the port is taken."""
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    except OSError as error:
+        print(f"Metrics endpoint not started on {host}:{port}: {error}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="attention-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,443 @@
+# attention_session.py
+# Session manager for the attention WebSocket server: one GazeTracking per
+# connection, shared landmark models and a bounded analysis pool.
+import asyncio
+import collections
+import hashlib
+import itertools
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from attention_estimator import AttentionEstimator
+from gaze_tracking import GazeTracking
+from gaze_tracking.backends import create_backend
+from gaze_tracking.batch import refresh_batch
+from rate_control import RateController, SessionRate
+
+# Backpressure modes: "fifo" analyses every frame in order, "latest" keeps only
+# the newest pending frame of a session and drops the stale ones
+BACKPRESSURE_MODES = ("fifo", "latest")
+
+
+FrameMeasurement = collections.namedtuple(
+    "FrameMeasurement", ["horizontal_ratio", "blinking", "seconds", "pixels", "decode_seconds"]
+)
+
+
+def measure_frame(gaze, request):
+    """Decodes a frame request, runs the gaze pipeline on it and returns a
+    FrameMeasurement, or None if the payload could not be decoded.
+    Executed on the worker pool, never on the event loop.
+    """
+    start = time.perf_counter()
+    frame = request.decoder(request.payload)
+    if frame is None:
+        return None
+    decoded = time.perf_counter()
+    gaze.refresh(frame)
+    return FrameMeasurement(
+        gaze.horizontal_ratio(), gaze.is_blinking(),
+        time.perf_counter() - start, frame.shape[0] * frame.shape[1], decoded - start,
+    )
+
+
+def measure_batch(items, backend):
+    """Decodes and analyses the frame requests of several sessions in one
+    batch, see gaze_tracking.batch.refresh_batch. Executed on the worker pool.
+
+    Arguments:
+        items (list): (GazeTracking, FrameRequest) pairs, one per session
+        backend (backends.LandmarkBackend): Backend of the calling worker thread
+
+    Returns:
+        One FrameMeasurement, None (payload not decodable) or exception per item
+    """
+    results = [None] * len(items)
+    decoded = []
+    for index, (gaze, request) in enumerate(items):
+        start = time.perf_counter()
+        try:
+            frame = request.decoder(request.payload)
+        except Exception as e:
+            results[index] = e
+            continue
+        if frame is not None:
+            decoded.append((index, gaze, frame, time.perf_counter() - start))
+    if not decoded:
+        return results
+    start = time.perf_counter()
+    refresh_batch([(gaze, frame) for _, gaze, frame, _ in decoded], backend)
+    # The batch time is shared between its frames by pixel count
+    seconds = time.perf_counter() - start
+    pixels = float(sum(frame.shape[0] * frame.shape[1] for _, _, frame, _ in decoded))
+    for index, gaze, frame, decode_seconds in decoded:
+        frame_pixels = frame.shape[0] * frame.shape[1]
+        results[index] = FrameMeasurement(
+            gaze.horizontal_ratio(), gaze.is_blinking(),
+            decode_seconds + seconds * frame_pixels / pixels, frame_pixels, decode_seconds,
+        )
+    return results
+
+
+class MicroBatcher(object):
+    """
+    Gathers the frames of different sessions into batches analysed by a
+    single worker call (measure_batch). A batch is sent to the pool once it
+    holds max_batch frames or when its oldest frame has waited max_delay
+    seconds, whichever comes first; several batches can be analysed at once.
+    Must be used from the event loop thread.
+    """
+
+    def __init__(self, executor, backend_factory, max_batch=8, max_delay=0.005):
+        """
+        Arguments:
+            executor (concurrent.futures.Executor): Pool running the batches
+            backend_factory (callable): Returns a new backend, one is made per worker thread
+            max_batch (int): Frames per batch
+            max_delay (float): Latency deadline, in seconds, of a frame waiting for its batch
+        """
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.batched_frames = 0
+        self._backend_factory = backend_factory
+        self._local = threading.local()
+        self._pending = []
+        self._timer = None
+
+    async def submit(self, gaze, request):
+        """Queues a frame for the next batch and returns its FrameMeasurement,
+        or None if it could not be decoded"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((gaze, request, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            self.batches += 1
+            self.batched_frames += len(pending)
+            asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending):
+        loop = asyncio.get_running_loop()
+        items = [(gaze, request) for gaze, request, _ in pending]
+        try:
+            results = await loop.run_in_executor(self.executor, self._measure, items)
+        except Exception as e:
+            results = [e] * len(pending)
+        for (_, _, future), result in zip(pending, results):
+            if future.done():
+                continue  # The session was closed meanwhile
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _measure(self, items):
+        # Face detectors are not thread-safe, each worker thread gets its own backend
+        backend = getattr(self._local, "backend", None)
+        if backend is None:
+            backend = self._local.backend = self._backend_factory()
+        return measure_batch(items, backend)
+
+    @property
+    def mean_batch(self):
+        """Average number of frames per batch so far"""
+        return self.batched_frames / self.batches if self.batches else 0.0
+
+
+class FrameRequest(object):
+    """
+    A frame received from a client. The payload is only decoded on the worker
+    pool, so frames dropped by the "latest" mode cost nothing but parsing.
+    """
+
+    __slots__ = ("payload", "decoder", "frame_id", "client_ts", "received_at", "wants_ack")
+
+    def __init__(self, payload, decoder, frame_id=None, client_ts=None):
+        self.payload = payload
+        self.decoder = decoder
+        # Clients that number their frames throttle themselves on the acks
+        self.wants_ack = frame_id is not None
+        self.frame_id = frame_id
+        self.client_ts = client_ts
+        self.received_at = time.monotonic()
+
+
+def request_session_id(websocket, path):
+    """Returns the ?session= id of the connection URL, or None"""
+    if path is None:
+        # websockets >= 14 no longer passes the path to the handler
+        request = getattr(websocket, "request", None)
+        path = getattr(request, "path", None) or getattr(websocket, "path", None) or ""
+    return parse_qs(urlsplit(path).query).get("session", [None])[0] or None
+
+
+class CalibrationStore(object):
+    """
+    Pupil threshold calibrations of the sessions, kept on disk so that a
+    session reconnecting, possibly to a restarted worker process, does not
+    calibrate again. One pickle per session id, written atomically.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, session_id):
+        digest = hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".calibration")
+
+    def load(self, session_id):
+        """Returns the saved calibration of a session, or None if there is none
+        or it cannot be read, e.g. pickled by an older version of the Calibration class"""
+        try:
+            with open(self.path(session_id), "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError, TypeError):
+            return None
+
+    def save(self, session_id, calibration):
+        path = self.path(session_id)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(calibration, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+
+class AttentionSession(object):
+    """
+    State owned by a single WebSocket client: its own GazeTracking (and
+    therefore its own Calibration), its attention estimator, the queue of
+    frames waiting for analysis and the frame counters reported back to the client.
+    """
+
+    def __init__(self, session_id, gaze, max_queue, backpressure="fifo", estimator=None):
+        if backpressure not in BACKPRESSURE_MODES:
+            raise ValueError(f"Unknown backpressure mode: {backpressure}")
+        self.session_id = session_id
+        # Only ids chosen by the client identify it across connections
+        self.persistent = False
+        self.gaze = gaze
+        self.estimator = estimator or AttentionEstimator()
+        self.rate = SessionRate()
+        self.backpressure = backpressure
+        self.queue = asyncio.Queue(maxsize=1 if backpressure == "latest" else max_queue)
+        self.in_flight = 0
+
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._lag_total = 0.0
+        self._next_frame_id = itertools.count(1)
+
+    @property
+    def queue_depth(self):
+        """Frames received but not answered yet, including the one being analysed"""
+        return self.queue.qsize() + self.in_flight
+
+    async def put(self, request):
+        """Queues a frame request. In "fifo" mode this waits while the queue is
+        full, which pauses reading from the socket. In "latest" mode the pending
+        frame, if any, is dropped in favour of the new one.
+        """
+        if request.frame_id is None:
+            request.frame_id = next(self._next_frame_id)
+        self.received += 1
+        if self.backpressure == "latest":
+            while self.queue.full():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(request)
+        else:
+            await self.queue.put(request)
+
+    def record_processed(self, request):
+        """Updates the counters once the answer to a request has been sent.
+        The lag is measured from reception on the server to the reply.
+        """
+        lag = time.monotonic() - request.received_at
+        self.processed += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self._lag_total += lag
+
+    def stats(self):
+        """Returns the frame counters and lag (in milliseconds) of the session"""
+        mean_lag = self._lag_total / self.processed if self.processed else 0.0
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "queue_depth": self.queue_depth,
+            "lag_ms": round(self.last_lag * 1000, 1),
+            "mean_lag_ms": round(mean_lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "state": self.estimator.state,
+            "transitions": self.estimator.transitions,
+        }
+
+
+class SessionManager(object):
+    """
+    Creates one AttentionSession per connection and runs their frame analysis
+    on a bounded thread pool. The landmark models are loaded once and shared
+    by every session through backend clones; face detectors and calibrations
+    are per session.
+    """
+
+    def __init__(self, max_workers=None, max_queue=4, backend=None, backpressure="fifo",
+                 keyframe_interval=0, backend_name="dlib", estimator_options=None,
+                 rate_options=None, batch_size=1, batch_delay=0.005, state_dir=None):
+        """
+        Arguments:
+            max_workers (int): Size of the analysis pool, defaults to the CPU count
+            max_queue (int): Frames buffered per session before reading from
+                the socket is paused ("fifo" mode only)
+            backend (backends.LandmarkBackend): Backend cloned for every session,
+                created lazily from backend_name if omitted
+            backpressure (str): "fifo" or "latest", see BACKPRESSURE_MODES
+            keyframe_interval (int): Enables face tracking, running the full frame
+                face detector every keyframe_interval frames. 0 detects on every frame
+            backend_name (str): "dlib" or "opencv", see backends.BACKENDS
+            estimator_options (dict): Keyword arguments of every session's AttentionEstimator
+            rate_options (dict): Keyword arguments of the RateController telling the
+                clients their capture rate, None disables rate control
+            batch_size (int): Frames of different sessions analysed together by one
+                worker call, see MicroBatcher. 1 analyses every frame on its own
+            batch_delay (float): Longest time, in seconds, a frame waits for its batch to fill
+            state_dir (str): Directory where the calibration of the sessions opened with
+                a client-chosen id is saved when they close, and restored when they reopen
+        """
+        if backpressure not in BACKPRESSURE_MODES:
+            raise ValueError(f"Unknown backpressure mode: {backpressure}")
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.backpressure = backpressure
+        self.keyframe_interval = keyframe_interval
+        self.backend_name = backend_name
+        self._backend = backend
+        self.estimator_options = estimator_options or {}
+        self.rate_controller = None
+        if rate_options is not None:
+            self.rate_controller = RateController(self.max_workers, **rate_options)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gaze")
+        self.batcher = None
+        if batch_size > 1:
+            self.batcher = MicroBatcher(self._executor, lambda: self.backend.clone(), batch_size, batch_delay)
+        self.calibrations = CalibrationStore(state_dir) if state_dir else None
+        self._sessions = {}
+        self._ids = itertools.count(1)
+
+    @property
+    def backend(self):
+        """Backend holding the shared models, loaded on first use"""
+        if self._backend is None:
+            self._backend = create_backend(self.backend_name)
+        return self._backend
+
+    def open(self, session_id=None):
+        """Creates and registers a new session
+
+        Arguments:
+            session_id (str): Id chosen by the client, which then gets back its
+                calibration from earlier connections. Numbered when omitted.
+        """
+        persistent = session_id is not None and session_id not in self._sessions
+        if session_id is None:
+            session_id = str(next(self._ids))
+        elif not persistent:
+            # A second connection with the same id gets its own, unsaved, session
+            session_id = f"{session_id}#{next(self._ids)}"
+        gaze = GazeTracking(
+            backend=self.backend.clone(),
+            tracking=self.keyframe_interval > 0,
+            keyframe_interval=self.keyframe_interval,
+        )
+        if persistent and self.calibrations is not None:
+            calibration = self.calibrations.load(session_id)
+            # Anything else than a Calibration is ignored, the session calibrates again
+            if isinstance(calibration, type(gaze.calibration)):
+                gaze.calibration = calibration
+        estimator = AttentionEstimator(**self.estimator_options)
+        session = AttentionSession(session_id, gaze, self.max_queue, self.backpressure, estimator)
+        session.persistent = persistent
+        self._sessions[session_id] = session
+        return session
+
+    def save_calibration(self, session):
+        """Saves the calibration of a session opened with a client-chosen id"""
+        if session.persistent and self.calibrations is not None:
+            try:
+                self.calibrations.save(session.session_id, session.gaze.calibration)
+            except OSError as e:
+                print("Could not save the calibration of session", session.session_id, e)
+
+    def save_calibrations(self):
+        """Saves the calibration of every open session, before a restart"""
+        for session in list(self._sessions.values()):
+            self.save_calibration(session)
+
+    def close(self, session):
+        """Forgets a session once its connection is gone"""
+        if self._sessions.get(session.session_id) is session:
+            del self._sessions[session.session_id]
+        self.save_calibration(session)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def analyze(self, session, request):
+        """Decodes and analyses a frame request of the session on the worker pool
+
+        Returns:
+            The FrameMeasurement of the frame, None if it could not be decoded
+        """
+        loop = asyncio.get_running_loop()
+        session.in_flight += 1
+        try:
+            if self.batcher is not None:
+                measurement = await self.batcher.submit(session.gaze, request)
+            else:
+                measurement = await loop.run_in_executor(self._executor, measure_frame, session.gaze, request)
+        finally:
+            session.in_flight -= 1
+        if measurement is not None and self.rate_controller is not None:
+            self.rate_controller.record_analysis(measurement.seconds, measurement.pixels)
+        return measurement
+
+    def rate_update(self, session):
+        """Returns the (fps, width, height) the session should now capture at,
+        or None if rate control is off or the target did not change enough
+        """
+        if self.rate_controller is None:
+            return None
+        target = self.rate_controller.target(len(self._sessions), session.rate.stable_for)
+        return session.rate.update(target)
+
+    def queue_depths(self):
+        """Returns a {session_id: queue depth} mapping of the open sessions"""
+        return {sid: session.queue_depth for sid, session in self._sessions.items()}
+
+    def stats(self):
+        """Returns a {session_id: frame counters} mapping of the open sessions"""
+        return {sid: session.stats() for sid, session in self._sessions.items()}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,287 @@
+# attention_supervisor.py
+# Runs the attention server (example.py) on several processes, so the dlib
+# analysis is no longer bound to a single core:
+#
+#   ATTENTION_PROCESSES=4 python attention_supervisor.py
+#   kill -HUP <supervisor pid>     # graceful rolling restart of the workers
+#
+# The supervisor loads the landmark models once and forks the workers, which
+# share them copy-on-write (gaze_tracking.backends.preload_backend). Each
+# worker listens on 127.0.0.1:ATTENTION_WORKER_BASE_PORT + slot, and a proxy
+# process on the public port (8765) routes every connection to the worker of
+# its ?session=<id>, so a tablet always reaches the same worker. Calibrations
+# are saved in ATTENTION_STATE_DIR, so they also survive worker restarts.
+# Crashed workers are restarted; SIGHUP drains and replaces them one by one.
+import argparse
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import signal
+import time
+import uuid
+from urllib.parse import quote
+
+ATTENTION_PROCESSES = int(os.getenv("ATTENTION_PROCESSES", "0")) or os.cpu_count() or 1
+ATTENTION_WORKER_BASE_PORT = int(os.getenv("ATTENTION_WORKER_BASE_PORT", "8870"))
+# Seconds the proxy keeps retrying a worker that is restarting before giving up on a client
+PROXY_CONNECT_TIMEOUT = float(os.getenv("ATTENTION_PROXY_CONNECT_TIMEOUT", "10"))
+READY_TIMEOUT = 60  # Seconds a new worker has to start listening
+
+# The workers are forked from the supervisor once the models are loaded
+_context = multiprocessing.get_context("fork")
+
+
+def session_slot(session_id, processes):
+    """Worker slot of a session, the same in every process and across restarts"""
+    digest = hashlib.sha1(session_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % processes
+
+
+def _run_worker(slot, port, metrics_port, ready):
+    # Forked child: the models preloaded by the supervisor are already in memory. The
+    # server is only imported here, so its start time, metrics and sessions are its own
+    import example
+    print(f"Worker {slot} (pid {os.getpid()}) on port {port}")
+    asyncio.run(example.serve("127.0.0.1", port, metrics_port, ready))
+
+
+def _run_proxy(host, port, processes, base_port):
+    asyncio.run(serve_proxy(host, port, processes, base_port))
+
+
+async def _connect_worker(port, session_id=None):
+    """Opens the connection to a worker, waiting while it restarts. Returns None on timeout.
+
+    Arguments:
+        port (int): Port of the worker
+        session_id (str): Id chosen by the client, None lets the worker number the session
+    """
+    import websockets
+
+    url = f"ws://127.0.0.1:{port}/"
+    if session_id is not None:
+        url += "?session=" + quote(session_id, safe="")
+    deadline = time.monotonic() + PROXY_CONNECT_TIMEOUT
+    while True:
+        try:
+            return await websockets.connect(url, max_size=None)
+        except (OSError, websockets.InvalidHandshake):
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(0.2)
+
+
+async def _forward(source, target):
+    async for message in source:
+        await target.send(message)
+
+
+async def serve_proxy(host, port, processes, base_port):
+    """Accepts the client connections and relays each one to the worker of its session"""
+    import websockets
+    from attention_session import request_session_id
+
+    async def relay(client, path=None):
+        # Clients without an id are spread over the workers at random. The id is only
+        # used for routing: their sessions are not saved, nothing identifies them later
+        session_id = request_session_id(client, path)
+        slot = session_slot(session_id or uuid.uuid4().hex, processes)
+        worker = await _connect_worker(base_port + slot, session_id)
+        if worker is None:
+            await client.close(1013, "attention worker unavailable")
+            return
+        upstream = asyncio.ensure_future(_forward(client, worker))
+        downstream = asyncio.ensure_future(_forward(worker, client))
+        try:
+            await asyncio.wait([upstream, downstream], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            upstream.cancel()
+            downstream.cancel()
+            # Relays the close of either side, e.g. 1012 when the worker restarts
+            if worker.close_code is not None:
+                await client.close(worker.close_code if worker.close_code != 1006 else 1011,
+                                   "attention worker closed the connection")
+            await worker.close()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+    async with websockets.serve(relay, host, port, max_size=None):
+        print(f"Proxy on ws://{host}:{port}, {processes} worker(s) from port {base_port}")
+        await stopping.wait()
+
+
+class WorkerProcess(object):
+    """A worker process of the supervisor and the slot it serves"""
+
+    def __init__(self, slot, port, metrics_port=0):
+        self.slot = slot
+        self.port = port
+        self.ready = _context.Event()
+        self.process = _context.Process(
+            target=_run_worker, args=(slot, port, metrics_port, self.ready),
+            name=f"attention-worker-{slot}", daemon=False,
+        )
+        self.process.start()
+
+    def wait_ready(self, timeout=READY_TIMEOUT):
+        """Waits until the worker listens, returns False if it died or timed out"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.ready.wait(0.1):
+                return True
+            if not self.process.is_alive():
+                return False
+        return False
+
+    def terminate(self):
+        """Asks the worker to drain, see example.drain"""
+        if self.process.is_alive():
+            os.kill(self.process.pid, signal.SIGTERM)
+
+
+class Supervisor(object):
+    """
+    Starts the proxy and one worker process per slot, restarts the workers that
+    die, and on restart() replaces them one by one: the old worker stops
+    listening and drains while its replacement starts on the same port, and the
+    proxy retries new connections of that slot until the replacement is up.
+    """
+
+    def __init__(self, processes=ATTENTION_PROCESSES, host="0.0.0.0", port=8765,
+                 base_port=ATTENTION_WORKER_BASE_PORT, metrics_port=0, backend_name="dlib"):
+        """
+        Arguments:
+            processes (int): Number of worker processes
+            host (str): Address of the public WebSocket port
+            port (int): Public WebSocket port, served by the proxy
+            base_port (int): Port of the first worker, the others follow
+            metrics_port (int): If set, worker n serves its metrics on metrics_port + n
+            backend_name (str): Landmark backend preloaded before forking
+        """
+        self.processes = processes
+        self.host = host
+        self.port = port
+        self.base_port = base_port
+        self.metrics_port = metrics_port
+        self.backend_name = backend_name
+        self.workers = {}
+        self.draining = []
+        self.proxy = None
+        self._restart_requested = False
+        self._stop_requested = False
+
+    def preload(self):
+        """Loads the models before forking, they are then shared with the workers"""
+        from gaze_tracking.backends import preload_backend
+
+        start = time.perf_counter()
+        preload_backend(self.backend_name)
+        print(f"Models of the {self.backend_name} backend loaded in {time.perf_counter() - start:.2f}s")
+
+    def start_worker(self, slot):
+        metrics_port = self.metrics_port + slot if self.metrics_port else 0
+        worker = WorkerProcess(slot, self.base_port + slot, metrics_port)
+        self.workers[slot] = worker
+        return worker
+
+    def start_proxy(self):
+        self.proxy = _context.Process(
+            target=_run_proxy, args=(self.host, self.port, self.processes, self.base_port),
+            name="attention-proxy",
+        )
+        self.proxy.start()
+
+    def restart(self, slot):
+        """Replaces the worker of a slot, the old one drains its connections"""
+        old = self.workers[slot]
+        old.terminate()
+        self.draining.append(old)
+        worker = self.start_worker(slot)
+        if not worker.wait_ready():
+            print(f"Worker {slot} did not start, it will be retried")
+        return worker
+
+    def rolling_restart(self):
+        print("Rolling restart of the workers")
+        for slot in sorted(self.workers):
+            self.restart(slot)
+
+    def _check(self):
+        for slot, worker in list(self.workers.items()):
+            if not worker.process.is_alive():
+                print(f"Worker {slot} exited with code {worker.process.exitcode}, restarting it")
+                self.start_worker(slot).wait_ready()
+        for worker in list(self.draining):
+            if not worker.process.is_alive():
+                worker.process.join()
+                self.draining.remove(worker)
+        if self.proxy is not None and not self.proxy.is_alive():
+            print(f"Proxy exited with code {self.proxy.exitcode}, restarting it")
+            self.start_proxy()
+
+    def _request_restart(self, signum, frame):
+        self._restart_requested = True
+
+    def _request_stop(self, signum, frame):
+        self._stop_requested = True
+
+    def run(self):
+        """Runs the service until SIGTERM or SIGINT"""
+        self.preload()
+        for slot in range(self.processes):
+            self.start_worker(slot)
+        for slot, worker in self.workers.items():
+            if not worker.wait_ready():
+                print(f"Worker {slot} did not start")
+        self.start_proxy()
+        signal.signal(signal.SIGHUP, self._request_restart)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        print(f"Supervisor {os.getpid()} running {self.processes} worker(s), SIGHUP restarts them")
+        while not self._stop_requested:
+            time.sleep(0.5)
+            if self._restart_requested:
+                self._restart_requested = False
+                self.rolling_restart()
+            self._check()
+        self.stop()
+
+    def stop(self):
+        """Drains every worker and stops the proxy"""
+        print("Stopping the attention service")
+        if self.proxy is not None and self.proxy.is_alive():
+            os.kill(self.proxy.pid, signal.SIGTERM)
+        workers = list(self.workers.values()) + self.draining
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.process.join()
+        if self.proxy is not None:
+            self.proxy.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the attention server on several worker processes")
+    parser.add_argument("--processes", type=int, default=ATTENTION_PROCESSES)
+    parser.add_argument("--host", default=os.getenv("ATTENTION_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("ATTENTION_PORT", "8765")))
+    parser.add_argument("--base-port", type=int, default=ATTENTION_WORKER_BASE_PORT,
+                        help="Port of the first worker, on 127.0.0.1")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("ATTENTION_METRICS_PORT", "0")),
+                        help="Worker n serves its metrics on this port + n")
+    parser.add_argument("--state-dir", default=os.getenv("ATTENTION_STATE_DIR") or ".attention_state",
+                        help="Directory of the saved calibrations, shared by the workers")
+    args = parser.parse_args()
+
+    # Read by example.py when the workers import it
+    os.environ["ATTENTION_STATE_DIR"] = args.state_dir
+    os.environ.setdefault("ATTENTION_WORKERS", str(max((os.cpu_count() or 1) // args.processes, 1)))
+    Supervisor(args.processes, args.host, args.port, args.base_port, args.metrics_port,
+               os.getenv("ATTENTION_BACKEND", "dlib")).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark of the Streamlit reruns of app.py: time per rerun and size of the
+elements sent to the browser, for the interactions of a Dialogue session
+(typing a requirement, changing the task configuration, switching pages).
+
+Run it on the current app and on an older revision to compare, e.g. the
+st.tabs version before the page router:
+
+    git show <revision>:app.py > /tmp/app_before.py
+    python benchmarks/bench_app_rerun.py app.py /tmp/app_before.py --repeat 20
+
+Both run from the repository root with its modules importable. The size is
+the serialised size of the element tree after the rerun, an estimate of what
+a full rerun sends over the websocket.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+def tree_bytes(node):
+    """Serialised size of the protos of an element tree"""
+    total = 0
+    proto = getattr(node, "proto", None)
+    if proto is not None and hasattr(proto, "ByteSize"):
+        total += proto.ByteSize()
+    children = getattr(node, "children", None) or {}
+    for child in children.values():
+        total += tree_bytes(child)
+    return total
+
+
+def interactions(app):
+    """The interactions timed, as (name, callable changing a widget)"""
+    steps = [
+        ("type requirement", lambda: app.text_input[0].input(f"dinosaurs {time.perf_counter()}")),
+        ("change goal", lambda: app.selectbox[0].select_index((app.selectbox[0].index + 1) % 5)),
+    ]
+    if app.radio:
+        # Page router, st.tabs has no equivalent interaction
+        steps.append(("switch page", lambda: app.radio[0].set_value("Mini Game")))
+        steps.append(("back to dialogue", lambda: app.radio[0].set_value("Dialogue")))
+    return steps
+
+
+def measure(path, repeat, timeout):
+    app = AppTest.from_file(os.path.abspath(path), default_timeout=timeout)
+    start = time.perf_counter()
+    app.run()
+    print(f"{path}: first run {(time.perf_counter() - start) * 1000:.0f} ms, {tree_bytes(app._tree) / 1024:.1f} KB")
+    if app.exception:
+        print(f"  exception: {app.exception[0].value}")
+        return
+    for name, interact in interactions(app):
+        times = []
+        sizes = []
+        for _ in range(repeat):
+            interact()
+            start = time.perf_counter()
+            app.run()
+            times.append(time.perf_counter() - start)
+            sizes.append(tree_bytes(app._tree))
+        print(f"  {name:<18} median {statistics.median(times) * 1000:7.1f} ms, "
+              f"{statistics.median(sizes) / 1024:7.1f} KB per rerun")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("apps", nargs="+", help="Streamlit scripts to compare")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    # No static game server, the games would not be part of the measured reruns
+    os.environ.setdefault("GAME_SERVER", "0")
+    for path in args.apps:
+        measure(path, args.repeat, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Load test of the attention WebSocket service: opens hundreds of simulated
+tablet connections, each sending binary frames at the capture rate the
+server asks for, and reports connection times, reply lag, throughput and
+disconnections.
+
+    python attention_supervisor.py --processes 4 &
+    python benchmarks/bench_attention_load.py --clients 300 --duration 60 --ramp 10
+
+Every tablet connects with a stable ?session=<id>, reconnects when the
+server closes its connection (e.g. during a rolling restart, SIGHUP to the
+supervisor) and follows the {"type": "rate"} messages. The frames are a
+synthetic face-sized pattern by default, or the images of --images.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import cv2
+import numpy as np
+import websockets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from frame_transport import ENCODING_GRAY, ENCODING_JPEG, encode_header  # noqa: E402
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+class FrameSource(object):
+    """Grayscale frames of the tablets, resized and encoded once per resolution"""
+
+    def __init__(self, images=None, encoding="jpeg", quality=80):
+        if images:
+            names = sorted(name for name in os.listdir(images) if name.lower().endswith(IMAGE_EXTENSIONS))
+            frames = [cv2.imread(os.path.join(images, name), cv2.IMREAD_GRAYSCALE) for name in names]
+            self.frames = [frame for frame in frames if frame is not None]
+        else:
+            self.frames = [self.synthetic(shift) for shift in range(0, 40, 4)]
+        if not self.frames:
+            raise ValueError(f"No image found in {images}")
+        self.encoding = ENCODING_JPEG if encoding == "jpeg" else ENCODING_GRAY
+        self.quality = quality
+        self._payloads = {}
+
+    @staticmethod
+    def synthetic(shift, width=320, height=240):
+        """A face-like pattern: an oval with two dark eyes, moved by shift pixels"""
+        frame = np.full((height, width), 90, np.uint8)
+        cx, cy = width // 2 + shift - 20, height // 2
+        cv2.ellipse(frame, (cx, cy), (60, 80), 0, 0, 360, 180, -1)
+        for dx in (-25, 25):
+            cv2.ellipse(frame, (cx + dx, cy - 20), (12, 6), 0, 0, 360, 250, -1)
+            cv2.circle(frame, (cx + dx, cy - 20), 4, 20, -1)
+        return frame
+
+    def payloads(self, width, height):
+        key = (width, height)
+        if key not in self._payloads:
+            encoded = []
+            for frame in self.frames:
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                if self.encoding == ENCODING_JPEG:
+                    _, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                    encoded.append(data.tobytes())
+                else:
+                    encoded.append(frame.tobytes())
+            self._payloads[key] = encoded
+        return self._payloads[key]
+
+
+class Stats(object):
+    def __init__(self):
+        self.connect_seconds = []
+        self.lags = []
+        self.sent = 0
+        self.answered = 0
+        self.states = collections.Counter()
+        self.rates = 0
+        self.connected = 0
+        self.failed_connects = 0
+        self.close_codes = collections.Counter()
+
+
+async def tablet(index, args, source, stats, stop_at):
+    """One simulated tablet: connects, streams frames and reconnects until stop_at"""
+    session_id = f"tablet-{index}"
+    url = f"{args.url.rstrip('/')}/?session={session_id}"
+    rng = random.Random(index)
+    fps, width, height = args.fps, args.width, args.height
+    frame_id = 0
+    while time.monotonic() < stop_at:
+        start = time.monotonic()
+        try:
+            websocket = await websockets.connect(url, max_size=None, open_timeout=args.timeout)
+        except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake):
+            stats.failed_connects += 1
+            await asyncio.sleep(1.0 + rng.random())
+            continue
+        stats.connect_seconds.append(time.monotonic() - start)
+        stats.connected += 1
+        sent_at = {}
+
+        async def receive():
+            nonlocal fps, width, height
+            async for message in websocket:
+                reply = json.loads(message)
+                kind = reply.get("type")
+                if kind == "rate":
+                    stats.rates += 1
+                    fps, width, height = reply["fps"], reply["width"], reply["height"]
+                    continue
+                sent = sent_at.pop(reply.get("frame_id"), None)
+                if sent is not None:
+                    stats.lags.append(time.monotonic() - sent)
+                    stats.answered += 1
+                if kind in ("state", "result"):
+                    stats.states[reply.get("status")] += 1
+
+        receiver = asyncio.ensure_future(receive())
+        try:
+            # Tablets do not start in lockstep
+            await asyncio.sleep(rng.random() / max(fps, 0.1))
+            while time.monotonic() < stop_at and not receiver.done():
+                payloads = source.payloads(width, height)
+                frame_id = (frame_id + 1) % 2 ** 32
+                header = encode_header(frame_id, width, height, source.encoding, time.time() * 1000.0)
+                sent_at[frame_id] = time.monotonic()
+                await websocket.send(header + payloads[frame_id % len(payloads)])
+                stats.sent += 1
+                # Frames answered by nothing (dropped by the "latest" backpressure) are forgotten
+                if len(sent_at) > 64:
+                    sent_at.pop(next(iter(sent_at)))
+                await asyncio.sleep(1.0 / max(fps, 0.1))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            receiver.cancel()
+            await websocket.close()
+            stats.close_codes[websocket.close_code] += 1
+            stats.connected -= 1
+
+
+async def run(args):
+    source = FrameSource(args.images, args.encoding)
+    stats = Stats()
+    start = time.monotonic()
+    stop_at = start + args.ramp + args.duration
+
+    async def delayed(index):
+        await asyncio.sleep(args.ramp * index / max(args.clients, 1))
+        await tablet(index, args, source, stats, stop_at)
+
+    tasks = [asyncio.ensure_future(delayed(index)) for index in range(args.clients)]
+    last = (0, 0, start)
+    while time.monotonic() < stop_at:
+        await asyncio.sleep(args.report_interval)
+        now = time.monotonic()
+        sent, answered, then = last
+        print(f"{now - start:6.1f}s  {stats.connected:>5} connected  "
+              f"{(stats.sent - sent) / (now - then):7.1f} frames/s sent  "
+              f"{(stats.answered - answered) / (now - then):7.1f} answered/s  "
+              f"lag p95 {percentile(stats.lags[-2000:], 0.95) * 1000:7.1f} ms")
+        last = (stats.sent, stats.answered, now)
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return stats, time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="ws://localhost:8765")
+    parser.add_argument("--clients", type=int, default=200, help="Simulated tablets")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds at full load")
+    parser.add_argument("--ramp", type=float, default=10.0, help="Seconds over which the tablets connect")
+    parser.add_argument("--fps", type=float, default=2.0, help="Frame rate until the server sets one")
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=240)
+    parser.add_argument("--encoding", choices=("jpeg", "gray"), default="jpeg")
+    parser.add_argument("--images", help="Directory of face images to send instead of the synthetic frames")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Connection timeout")
+    parser.add_argument("--report-interval", type=float, default=5.0)
+    args = parser.parse_args()
+
+    stats, wall = asyncio.run(run(args))
+    print(f"\n{args.clients} tablets, {wall:.1f}s: {stats.sent} frames sent, {stats.answered} answered "
+          f"({stats.answered / max(stats.sent, 1):.0%}), {stats.answered / wall:.1f} answered/s")
+    print(f"Connect p50 {percentile(stats.connect_seconds, 0.5) * 1000:.0f} ms, "
+          f"p95 {percentile(stats.connect_seconds, 0.95) * 1000:.0f} ms, {stats.failed_connects} failed")
+    print(f"Reply lag p50 {percentile(stats.lags, 0.5) * 1000:.1f} ms, p95 {percentile(stats.lags, 0.95) * 1000:.1f} ms, "
+          f"p99 {percentile(stats.lags, 0.99) * 1000:.1f} ms")
+    print(f"Rate changes {stats.rates}, statuses {dict(stats.states)}, close codes {dict(stats.close_codes)}")
+
+
+if __name__ == "__main__":
+    main()
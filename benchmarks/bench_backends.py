@@ -0,0 +1,110 @@
+"""
+Compares the landmark backends of GazeTracking on a recorded clip.
+
+For every backend, each frame goes through face detection and landmark
+prediction and the latency of both steps is recorded. Accuracy is measured
+on the 12 eye points against a reference backend (dlib by default), as the
+mean point error normalised by the inter-ocular distance (NME).
+
+    python benchmarks/bench_backends.py clip.mp4 --backends dlib opencv --max-frames 500
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gaze_tracking.backends import BACKENDS, create_backend  # noqa: E402
+from gaze_tracking.landmarks import EYE_POINTS  # noqa: E402
+
+
+def read_frames(path, max_frames, width=None):
+    """Reads the grayscale frames of a video, optionally resized to width"""
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        if width and frame.shape[1] != width:
+            scale = width / float(frame.shape[1])
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    capture.release()
+    return frames
+
+
+def run_backend(backend, frames):
+    """Returns the detection and prediction latencies and the landmarks of each frame"""
+    detect_times, predict_times, landmarks = [], [], []
+    for frame in frames:
+        start = time.perf_counter()
+        faces = backend.detect(frame)
+        detect_times.append(time.perf_counter() - start)
+        if not faces:
+            landmarks.append(None)
+            continue
+        start = time.perf_counter()
+        landmarks.append(backend.predict(frame, faces[0]))
+        predict_times.append(time.perf_counter() - start)
+    return np.array(detect_times), np.array(predict_times), landmarks
+
+
+def eye_nme(points, reference):
+    """Mean eye point error normalised by the inter-ocular distance of the reference"""
+    eyes = points[EYE_POINTS].astype(float)
+    reference_eyes = reference[EYE_POINTS].astype(float)
+    interocular = np.linalg.norm(reference_eyes[0].mean(axis=0) - reference_eyes[1].mean(axis=0))
+    return np.linalg.norm(eyes - reference_eyes, axis=-1).mean() / max(interocular, 1.0)
+
+
+def percentiles(values):
+    if len(values) == 0:
+        return "      n/a"
+    p50, p95 = np.percentile(values, [50, 95]) * 1000
+    return f"{p50:6.2f} / {p95:6.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video", help="Recorded clip, any format readable by cv2.VideoCapture")
+    parser.add_argument("--backends", nargs="+", default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    parser.add_argument("--reference", default="dlib", choices=sorted(BACKENDS),
+                        help="Backend the accuracy is measured against")
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=None, help="Resize frames to this width")
+    args = parser.parse_args()
+
+    frames = read_frames(args.video, args.max_frames, args.width)
+    if not frames:
+        sys.exit(f"No frame could be read from {args.video}")
+    height, width = frames[0].shape
+    print(f"{len(frames)} frames of {width}x{height} from {args.video}\n")
+
+    names = [args.reference] + [name for name in args.backends if name != args.reference]
+    results = {}
+    for name in names:
+        start = time.perf_counter()
+        backend = create_backend(name)
+        load_time = time.perf_counter() - start
+        results[name] = (load_time,) + run_backend(backend, frames)
+
+    reference = results[args.reference][3]
+    print(f"{'backend':>8} {'load (s)':>9} {'detect p50/p95 (ms)':>20} {'predict p50/p95 (ms)':>21} "
+          f"{'faces':>6} {'eye NME':>8}")
+    for name in names:
+        load_time, detect_times, predict_times, landmarks = results[name]
+        errors = [eye_nme(points, ref) for points, ref in zip(landmarks, reference)
+                  if points is not None and ref is not None]
+        found = sum(points is not None for points in landmarks) / float(len(frames))
+        nme = f"{np.mean(errors):8.4f}" if errors and name != args.reference else "     ref"
+        print(f"{name:>8} {load_time:9.2f} {percentiles(detect_times):>20} {percentiles(predict_times):>21} "
+              f"{found:6.0%} {nme}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Fuzz test and benchmark of extract_html: the previous regex implementation
+against the single-pass HtmlStreamExtractor.
+
+The fuzz test builds random responses from the tokens the extraction looks
+for (in random case, split across random chunk boundaries) and checks that
+both give the same result, i.e. the same fallback order. The benchmark times
+both on multi-hundred-KB responses, complete and streamed.
+
+    python benchmarks/bench_extract_html.py --fuzz 20000 --size 400
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from action_agent import HtmlStreamExtractor, extract_html  # noqa: E402
+
+
+def legacy_extract_html(text):
+    """extract_html before HtmlStreamExtractor, kept as the reference"""
+    match = re.search(r'<!DOCTYPE html>[\s\S]*?</html>', text, re.IGNORECASE)
+    if match:
+        return match.group(0)
+    match = re.search(r'<html[\s\S]*?</html>', text, re.IGNORECASE)
+    if match:
+        return match.group(0)
+    match = re.search(r'```html\s*([\s\S]*?)```', text, re.IGNORECASE)
+    if match:
+        return match.group(1).strip()
+    match = re.search(r'```\s*([\s\S]*?)```', text, re.IGNORECASE)
+    if match:
+        code_content = match.group(1).strip()
+        if re.search(r'<[^>]+>', code_content):
+            return code_content
+    if re.search(r'<[^>]+>', text):
+        return text
+    return None
+
+
+FUZZ_TOKENS = [
+    "<!DOCTYPE html>", "<html", "<html lang=\"en\">", "</html>", "```html", "```", "`", "``",
+    "<", ">", "<>", "<b>", "<!DOCTYPE  html>", " ", "\n", "\t", " ", "game", "İ", "K",
+]
+
+
+def random_case(token, rng):
+    return "".join(c.upper() if rng.random() < 0.5 else c for c in token)
+
+
+def random_chunks(text, rng):
+    chunks = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 20)
+        chunks.append(text[position:position + size])
+        position += size
+    return chunks
+
+
+def fuzz(iterations, seed=0):
+    rng = random.Random(seed)
+    for iteration in range(iterations):
+        text = "".join(random_case(rng.choice(FUZZ_TOKENS), rng) for _ in range(rng.randint(0, 30)))
+        expected = legacy_extract_html(text)
+        if extract_html(text) != expected:
+            raise AssertionError(f"extract_html differs on {text!r}")
+        extractor = HtmlStreamExtractor()
+        early = None
+        for chunk in random_chunks(text, rng):
+            early = extractor.feed(chunk) or early
+        if extractor.finish() != expected:
+            raise AssertionError(f"streamed extraction differs on {text!r}")
+        if early is not None and early != expected:
+            raise AssertionError(f"early document differs on {text!r}")
+    print(f"Fuzz: {iterations} random responses, same results as the regex extraction")
+
+
+def responses(size):
+    """Synthetic model responses of about size characters"""
+    body = "<div class=\"cell\">tile</div>\n" * (size // 30)
+    return {
+        "document": "Here is your game:\n<!DOCTYPE html>\n<html><body>" + body + "</body></html>\nEnjoy!",
+        "fenced": "```html\n<div>" + body + "</div>\n```",
+        "unclosed": "<!DOCTYPE html>\n<html><body>" + body,
+        "many opens": "<html " * (size // 6),
+        "plain text": "no markup here " * (size // 15),
+    }
+
+
+def benchmark(size, repeat):
+    print(f"{'response':<12} {'KB':>6} {'regex ms':>10} {'single pass ms':>15} {'streamed ms':>12}")
+    for name, text in responses(size).items():
+        if name == "many opens":
+            # The lazy scans of the regex extraction are quadratic here, keep it short
+            text = text[:size // 20]
+        assert legacy_extract_html(text) == extract_html(text)
+        chunks = random_chunks(text, random.Random(0))
+
+        def streamed():
+            extractor = HtmlStreamExtractor()
+            for chunk in chunks:
+                extractor.feed(chunk)
+            return extractor.finish()
+
+        regex = min(timeit.repeat(lambda: legacy_extract_html(text), number=1, repeat=repeat))
+        single = min(timeit.repeat(lambda: extract_html(text), number=1, repeat=repeat))
+        stream = min(timeit.repeat(streamed, number=1, repeat=repeat))
+        print(f"{name:<12} {len(text) / 1024:>6.0f} {regex * 1000:>10.2f} {single * 1000:>15.2f} {stream * 1000:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fuzz", type=int, default=20000, help="Random responses checked")
+    parser.add_argument("--size", type=int, default=400, help="Size of the benchmark responses, in KB")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fuzz(args.fuzz)
+    benchmark(args.size * 1024, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark of Eye._isolate: the previous full frame masking against the
+current crop-first masking, on synthetic frames from 320x240 to 1080p.
+Both paths are also checked to give pixel-identical eye frames.
+
+    python benchmarks/bench_eye_isolate.py --repeat 2000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gaze_tracking.eye import Eye  # noqa: E402
+from gaze_tracking.landmarks import as_landmark_array, eye_geometry  # noqa: E402
+
+RESOLUTIONS = [(320, 240), (640, 480), (1280, 720), (1920, 1080)]
+
+
+class _Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class FakeLandmarks(object):
+    """Minimal stand-in for dlib.full_object_detection"""
+
+    def __init__(self, points):
+        self._points = [_Point(0, 0)] * 68
+        for index, (x, y) in points.items():
+            self._points[index] = _Point(int(x), int(y))
+
+    def part(self, index):
+        return self._points[index]
+
+    def parts(self):
+        return self._points
+
+
+def eye_landmarks(center_x, center_y, eye_width):
+    """Builds the 6 points of each eye around a face center"""
+    points = {}
+    half = eye_width / 2
+    for first, dx in ((36, -eye_width), (42, eye_width)):
+        cx = center_x + dx
+        outline = [(-half, 0), (-half / 3, -half / 3), (half / 3, -half / 3),
+                   (half, 0), (half / 3, half / 3), (-half / 3, half / 3)]
+        for offset, (x, y) in enumerate(outline):
+            points[first + offset] = (cx + x, center_y + y)
+    return FakeLandmarks(points)
+
+
+def isolate_full_frame(frame, landmarks, points):
+    """Eye._isolate as it was before the crop-first masking"""
+    region = np.array([(landmarks.part(point).x, landmarks.part(point).y) for point in points])
+    region = region.astype(np.int32)
+    eye = Eye._mask_full_frame(frame, region)
+    margin = 5
+    min_x = np.min(region[:, 0]) - margin
+    max_x = np.max(region[:, 0]) + margin
+    min_y = np.min(region[:, 1]) - margin
+    max_y = np.max(region[:, 1]) + margin
+    return eye[min_y:max_y, min_x:max_x]
+
+
+def isolate_crop(frame, landmarks, points, geometry=None):
+    """Eye._isolate with the eye geometry computed once per frame"""
+    side = 0 if points == Eye.LEFT_EYE_POINTS else 1
+    if geometry is None:
+        geometry = eye_geometry(as_landmark_array(landmarks))
+    eye = Eye.__new__(Eye)
+    eye._isolate(frame, geometry.regions[side], geometry.bounds[side])
+    return eye.frame
+
+
+def check_identical(rng):
+    """Compares both paths on random frames, including eyes on the frame borders"""
+    for width, height in RESOLUTIONS:
+        frame = rng.integers(0, 256, (height, width), dtype=np.uint8)
+        eye_width = max(width // 16, 12)
+        centers = [(width // 2, height // 2), (eye_width, eye_width // 2),
+                   (width - eye_width, height - 3), (2, 2)]
+        for center_x, center_y in centers:
+            landmarks = eye_landmarks(center_x, center_y, eye_width)
+            for points in (Eye.LEFT_EYE_POINTS, Eye.RIGHT_EYE_POINTS):
+                expected = isolate_full_frame(frame, landmarks, points)
+                actual = isolate_crop(frame, landmarks, points)
+                if expected.shape != actual.shape or not np.array_equal(expected, actual):
+                    raise AssertionError(f"Mismatch at {width}x{height}, center {(center_x, center_y)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=1000, help="Calls per measurement")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    check_identical(rng)
+    print("Pixel-identical on all resolutions and border cases")
+    print(f"OpenCV {cv2.__version__}, {args.repeat} calls per eye\n")
+
+    print(f"{'resolution':>11} {'full frame (us)':>16} {'crop (us)':>10} {'speedup':>8}")
+    for width, height in RESOLUTIONS:
+        frame = rng.integers(0, 256, (height, width), dtype=np.uint8)
+        landmarks = eye_landmarks(width // 2, height // 2, max(width // 16, 12))
+        points = Eye.LEFT_EYE_POINTS
+        geometry = eye_geometry(as_landmark_array(landmarks))
+        old = min(timeit.repeat(lambda: isolate_full_frame(frame, landmarks, points),
+                                number=args.repeat, repeat=3)) / args.repeat
+        new = min(timeit.repeat(lambda: isolate_crop(frame, landmarks, points, geometry),
+                                number=args.repeat, repeat=3)) / args.repeat
+        print(f"{width:>5}x{height:<5} {old * 1e6:>16.1f} {new * 1e6:>10.1f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
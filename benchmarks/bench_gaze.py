@@ -0,0 +1,180 @@
+"""
+Benchmark of GazeTracking.refresh() over a recorded video or a directory of
+images, with the latency of every stage of the analysis (grayscale
+conversion, face detection, landmark prediction, eye geometry, eye
+isolation, calibration, pupil detection), frames per second per core and
+memory use.
+
+    python benchmarks/bench_gaze.py clip.mp4 --width 320 --backend opencv --tracking
+    python benchmarks/bench_gaze.py frames/ --gray --max-frames 500 --histograms
+    python benchmarks/bench_gaze.py clip.mp4 --width 320 --backend opencv --batch 8
+
+Frames are decoded and resized before the timed loop, so only the gaze
+pipeline is measured. --gray passes grayscale frames, like the binary
+transport of the attention server does. --batch N analyses the frames as N
+sessions through gaze_tracking.batch.BatchGazeTracking, N frames per call.
+"""
+
+import argparse
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gaze_tracking import GazeTracking  # noqa: E402
+from gaze_tracking.backends import BACKENDS, create_backend  # noqa: E402
+from gaze_tracking.batch import BatchGazeTracking  # noqa: E402
+from gaze_tracking.stage_timer import StageTimer  # noqa: E402
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def resize(frame, width, height):
+    if not width and not height:
+        return frame
+    frame_height, frame_width = frame.shape[:2]
+    width = width or int(round(frame_width * height / float(frame_height)))
+    height = height or int(round(frame_height * width / float(frame_width)))
+    if (width, height) == (frame_width, frame_height):
+        return frame
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def read_frames(source, max_frames, width=None, height=None, gray=False):
+    """Reads the frames of a video file or of the images of a directory"""
+    if os.path.isdir(source):
+        names = sorted(name for name in os.listdir(source) if name.lower().endswith(IMAGE_EXTENSIONS))
+        images = (cv2.imread(os.path.join(source, name)) for name in names[:max_frames])
+    else:
+        capture = cv2.VideoCapture(source)
+
+        def video():
+            while True:
+                ok, image = capture.read()
+                if not ok:
+                    return
+                yield image
+
+        images = video()
+    frames = []
+    for image in images:
+        if image is None:
+            continue
+        frame = resize(image, width, height)
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if gray else frame)
+        if len(frames) >= max_frames:
+            break
+    return frames
+
+
+def print_histogram(timer, name, width=40):
+    counts, edges = timer.histogram(name)
+    if counts.size == 0:
+        return
+    print(f"\n{name}")
+    scale = width / float(counts.max())
+    for count, low, high in zip(counts, edges[:-1], edges[1:]):
+        print(f"  {low * 1000:8.3f} - {high * 1000:8.3f} ms {'#' * int(round(count * scale)):<{width}} {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Video file readable by cv2.VideoCapture, or a directory of images")
+    parser.add_argument("--backend", default="dlib", choices=sorted(BACKENDS))
+    parser.add_argument("--width", type=int, default=None, help="Resize the frames to this width")
+    parser.add_argument("--height", type=int, default=None, help="Resize the frames to this height")
+    parser.add_argument("--gray", action="store_true", help="Pass grayscale frames")
+    parser.add_argument("--tracking", action="store_true", help="Track the face between keyframes")
+    parser.add_argument("--keyframe-interval", type=int, default=10)
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the frames")
+    parser.add_argument("--warmup", type=int, default=5, help="Frames analysed before timing")
+    parser.add_argument("--batch", type=int, default=1,
+                        help="Analyse the frames as this many sessions, one batch per call")
+    parser.add_argument("--histograms", action="store_true", help="Print the latency histogram of each stage")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Also trace the Python allocations (slows the pipeline down)")
+    args = parser.parse_args()
+
+    frames = read_frames(args.source, args.max_frames, args.width, args.height, args.gray)
+    if not frames:
+        sys.exit(f"No frame could be read from {args.source}")
+    height, width = frames[0].shape[:2]
+    print(f"{len(frames)} frames of {width}x{height} ({'gray' if args.gray else 'BGR'}) from {args.source}, "
+          f"backend {args.backend}, tracking {'every ' + str(args.keyframe_interval) if args.tracking else 'off'}")
+
+    start = time.perf_counter()
+    backend = create_backend(args.backend)
+    timer = StageTimer()
+    if args.batch > 1:
+        batch = BatchGazeTracking(backend=backend, tracking=args.tracking,
+                                  keyframe_interval=args.keyframe_interval, timer=timer)
+        sessions = [f"session{i}" for i in range(args.batch)]
+
+        def analyse(chunk):
+            results = batch.refresh(list(zip(sessions, chunk)))
+            return sum(result.horizontal_ratio is not None for result in results.values())
+    else:
+        gaze = GazeTracking(backend=backend, tracking=args.tracking, keyframe_interval=args.keyframe_interval,
+                            timer=timer)
+
+        def analyse(chunk):
+            gaze.refresh(chunk[0])
+            return int(gaze.pupils_located)
+    chunks = [frames[i:i + args.batch] for i in range(0, len(frames), args.batch)]
+    for chunk in chunks[:max(args.warmup // args.batch, 1)]:
+        analyse(chunk)
+    print(f"Model load and warm-up: {time.perf_counter() - start:.2f}s")
+    timer.reset()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    found = 0
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(args.repeat):
+        for chunk in chunks:
+            start = time.perf_counter()
+            found += analyse(chunk)
+            # Per frame, a batch's time is shared between its frames
+            seconds = (time.perf_counter() - start) / len(chunk)
+            for _ in chunk:
+                timer.record("refresh", seconds)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    analysed = len(frames) * args.repeat
+
+    summary = timer.summary()
+    print(f"\n{'stage':<14} {'count':>6} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'% refresh':>9}")
+    refresh_total = summary["refresh"]["mean"] * summary["refresh"]["count"]
+    for name, stats in sorted(summary.items(), key=lambda item: -item[1]["mean"] * item[1]["count"]):
+        share = stats["mean"] * stats["count"] / refresh_total
+        print(f"{name:<14} {stats['count']:>6} {stats['mean'] * 1000:>8.3f} {stats['p50'] * 1000:>8.3f} "
+              f"{stats['p95'] * 1000:>8.3f} {stats['p99'] * 1000:>8.3f} {stats['max'] * 1000:>8.3f} {share:>9.1%}")
+
+    print(f"\n{analysed} frames in {wall:.2f}s: {analysed / wall:.1f} fps, "
+          f"{analysed / max(cpu, 1e-9):.1f} fps per core ({cpu / wall:.2f} cores busy), "
+          f"pupils found on {found / float(analysed):.0%}")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    unit = 1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0
+    frames_mb = sum(frame.nbytes for frame in frames) / 1048576.0
+    print(f"Peak RSS {rss / unit:.0f} MB (+{(rss - rss_before) / unit:.1f} MB while timing), "
+          f"decoded frames {frames_mb:.0f} MB")
+    if args.tracemalloc:
+        current, peak = tracemalloc.get_traced_memory()
+        print(f"Python allocations: {current / 1048576.0:.2f} MB live, {peak / 1048576.0:.2f} MB peak")
+
+    if args.histograms:
+        for name in summary:
+            print_histogram(timer, name)
+
+
+if __name__ == "__main__":
+    main()
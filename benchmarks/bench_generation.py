@@ -0,0 +1,115 @@
+"""
+End-to-end benchmark of game generation: N concurrent users each send
+requests through the full perception -> decision -> action -> extract_html
+pipeline (agent_pipeline.run_pipeline, with post-processing), and the p50,
+p95 and p99 latencies, time to first token and throughput are reported.
+
+By default the requests go to an in-process mock_llm_server, so the
+benchmark runs offline and in CI; --base-url points it at a real endpoint.
+
+    python benchmarks/bench_generation.py --users 1 4 16 --requests 5 --tokens-per-second 100
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+import mock_llm_server  # noqa: E402
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+async def run_users(users, requests, prompt, candidates):
+    """Runs `users` concurrent users sending `requests` requests each
+
+    Returns:
+        (latencies, first token latencies, failures, rejected games, wall seconds)
+    """
+    from agent_pipeline import run_pipeline
+
+    latencies = []
+    first_tokens = []
+    failures = []
+    rejected = [0]
+
+    async def user():
+        for _ in range(requests):
+            start = time.perf_counter()
+            try:
+                result = await run_pipeline(prompt, candidates=candidates)
+            except Exception as error:
+                failures.append(repr(error))
+                continue
+            latencies.append(time.perf_counter() - start)
+            if result.first_token_seconds is not None:
+                first_tokens.append(result.first_token_seconds)
+            if not (result.processed and result.processed.accepted):
+                rejected[0] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[user() for _ in range(users)])
+    return latencies, first_tokens, failures, rejected[0], time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 16], help="Concurrent users, one run each")
+    parser.add_argument("--requests", type=int, default=5, help="Requests per user")
+    parser.add_argument("--candidates", type=int, default=1, help="Concurrent candidates per request")
+    parser.add_argument("--base-url", help="Real OpenAI-compatible endpoint instead of the mock")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--latency-distribution", choices=mock_llm_server.LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--game-size", type=int, default=8000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        options = mock_llm_server.MockOptions(
+            args.tokens_per_second, args.latency, args.latency_distribution, failure_rate=args.failure_rate,
+            disconnect_rate=args.disconnect_rate, game_size=args.game_size, seed=args.seed,
+        )
+        _, base_url = mock_llm_server.start_background(options=options)
+        os.environ.setdefault("OPENAI_API_KEY", "mock")
+    # The agent modules read the endpoint when they are imported
+    os.environ["OPENAI_API_BASE"] = base_url
+    import task_config
+    from agent_registry import registry
+
+    prompt = task_config.full_prompt(
+        next(iter(task_config.WHAT_OPTIONS)), next(iter(task_config.HOW_OPTIONS)),
+        next(iter(task_config.LEVEL_OPTIONS)), "I want a game about dinosaurs",
+    )
+    print(f"Endpoint {base_url}, {args.requests} requests per user, {args.candidates} candidate(s) per request")
+    print(f"{'users':>5} {'ok':>5} {'failed':>6} {'rejected':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+          f"{'ttft p50':>9} {'req/s':>7}")
+    for users in args.users:
+        # On the agents' background loop, like the app: the pooled connections belong to it
+        latencies, first_tokens, failures, rejected, wall = registry.run(
+            run_users(users, args.requests, prompt, args.candidates)
+        ).result()
+        print(f"{users:>5} {len(latencies):>5} {len(failures):>6} {rejected:>8} "
+              f"{percentile(latencies, 0.5):>7.2f} {percentile(latencies, 0.95):>7.2f} "
+              f"{percentile(latencies, 0.99):>7.2f} {percentile(first_tokens, 0.5):>9.2f} "
+              f"{len(latencies) / wall:>7.2f}")
+        for failure in sorted(set(failures))[:3]:
+            print(f"      {failure}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,19 @@ from dotenv import load_dotenv
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 base_url = os.getenv("OPENAI_API_BASE")
+MODEL = "moonshot-v1-8k"
+TEMPERATURE = 0.7
 
-def build_decision_agent():
+def build_decision_agent(model=MODEL, temperature=TEMPERATURE, base_url=base_url, http_client=None,
+                         http_async_client=None):
     llm = ChatOpenAI(
         openai_api_key=api_key,
         base_url=base_url,
-        model="moonshot-v1-8k",
-        temperature=0.7
+        model=model,
+        temperature=temperature,
+        # Shared keep-alive HTTP clients, see agent_registry.py
+        http_client=http_client,
+        http_async_client=http_async_client,
     )
     prompt = PromptTemplate(
         input_variables=["type"],
@@ -3,60 +3,270 @@ Demonstration of the GazeTracking library.
 Check the README.md for complete documentation.
 """
 
+import time
+STARTED_AT = time.perf_counter()
+
 import asyncio
+import errno
+import signal
 import websockets
-import base64
-import cv2
-import numpy as np
 import json
-from gaze_tracking import GazeTracking
+import attention_metrics as metrics
+from attention_session import SessionManager, request_session_id
+from frame_transport import parse_message
 import os
 print("Current working directory:", os.getcwd())
 import gaze_tracking
+from gaze_tracking import registry
 print("Model file exists:", os.path.exists(
     os.path.join(os.path.dirname(gaze_tracking.__file__), "trained_models", "shape_predictor_68_face_landmarks.dat")
 ))
 
-# Initialize GazeTracking
-gaze = GazeTracking()
-HORIZONTAL_THRESHOLD = 0.2  # Distance from center 0.5 exceeding 0.2 is considered distracted
+# One GazeTracking per client, analysed on a bounded worker pool.
+# ATTENTION_BACKPRESSURE=latest drops stale frames and always analyses the newest one.
+# Frames arrive either as binary messages or as legacy JSON data URLs, see frame_transport.py
+ATTENTION_WORKERS = int(os.getenv("ATTENTION_WORKERS", "0")) or None
+ATTENTION_BACKPRESSURE = os.getenv("ATTENTION_BACKPRESSURE", "latest")
+# Full frame face detection every N frames, the face is tracked in between (0 disables tracking)
+ATTENTION_KEYFRAME_INTERVAL = int(os.getenv("ATTENTION_KEYFRAME_INTERVAL", "10"))
+# Face detection and landmark backend, "dlib" or "opencv" (see gaze_tracking/backends.py)
+ATTENTION_BACKEND = os.getenv("ATTENTION_BACKEND", "dlib")
+# "transitions" only sends the attention status when it changes (plus small frame acks),
+# "every" sends the smoothed status for every analysed frame
+ATTENTION_EMIT = os.getenv("ATTENTION_EMIT", "transitions")
+# Smoothing of the attention estimator, "median" or "ema" over the last ATTENTION_WINDOW frames
+ATTENTION_SMOOTHING = os.getenv("ATTENTION_SMOOTHING", "median")
+ATTENTION_WINDOW = int(os.getenv("ATTENTION_WINDOW", "10"))
+# Server-driven capture rate: clients are told their fps and resolution between these bounds
+# from the server load and how stable their attention is (ATTENTION_RATE_CONTROL=0 disables)
+ATTENTION_RATE_CONTROL = os.getenv("ATTENTION_RATE_CONTROL", "1") == "1"
+ATTENTION_MIN_FPS = float(os.getenv("ATTENTION_MIN_FPS", "1"))
+ATTENTION_MAX_FPS = float(os.getenv("ATTENTION_MAX_FPS", "8"))
+# Micro-batching: frames of up to ATTENTION_BATCH_SIZE sessions are analysed by one worker
+# call, a frame waits at most ATTENTION_BATCH_DELAY_MS for its batch (1 analyses frames alone)
+ATTENTION_BATCH_SIZE = int(os.getenv("ATTENTION_BATCH_SIZE", "1"))
+ATTENTION_BATCH_DELAY_MS = float(os.getenv("ATTENTION_BATCH_DELAY_MS", "5"))
+QUEUE_REPORT_INTERVAL = 10  # Seconds between two queue depth reports
+ATTENTION_HOST = os.getenv("ATTENTION_HOST", "0.0.0.0")
+ATTENTION_PORT = int(os.getenv("ATTENTION_PORT", "8765"))
+# Clients connecting with ws://host:8765/?session=<id> get back the calibration of their
+# previous connections, saved in ATTENTION_STATE_DIR (empty disables it)
+ATTENTION_STATE_DIR = os.getenv("ATTENTION_STATE_DIR", "")
+# On SIGTERM the server stops accepting connections, lets the open ones run for up to
+# ATTENTION_DRAIN_SECONDS, then saves their calibration and closes them (code 1012)
+ATTENTION_DRAIN_SECONDS = float(os.getenv("ATTENTION_DRAIN_SECONDS", "10"))
+# Prometheus metrics and sampling profiler endpoint (attention_metrics.py), 0 disables it.
+# ATTENTION_PROFILE=1 starts the profiler with the server, otherwise it is started at runtime
+ATTENTION_METRICS_HOST = os.getenv("ATTENTION_METRICS_HOST", "127.0.0.1")
+ATTENTION_METRICS_PORT = int(os.getenv("ATTENTION_METRICS_PORT", "0"))
+ATTENTION_PROFILE = os.getenv("ATTENTION_PROFILE", "0") == "1"
+manager = SessionManager(
+    max_workers=ATTENTION_WORKERS,
+    backpressure=ATTENTION_BACKPRESSURE,
+    keyframe_interval=ATTENTION_KEYFRAME_INTERVAL,
+    backend_name=ATTENTION_BACKEND,
+    estimator_options={"window": ATTENTION_WINDOW, "smoothing": ATTENTION_SMOOTHING},
+    rate_options={"min_fps": ATTENTION_MIN_FPS, "max_fps": ATTENTION_MAX_FPS}
+    if ATTENTION_RATE_CONTROL else None,
+    batch_size=ATTENTION_BATCH_SIZE,
+    batch_delay=ATTENTION_BATCH_DELAY_MS / 1000.0,
+    state_dir=ATTENTION_STATE_DIR or None,
+)
+connections = set()  # Open client connections, closed when the server drains
+metrics.registry.gauge("sessions", "Open client sessions", function=lambda: len(manager))
+metrics.registry.gauge("queue_depth", "Frames waiting for analysis per session", ["session"],
+                       function=lambda: {(sid,): depth for sid, depth in manager.queue_depths().items()})
+metrics.registry.gauge("batch_size_mean", "Mean frames per analysis batch",
+                       function=lambda: manager.batcher.mean_batch if manager.batcher else 1.0)
+metrics.registry.gauge("session_lag_seconds", "Lag of the last reply per session", ["session"],
+                       function=lambda: {(sid,): stats["lag_ms"] / 1000.0 for sid, stats in manager.stats().items()})
 
-async def process(websocket, path):
-    print(f"Client connected to path: {path}")
-    print("Client connected")
-    async for message in websocket:
+
+def build_reply(session, request, transition):
+    """Builds the answer to a frame, or None if nothing has to be sent.
+
+    With ATTENTION_EMIT=transitions the status and session frame counters are
+    only sent when the attention state changes; other frames only get a small
+    frame-id ack, and only if the client numbers its frames to throttle itself.
+    """
+    if ATTENTION_EMIT == "transitions" and transition is None:
+        if not request.wants_ack:
+            return None
+        return {"type": "ack", "frame_id": request.frame_id}
+    reply = {"type": "state" if transition else "result", "frame_id": request.frame_id,
+             "status": session.estimator.state}
+    if request.client_ts is not None:
+        reply["ts"] = request.client_ts  # Echoed so the client can measure end-to-end lag
+    reply.update(session.stats())
+    return reply
+
+
+async def send(websocket, message):
+    """Sends a reply, timing websocket.send()"""
+    start = time.perf_counter()
+    await websocket.send(json.dumps(message))
+    metrics.send_seconds.observe(time.perf_counter() - start)
+    metrics.messages_sent.labels(message["type"]).inc()
+
+
+def record_measurement(measurement):
+    """Updates the decode and analysis metrics of an analysed frame"""
+    if measurement is None:
+        metrics.frames_invalid.inc()
+        return
+    metrics.decode_seconds.observe(measurement.decode_seconds)
+    metrics.refresh_seconds.observe(measurement.seconds - measurement.decode_seconds)
+    outcome = "no_face" if measurement.horizontal_ratio is None else "face"
+    metrics.frames_analysed.labels(outcome).inc()
+
+
+async def analyze_frames(websocket, session):
+    """Consumes the session queue and answers each analysed frame"""
+    while True:
+        request = await session.queue.get()
         try:
-            data = json.loads(message)
-            img_b64 = data.get('image')
-            if not img_b64:
-                continue
-            # Remove base64 header
-            if ',' in img_b64:
-                img_b64 = img_b64.split(',')[1]
-            img_bytes = base64.b64decode(img_b64)
-            np_arr = np.frombuffer(img_bytes, np.uint8)
-            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-            if frame is None:
-                continue
-            # GazeTracking analysis
-            gaze.refresh(frame)
-            # Determine if focused
-            status = "focused"
-            hr = gaze.horizontal_ratio()
-            if hr is not None and abs(hr - 0.5) > HORIZONTAL_THRESHOLD:
-                status = "distracted"
-            if gaze.is_blinking():
-                status = "distracted"
-            # Return status
-            await websocket.send(json.dumps({"status": status}))
+            # GazeTracking analysis, off the event loop
+            measurement = await manager.analyze(session, request)
+            record_measurement(measurement)
+            session.record_processed(request)
+            metrics.lag_seconds.observe(session.last_lag)
+            # Smoothed, debounced attention state
+            transition = None
+            if measurement is not None:
+                start = time.perf_counter()
+                transition = session.estimator.update(measurement.horizontal_ratio, measurement.blinking)
+                metrics.status_seconds.observe(time.perf_counter() - start)
+                metrics.status_total.labels(session.estimator.state).inc()
+            if transition is not None:
+                metrics.transitions_total.inc()
+                session.rate.state_changed()
+            reply = build_reply(session, request, transition)
+            if reply is not None:
+                await send(websocket, reply)
+            # Capture rate the client should switch to, if it changed
+            rate = manager.rate_update(session)
+            if rate is not None:
+                fps, width, height = rate
+                await send(websocket, {"type": "rate", "fps": fps, "width": width, "height": height})
+        except websockets.ConnectionClosed:
+            return
         except Exception as e:
+            metrics.frames_invalid.inc()
             print("Error processing frame:", e)
-            continue
+
+
+async def process(websocket, path=None):
+    session = manager.open(request_session_id(websocket, path))
+    connections.add(websocket)
+    metrics.connections.inc()
+    print(f"Client connected to path: {path}")
+    print("Client connected, session", session.session_id)
+    consumer = asyncio.ensure_future(analyze_frames(websocket, session))
+    try:
+        async for message in websocket:
+            metrics.frames_received.labels("json" if isinstance(message, str) else "binary").inc()
+            start = time.perf_counter()
+            try:
+                request = parse_message(message)
+            except Exception as e:
+                metrics.frames_invalid.inc()
+                print("Error parsing frame:", e)
+                continue
+            metrics.parse_seconds.observe(time.perf_counter() - start)
+            if request is None:
+                continue
+            # "fifo" blocks reading from this socket while the queue is full,
+            # "latest" replaces the pending frame
+            dropped = session.dropped
+            await session.put(request)
+            if session.dropped != dropped:
+                metrics.frames_dropped.inc(session.dropped - dropped)
+    except websockets.ConnectionClosed:
+        pass  # Closed with an error code, e.g. 1012 when the server drains
+    finally:
+        consumer.cancel()
+        connections.discard(websocket)
+        manager.close(session)
+        print("Client disconnected, session", session.session_id, session.stats())
+
+
+async def report_queue_depths():
+    while True:
+        await asyncio.sleep(QUEUE_REPORT_INTERVAL)
+        stats = manager.stats()
+        if stats:
+            print("Frames per session:", stats)
+
+
+async def listen(host, port, attempts=50):
+    """Starts the WebSocket server, retrying while a draining predecessor
+    still holds the port"""
+    for attempt in range(attempts):
+        try:
+            return await websockets.serve(process, host, port)
+        except OSError as e:
+            if e.errno != errno.EADDRINUSE or attempt == attempts - 1:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def drain(server, metrics_server):
+    """Graceful stop: no new connection is accepted, the open ones run for up
+    to ATTENTION_DRAIN_SECONDS, then their calibrations are saved and they are
+    closed with 1012 (service restart) so that the clients reconnect"""
+    server.server.close()  # Stop listening, the open connections are kept
+    if metrics_server is not None:
+        await asyncio.get_running_loop().run_in_executor(None, metrics_server.shutdown)
+        metrics_server.server_close()
+    deadline = time.monotonic() + ATTENTION_DRAIN_SECONDS
+    while connections and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    # Saved before the close frames, a client reconnecting right away gets its calibration
+    manager.save_calibrations()
+    await asyncio.gather(*[websocket.close(1012, "service restart") for websocket in list(connections)],
+                         return_exceptions=True)
+    server.close()
+    await server.wait_closed()
+    manager.shutdown()
+
+
+async def serve(host=ATTENTION_HOST, port=ATTENTION_PORT, metrics_port=ATTENTION_METRICS_PORT, ready=None):
+    """Runs the attention server until SIGTERM or SIGINT, then drains it
+
+    Arguments:
+        host (str): Address to listen on
+        port (int): WebSocket port
+        metrics_port (int): Port of the metrics endpoint, 0 disables it
+        ready (multiprocessing.Event): Set once the server accepts connections
+    """
+    print(f"WebSocket service starting with {manager.max_workers} analysis workers "
+          f"({manager.backpressure} backpressure), listening on ws://{host}:{port} ...")
+    manager.backend  # Load the shared landmark models before the first client
+    print(f"Ready in {time.perf_counter() - STARTED_AT:.2f}s, startup timings (s):",
+          registry.startup_report())
+    metrics_server = None
+    if metrics_port:
+        metrics_server = metrics.start_background(ATTENTION_METRICS_HOST, metrics_port)
+        if metrics_server:
+            print(f"Metrics on http://{ATTENTION_METRICS_HOST}:{metrics_port}/metrics")
+    if ATTENTION_PROFILE:
+        metrics.profiler.start()
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+    reporter = asyncio.ensure_future(report_queue_depths())
+    server = await listen(host, port)
+    if ready is not None:
+        ready.set()
+    await stopping.wait()
+    print(f"Draining {len(connections)} connection(s) on port {port}")
+    reporter.cancel()
+    await drain(server, metrics_server)
+
 
 async def main():
-    print("WebSocket service starting, listening on ws://0.0.0.0:8765 ...")
-    async with websockets.serve(process, "0.0.0.0", 8765):
-        await asyncio.Future()  # run forever
+    await serve()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,105 @@
+# frame_transport.py
+# Wire formats of the attention WebSocket: legacy JSON data URLs and binary frames.
+#
+# A binary message is a 20 bytes little-endian header followed by the payload:
+#
+#   offset  size  field
+#   0       2     magic, b"GZ"
+#   2       1     version, 1
+#   3       1     encoding, one of the ENCODING_* values below
+#   4       4     frame id (uint32)
+#   8       2     width (uint16)
+#   10      2     height (uint16)
+#   12      8     client timestamp in milliseconds (float64)
+#
+# JPEG and PNG payloads are decoded straight to grayscale from the received
+# buffer; raw payloads are width * height bytes of 8-bit luma, row by row.
+import base64
+import json
+import struct
+
+import cv2
+import numpy as np
+
+from attention_session import FrameRequest
+
+MAGIC = b"GZ"
+VERSION = 1
+HEADER = struct.Struct("<2sBBIHHd")
+
+ENCODING_JPEG = 0
+ENCODING_PNG = 1
+ENCODING_GRAY = 2
+
+
+def encode_header(frame_id, width, height, encoding=ENCODING_JPEG, timestamp=0.0):
+    """Packs a binary frame header, the payload has to be appended by the caller"""
+    return HEADER.pack(MAGIC, VERSION, encoding, frame_id, width, height, timestamp)
+
+
+def decode_image(img_b64):
+    """Decodes a base64 JPEG/PNG (optionally a data URL) into a BGR frame, or None"""
+    # Remove base64 header
+    if ',' in img_b64:
+        img_b64 = img_b64.split(',')[1]
+    img_bytes = base64.b64decode(img_b64)
+    np_arr = np.frombuffer(img_bytes, np.uint8)
+    return cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+
+
+class BinaryPayloadDecoder(object):
+    """Decodes the payload of a binary frame into a grayscale frame"""
+
+    __slots__ = ("encoding", "width", "height")
+
+    def __init__(self, encoding, width, height):
+        self.encoding = encoding
+        self.width = width
+        self.height = height
+
+    def __call__(self, payload):
+        buffer = np.frombuffer(payload, np.uint8)
+        if self.encoding == ENCODING_GRAY:
+            if buffer.size != self.width * self.height:
+                raise ValueError(
+                    f"Raw frame of {buffer.size} bytes does not match {self.width}x{self.height}"
+                )
+            # dlib needs a writable image, received messages are read-only bytes
+            return buffer.reshape(self.height, self.width).copy()
+        return cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE)
+
+
+def parse_json_message(message):
+    """Parses a {"image": <data URL>, "frame_id": n, "ts": ms} message into a
+    FrameRequest, or None. frame_id and ts are optional, older clients only
+    send the image.
+    """
+    data = json.loads(message)
+    img_b64 = data.get('image')
+    if not img_b64:
+        return None
+    return FrameRequest(img_b64, decode_image, data.get('frame_id'), data.get('ts'))
+
+
+def parse_binary_message(message):
+    """Parses a binary frame into a FrameRequest without copying the payload"""
+    if len(message) < HEADER.size:
+        raise ValueError("Binary frame shorter than its header")
+    magic, version, encoding, frame_id, width, height, timestamp = HEADER.unpack_from(message)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Unsupported binary frame {magic!r} v{version}")
+    if encoding not in (ENCODING_JPEG, ENCODING_PNG, ENCODING_GRAY):
+        raise ValueError(f"Unknown frame encoding {encoding}")
+    payload = memoryview(message)[HEADER.size:]
+    return FrameRequest(
+        payload, BinaryPayloadDecoder(encoding, width, height), frame_id, timestamp or None
+    )
+
+
+def parse_message(message):
+    """Parses a WebSocket message, binary (bytes) or JSON (str), into a
+    FrameRequest. The image itself is decoded later on the worker pool.
+    """
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        return parse_binary_message(message)
+    return parse_json_message(message)
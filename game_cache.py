@@ -0,0 +1,170 @@
+# game_cache.py
+# Persistent on-disk cache of the generated games, keyed by a hash of the
+# normalised prompt and the model parameters, so that a repeated task
+# configuration is served from disk instead of a new LLM generation.
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+
+CACHE_DIR = os.getenv("GAME_CACHE_DIR", ".game_cache")
+MAX_ENTRIES = int(os.getenv("GAME_CACHE_MAX_ENTRIES", "500"))  # Stored games, all keys and variants
+MAX_BYTES = int(float(os.getenv("GAME_CACHE_MAX_MB", "200")) * 1024 * 1024)
+VARIANTS = int(os.getenv("GAME_CACHE_VARIANTS", "3"))  # Games kept per key
+
+
+def normalise_prompt(prompt):
+    """Returns the prompt with unicode forms, case and whitespace normalised"""
+    prompt = unicodedata.normalize("NFKC", prompt)
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+
+def cache_key(prompt, **model_params):
+    """Returns the cache key of a prompt sent with the given model parameters
+
+    Arguments:
+        prompt (str): Full prompt sent to the action agent
+        model_params: model, temperature... the game is generated with
+    """
+    payload = json.dumps({"prompt": normalise_prompt(prompt), "model": model_params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GameCache(object):
+    """
+    Stores every generated game as <key>.<variant>.json in the cache directory,
+    with the HTML and the perception/decision outputs of its request.
+
+    Up to `variants` games are kept per key, and a hit returns one of them at
+    random for variety. The cache is bounded both in number of games and in
+    bytes: when a put exceeds a bound, the least recently used games (by file
+    modification time, refreshed on every hit) are evicted first.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, variants=VARIANTS):
+        """
+        Arguments:
+            directory (str): Cache directory, created on first put
+            max_entries (int): Maximum number of games stored
+            max_bytes (int): Maximum total size of the stored games
+            variants (int): Maximum number of games stored per key
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.variants = max(variants, 1)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _variant_paths(self, key):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        prefix = key + "." if key else ""
+        return [os.path.join(self.directory, name) for name in names
+                if name.startswith(prefix) and name.endswith(".json")]
+
+    def get(self, key):
+        """Returns a stored game {"html", "type", "decision", "created"} of key, or None"""
+        with self._lock:
+            paths = self._variant_paths(key)
+            random.shuffle(paths)
+            for path in paths:
+                try:
+                    with open(path, encoding="utf-8") as file:
+                        game = json.load(file)
+                    os.utime(path)  # Most recently used
+                except (OSError, ValueError):
+                    # Evicted meanwhile or a truncated file, try another variant
+                    continue
+                self.hits += 1
+                return game
+            self.misses += 1
+            return None
+
+    def put(self, key, html, type_str=None, decision=None):
+        """Stores a generated game under key, replacing its least recently used
+        variant if key already has `variants` games"""
+        game = {"html": html, "type": type_str, "decision": decision, "created": time.time()}
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            paths = sorted(self._variant_paths(key), key=_mtime)
+            if len(paths) >= self.variants:
+                path = paths[0]
+            else:
+                used = {os.path.basename(path) for path in paths}
+                variant = next(n for n in range(self.variants) if f"{key}.{n}.json" not in used)
+                path = os.path.join(self.directory, f"{key}.{variant}.json")
+            # Written aside then renamed, so readers never see a partial game
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(game, file)
+            os.replace(temporary, path)
+            self.stores += 1
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        count = len(entries)
+        for _, size, path in entries:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            count -= 1
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Removes every stored game"""
+        with self._lock:
+            for path in self._variant_paths(""):
+                os.remove(path)
+
+    def stats(self):
+        """Returns the hit/miss counters of this process and the cache size"""
+        with self._lock:
+            paths = self._variant_paths("")
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": len(paths),
+                "bytes": sum(_size(path) for path in paths),
+            }
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+cache = GameCache()
@@ -0,0 +1,179 @@
+# game_library.py
+# Library of pre-generated games, one per cell of the 5 WHAT x 3 HOW x 3 LEVEL
+# task matrix, served instantly by the Dialogue tab when the user gives no
+# free-text requirement. Filled by a background generator:
+#
+#   python game_library.py --concurrency 3 --rate 20 --retries 3
+#
+# which only generates the missing cells, so an interrupted run resumes where it stopped.
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import task_config
+from html_postprocess import postprocess
+
+LIBRARY_DIR = os.getenv("GAME_LIBRARY_DIR", "game_library")
+CONCURRENCY = int(os.getenv("GAME_LIBRARY_CONCURRENCY", "3"))  # Generations in flight
+RATE = float(os.getenv("GAME_LIBRARY_RATE", "20"))  # Generations started per minute
+RETRIES = int(os.getenv("GAME_LIBRARY_RETRIES", "3"))  # Retries of a failed or invalid generation
+
+
+def cell_name(what, how, level):
+    """Returns the file name of a cell, e.g. perceptual-training_gamified-task_low-difficulty"""
+    return "_".join(re.sub(r"[^a-z0-9]+", "-", option.lower()).strip("-") for option in (what, how, level))
+
+
+class GameLibrary(object):
+    """Stores the game of every cell as <cell name>.json in the library directory"""
+
+    def __init__(self, directory=LIBRARY_DIR):
+        self.directory = directory
+
+    def path(self, what, how, level):
+        return os.path.join(self.directory, cell_name(what, how, level) + ".json")
+
+    def get(self, what, how, level):
+        """Returns the game {"html", "prompt", "created", ...} of a cell, or None"""
+        try:
+            with open(self.path(what, how, level), encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, what, how, level, html, **metadata):
+        """Stores the game of a cell, replacing the previous one"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(what, how, level)
+        game = dict(metadata, what=what, how=how, level=level, html=html, created=time.time())
+        # Written aside then renamed, so an interrupted run never leaves a partial game
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(game, file)
+        os.replace(temporary, path)
+
+    def missing(self):
+        """Returns the (what, how, level) cells without a game"""
+        return [cell for cell in task_config.cells() if not os.path.exists(self.path(*cell))]
+
+    def stats(self):
+        cells = len(list(task_config.cells()))
+        return {"cells": cells, "ready": cells - len(self.missing())}
+
+
+class RateLimiter(object):
+    """Spaces the starts of the generations by at least 60 / rate seconds"""
+
+    def __init__(self, rate):
+        self.interval = 60.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def generate_cell(library, cell, limiter, retries=RETRIES, backoff=2.0):
+    """Generates and stores the game of a cell, retrying failed or invalid generations
+
+    Returns:
+        True if the game was stored
+    """
+    from action_agent import extract_html
+    from agent_pipeline import get_agent
+    from multi_agent_framework import get_content
+
+    prompt = task_config.full_prompt(*cell)
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(backoff * 2 ** (attempt - 1))
+        await limiter.wait()
+        action, _ = get_agent("action")
+        start = time.perf_counter()
+        try:
+            raw = get_content(await action.ainvoke({"desc": prompt}))
+        except Exception as error:
+            print(f"{cell_name(*cell)}: attempt {attempt + 1} failed: {error!r}")
+            continue
+        processed = postprocess(extract_html(raw))
+        if not processed.accepted:
+            print(f"{cell_name(*cell)}: attempt {attempt + 1} rejected, missing {', '.join(processed.missing)}")
+            continue
+        library.put(*cell, processed.html, prompt=hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+                    seconds=time.perf_counter() - start)
+        return True
+    return False
+
+
+async def fill_library(library=None, concurrency=CONCURRENCY, rate=RATE, retries=RETRIES):
+    """Generates the game of every cell missing from the library
+
+    Arguments:
+        library (GameLibrary): Library to fill, the default one if None
+        concurrency (int): Maximum number of generations in flight
+        rate (float): Maximum number of generations started per minute
+        retries (int): Retries of a failed or invalid generation
+
+    Returns:
+        The cells that could not be generated
+    """
+    library = library or GameLibrary()
+    limiter = RateLimiter(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(cell):
+        async with semaphore:
+            return cell, await generate_cell(library, cell, limiter, retries)
+
+    results = await asyncio.gather(*[bounded(cell) for cell in library.missing()])
+    return [cell for cell, stored in results if not stored]
+
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def start_background(**options):
+    """Starts filling the library on the agents' background event loop, once per
+    process. Returns the future of fill_library()."""
+    global _background
+    from agent_registry import registry
+
+    with _background_lock:
+        if _background is None or (_background.done() and _background.exception() is not None):
+            _background = registry.run(fill_library(**options))
+        return _background
+
+
+library = GameLibrary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate the game of every task configuration cell")
+    parser.add_argument("--directory", default=LIBRARY_DIR)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=RATE, help="Generations started per minute")
+    parser.add_argument("--retries", type=int, default=RETRIES)
+    args = parser.parse_args()
+
+    target = GameLibrary(args.directory)
+    print(f"{len(target.missing())} of {target.stats()['cells']} cells to generate")
+    start = time.perf_counter()
+    failed = asyncio.run(fill_library(target, args.concurrency, args.rate, args.retries))
+    print(f"Done in {time.perf_counter() - start:.0f}s, {len(failed)} cells failed")
+    for cell in failed:
+        print("  " + cell_name(*cell))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# game_server.py
+# Small static server for the generated games. Each game is served from the game
+# store (game_store.py) under its content hash, /games/<sha256>.html, with
+# long-lived immutable cache headers, so the tabs embed it by URL in an iframe
+# and the browser downloads every game once instead of on every rerun.
+#
+#   python game_server.py  (with GAME_SERVER=1 the app starts it in a background thread)
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from game_store import store
+
+# Off by default: the browser must reach the port, which hosted deployments (Docker,
+# Hugging Face Spaces) do not publish next to Streamlit's
+GAME_SERVER = os.getenv("GAME_SERVER", "0") == "1"
+GAME_SERVER_HOST = os.getenv("GAME_SERVER_HOST", "0.0.0.0")
+GAME_SERVER_PORT = int(os.getenv("GAME_SERVER_PORT", "8766"))
+# Address of the server as seen from the browser
+GAME_SERVER_URL = os.getenv("GAME_SERVER_URL", f"http://localhost:{GAME_SERVER_PORT}")
+
+_GAME_PATH = re.compile(r"^/games/([0-9a-f]{64})\.html$")
+
+
+class GameRequestHandler(BaseHTTPRequestHandler):
+    """Serves /games/<sha256>.html from the game store"""
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def _serve(self, body):
+        match = _GAME_PATH.match(self.path.split("?", 1)[0])
+        if match is None:
+            self.send_error(404)
+            return
+        game_id = match.group(1)
+        etag = f'"{game_id}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        html = store.get(game_id)
+        if html is None:
+            self.send_error(404)
+            return
+        data = html.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        # The URL names the content, it never changes
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.send_header("ETag", etag)
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def game_url(game_id):
+    """Returns the URL of a stored game for the browser"""
+    return f"{GAME_SERVER_URL}/games/{game_id}.html"
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_background(host=GAME_SERVER_HOST, port=GAME_SERVER_PORT):
+    """Starts the game server in a daemon thread, once per process. Returns the
+    server, or None if the port is taken (e.g. by another app process already serving)."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), GameRequestHandler)
+            except OSError as error:
+                print(f"Game server not started on port {port}: {error}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="game-server", daemon=True).start()
+        return _server
+
+
+def main():
+    server = ThreadingHTTPServer((GAME_SERVER_HOST, GAME_SERVER_PORT), GameRequestHandler)
+    print(f"Serving {store.directory} on http://{GAME_SERVER_HOST}:{GAME_SERVER_PORT}/games/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
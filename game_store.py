@@ -0,0 +1,89 @@
+# game_store.py
+# Content-addressed store of the generated games on disk. The dialogue history
+# and the Mini Game tab only keep the SHA-256 of a game in the session state,
+# and the HTML is read back from disk when it is actually displayed.
+import hashlib
+import os
+import threading
+
+STORE_DIR = os.getenv("GAME_STORE_DIR", ".game_store")
+MAX_BYTES = int(float(os.getenv("GAME_STORE_MAX_MB", "500")) * 1024 * 1024)
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "200"))  # Dialogue entries kept per session
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "5"))  # Dialogue entries shown per page
+
+
+class GameStore(object):
+    """
+    Stores every game as <sha256>.html. Identical games are stored once, and a
+    stored game never changes, so its id can be cached forever downstream.
+    Beyond max_bytes, the least recently read or written games are removed.
+    """
+
+    def __init__(self, directory=STORE_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path(self, game_id):
+        return os.path.join(self.directory, game_id + ".html")
+
+    def put(self, html):
+        """Stores a game and returns its id, the SHA-256 of its UTF-8 encoding"""
+        data = html.encode("utf-8")
+        game_id = hashlib.sha256(data).hexdigest()
+        path = self.path(game_id)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)
+                return game_id
+            os.makedirs(self.directory, exist_ok=True)
+            # Written aside then renamed, so readers never see a partial game
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as file:
+                file.write(data)
+            os.replace(temporary, path)
+            self._evict()
+        return game_id
+
+    def get(self, game_id):
+        """Returns the HTML of a game, None if it is unknown or was evicted"""
+        path = self.path(game_id)
+        try:
+            # Read as bytes: text mode would turn "\r\n" into "\n", no longer matching game_id
+            with open(path, "rb") as file:
+                html = file.read().decode("utf-8")
+            os.utime(path)
+        except OSError:
+            return None
+        return html
+
+    def size(self, game_id):
+        try:
+            return os.path.getsize(self.path(game_id))
+        except OSError:
+            return None
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".html"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def add_history_entry(history, entry, limit=HISTORY_LIMIT):
+    """Appends a dialogue entry to the session history, dropping the oldest ones beyond limit"""
+    history.append(entry)
+    del history[:-limit]
+
+
+store = GameStore()
@@ -0,0 +1,14 @@
+"""
+Eye tracking package. OpenCV, dlib and the trained models are only loaded
+when GazeTracking is first used, so lightweight helpers such as
+gaze_tracking.landmarks can be imported without them.
+"""
+from .models import registry
+
+__all__ = ["GazeTracking", "registry"]
+
+
+def __getattr__(name):
+    if name == "GazeTracking":
+        return registry.import_module(__name__ + ".gaze_tracking").GazeTracking
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,315 @@
+import gc
+import hashlib
+import os
+import urllib.request
+import cv2
+import numpy as np
+from .landmarks import landmarks_to_array
+from .models import registry
+
+MODELS_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "trained_models")
+MODEL_PATH = os.path.join(MODELS_DIR, "shape_predictor_68_face_landmarks.dat")
+YUNET_MODEL_PATH = os.path.join(MODELS_DIR, "face_detection_yunet_2023mar.onnx")
+# Landmark model of the opencv backend: PIPNet (ResNet-18) trained on 300-W and CelebA,
+# https://github.com/yakhyo/pipnet-onnx. Fetched by download_landmark_model():
+#   python -m gaze_tracking.backends
+LANDMARKS_ONNX_PATH = os.path.join(MODELS_DIR, "pipnet_r18_300w_celeba_68.onnx")
+LANDMARKS_ONNX_URL = ("https://github.com/yakhyo/pipnet-onnx/releases/download/weights/"
+                      "pipnet_r18_300w_celeba_68.onnx")
+LANDMARKS_ONNX_SHA256 = "63fa56fd4b8f6ccc4b88f2b36e00fa3d8c21a2c4244ab9381e8b432cef35197b"
+# ImageNet normalisation of the PIPNet input, RGB
+_PIPNET_MEAN = np.array([0.485, 0.456, 0.406], np.float32).reshape(1, 3, 1, 1)
+_PIPNET_STD = np.array([0.229, 0.224, 0.225], np.float32).reshape(1, 3, 1, 1)
+
+
+class LandmarkBackend(object):
+    """
+    Interface of the face detection and landmark prediction used by GazeTracking.
+    Face boxes are (left, top, right, bottom) tuples and landmarks are (68, 2)
+    int32 arrays following the 68 Multi-PIE layout, so every backend gives
+    the same eye points.
+    """
+
+    name = None
+
+    def detect(self, frame):
+        """Returns the face boxes found in a grayscale frame"""
+        raise NotImplementedError
+
+    def predict(self, frame, box):
+        """Returns the (68, 2) landmarks of the face in box"""
+        raise NotImplementedError
+
+    def detect_batch(self, frames):
+        """Returns the face boxes found in each of several grayscale frames.
+        Backends able to run their detector on several frames at once override it."""
+        return [self.detect(frame) for frame in frames]
+
+    def predict_batch(self, frames, boxes):
+        """Returns the (68, 2) landmarks of the face in boxes[i] of frames[i], for each i.
+        Backends able to run their predictor on several faces at once override it."""
+        return [self.predict(frame, box) for frame, box in zip(frames, boxes)]
+
+    def clone(self):
+        """Returns a backend sharing the loaded models, safe to use from another thread"""
+        raise NotImplementedError
+
+
+class DlibBackend(LandmarkBackend):
+    """
+    dlib HOG frontal face detector and 68 landmarks shape predictor.
+    The predictor is read-only once loaded and shared through the model
+    registry, every instance gets its own face detector.
+    """
+
+    name = "dlib"
+
+    def __init__(self, predictor=None, model_path=MODEL_PATH):
+        dlib = registry.import_module("dlib")
+
+        self._dlib = dlib
+        # _face_detector is used to detect faces
+        self._face_detector = dlib.get_frontal_face_detector()
+        # _predictor is used to get facial landmarks of a given face
+        if predictor is None:
+            predictor = self.load_predictor(model_path)
+        self._predictor = predictor
+
+    @staticmethod
+    def load_predictor(model_path=MODEL_PATH):
+        """Returns the 68 landmarks predictor, loaded once per process"""
+        return registry.get(
+            ("dlib.shape_predictor", model_path),
+            lambda: registry.import_module("dlib").shape_predictor(model_path),
+        )
+
+    @property
+    def predictor(self):
+        return self._predictor
+
+    def detect(self, frame):
+        return [(face.left(), face.top(), face.right(), face.bottom())
+                for face in self._face_detector(frame)]
+
+    def predict(self, frame, box):
+        return landmarks_to_array(self._predictor(frame, self._dlib.rectangle(*box)))
+
+    def clone(self):
+        return DlibBackend(predictor=self._predictor)
+
+
+class OpenCVDnnBackend(LandmarkBackend):
+    """
+    CPU backend built on OpenCV only: the YuNet face detector (cv2.FaceDetectorYN,
+    ~230 KB) and the PIPNet landmark network run with cv2.dnn.
+
+    The landmark model is the 68 point PIPNet of LANDMARKS_ONNX_URL, checked
+    against LANDMARKS_ONNX_SHA256 when it is loaded. Its 300-W points follow
+    the same Multi-PIE layout as the dlib predictor. It takes a 256x256 RGB
+    face crop, ImageNet normalised, and outputs a (68, 8, 8) heatmap with the
+    x and y offsets of each point in its cell; the neighbour outputs, which
+    refine the points, are not used. Model files are read once per process,
+    through the model registry, and every instance builds its networks from
+    these in-memory buffers.
+    """
+
+    name = "opencv"
+
+    def __init__(self, detector_path=YUNET_MODEL_PATH, landmark_path=LANDMARKS_ONNX_PATH,
+                 landmark_sha256=LANDMARKS_ONNX_SHA256, input_size=256, box_padding=0.1,
+                 detection_width=320, score_threshold=0.6, _buffers=None):
+        """
+        Arguments:
+            detector_path (str): YuNet ONNX model
+            landmark_path (str): PIPNet 68 landmarks ONNX model
+            landmark_sha256 (str): Expected SHA-256 of the landmark model, None to skip the check
+            input_size (int): Side of the square input of the landmark model
+            box_padding (float): Face box padding before cropping for the landmark model,
+                as in PIPNet's training: this fraction of the box is added on the left,
+                right and bottom, and removed at the top
+            detection_width (int): Frames wider than this are downscaled for face detection
+            score_threshold (float): Minimum YuNet face score
+
+        Raises:
+            ValueError: If the landmark model is not the expected one
+        """
+        check = _buffers is None
+        if check:
+            _buffers = (_read_model_file(detector_path), _read_model_file(landmark_path))
+            if landmark_sha256 is not None and hashlib.sha256(_buffers[1]).hexdigest() != landmark_sha256:
+                raise ValueError(
+                    f"{landmark_path} is not the landmark model of the opencv backend (SHA-256 "
+                    f"{landmark_sha256}), download it with: python -m gaze_tracking.backends"
+                )
+        self._buffers = _buffers
+        self._options = dict(landmark_sha256=landmark_sha256, input_size=input_size, box_padding=box_padding,
+                             detection_width=detection_width, score_threshold=score_threshold)
+        self.input_size = input_size
+        self.box_padding = box_padding
+        self.detection_width = detection_width
+
+        detector_model, landmark_model = _buffers
+        self._detector = cv2.FaceDetectorYN.create(
+            "onnx", np.frombuffer(detector_model, np.uint8), np.empty(0, np.uint8),
+            (detection_width, detection_width), score_threshold,
+        )
+        self._net = cv2.dnn.readNetFromONNX(np.frombuffer(landmark_model, np.uint8))
+        # Heatmap, x offsets, y offsets, then the neighbour outputs, in the model's output order
+        self._outputs = list(self._net.getUnconnectedOutLayersNames())
+        if check:
+            self._check_outputs(landmark_path)
+        # Cleared if the landmark network turns out to have a fixed batch size of 1
+        self._batched = True
+
+    def _check_outputs(self, landmark_path):
+        """Raises ValueError if the landmark model does not output PIPNet's heatmap and offsets"""
+        self._net.setInput(np.zeros((1, 3, self.input_size, self.input_size), np.float32))
+        shapes = [output.shape for output in self._net.forward(self._outputs)]
+        if len(shapes) < 3 or len(shapes[0]) != 4 or shapes[0][:2] != (1, 68) or shapes[1:3] != shapes[:1] * 2:
+            raise ValueError(
+                f"{landmark_path} does not output a (1, 68, H, W) heatmap followed by its x and y "
+                f"offsets, got outputs of shapes {shapes}"
+            )
+
+    def detect(self, frame):
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.detection_width / float(width))
+        small = frame if scale == 1.0 else cv2.resize(frame, None, fx=scale, fy=scale,
+                                                      interpolation=cv2.INTER_AREA)
+        if small.ndim == 2:
+            small = cv2.cvtColor(small, cv2.COLOR_GRAY2BGR)
+        self._detector.setInputSize((small.shape[1], small.shape[0]))
+        _, faces = self._detector.detect(small)
+        if faces is None:
+            return []
+        boxes = []
+        for x, y, w, h in faces[:, :4] / scale:
+            boxes.append((int(x), int(y), int(x + w), int(y + h)))
+        return boxes
+
+    def _crop_box(self, frame, box):
+        """PIPNet's crop around box, clamped to the frame"""
+        left, top, right, bottom = box
+        pad_x = int((right - left) * self.box_padding)
+        pad_y = int((bottom - top) * self.box_padding)
+        height, width = frame.shape[:2]
+        x0 = max(left - pad_x, 0)
+        y0 = max(top + pad_y, 0)
+        x1 = min(right + pad_x, width)
+        y1 = min(bottom + pad_y, height)
+        return x0, y0, x1, y1
+
+    def _crops(self, frames, boxes):
+        """Returns the input blob of the faces and the (x, y, width, height) of their crops"""
+        crops = []
+        windows = []
+        for frame, box in zip(frames, boxes):
+            x0, y0, x1, y1 = self._crop_box(frame, box)
+            crop = frame[y0:y1, x0:x1]
+            crops.append(cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR) if crop.ndim == 2 else crop)
+            windows.append((x0, y0, x1 - x0, y1 - y0))
+        blob = cv2.dnn.blobFromImages(crops, 1 / 255.0, (self.input_size, self.input_size), swapRB=True)
+        return (blob - _PIPNET_MEAN) / _PIPNET_STD, np.array(windows, np.float64)
+
+    def _landmarks(self, blob, windows):
+        """Runs the landmark network, returns the points of each face in frame coordinates"""
+        self._net.setInput(blob)
+        heatmap, offset_x, offset_y = self._net.forward(self._outputs)[:3]
+        faces, points, rows, columns = heatmap.shape
+        best = heatmap.reshape(faces, points, -1).argmax(axis=2)[..., None]
+        # Cell of the heatmap maximum plus the offset of the point in it, as a fraction of the crop
+        x = best[..., 0] % columns + np.take_along_axis(offset_x.reshape(faces, points, -1), best, 2)[..., 0]
+        y = best[..., 0] // columns + np.take_along_axis(offset_y.reshape(faces, points, -1), best, 2)[..., 0]
+        points = np.stack([x / columns, y / rows], axis=2)
+        points = points * windows[:, None, 2:] + windows[:, None, :2]
+        return np.rint(points).astype(np.int32)
+
+    def predict(self, frame, box):
+        return self._landmarks(*self._crops([frame], [box]))[0]
+
+    def predict_batch(self, frames, boxes):
+        """Runs the landmark network once on the crops of every face"""
+        if len(frames) < 2 or not self._batched:
+            return super().predict_batch(frames, boxes)
+        try:
+            return list(self._landmarks(*self._crops(frames, boxes)))
+        except cv2.error:
+            # Exported with a static batch dimension, fall back to one face at a time
+            self._batched = False
+            return super().predict_batch(frames, boxes)
+
+    def clone(self):
+        return OpenCVDnnBackend(_buffers=self._buffers, **self._options)
+
+
+def download_landmark_model(path=LANDMARKS_ONNX_PATH, url=LANDMARKS_ONNX_URL, sha256=LANDMARKS_ONNX_SHA256):
+    """Downloads the landmark model of the opencv backend, unless it is already there
+
+    Raises:
+        ValueError: If the downloaded file does not have the expected SHA-256
+    """
+    if os.path.exists(path) and _file_sha256(path) == sha256:
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + ".part"
+    urllib.request.urlretrieve(url, partial)
+    digest = _file_sha256(partial)
+    if digest != sha256:
+        os.remove(partial)
+        raise ValueError(f"{url} has SHA-256 {digest}, expected {sha256}")
+    os.replace(partial, path)
+    return path
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_model_file(path):
+    """Returns the content of a model file, read once per process"""
+    def load():
+        with open(path, "rb") as f:
+            return f.read()
+    return registry.get(("file", path), load)
+
+
+BACKENDS = {
+    DlibBackend.name: DlibBackend,
+    OpenCVDnnBackend.name: OpenCVDnnBackend,
+}
+
+
+def create_backend(name="dlib", **kwargs):
+    """Instantiates a landmark backend by name ("dlib" or "opencv")"""
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown landmark backend: {name}, expected one of {sorted(BACKENDS)}")
+    return backend_class(**kwargs)
+
+
+def preload_backend(name="dlib", freeze=True, **kwargs):
+    """Loads the models of a backend in the model registry and returns it.
+
+    Call it in the parent process before forking workers: the models are then
+    shared copy-on-write instead of being loaded again in every worker.
+
+    Arguments:
+        name (str): Backend name, see BACKENDS
+        freeze (bool): Move the objects allocated so far out of the garbage
+            collector's reach (gc.freeze), so that collections in the workers
+            do not touch, and therefore copy, the shared pages
+    """
+    backend = create_backend(name, **kwargs)
+    if freeze and hasattr(gc, "freeze"):
+        gc.collect()
+        gc.freeze()
+    return backend
+
+
+if __name__ == "__main__":
+    print(f"Landmark model of the opencv backend: {download_landmark_model()}")
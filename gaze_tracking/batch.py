@@ -0,0 +1,137 @@
+import collections
+
+from .backends import create_backend
+from .stage_timer import NULL_TIMER
+
+GazeResult = collections.namedtuple("GazeResult", ["horizontal_ratio", "vertical_ratio", "blinking"])
+GazeResult.__doc__ = """Gaze of a session after a batch, as GazeTracking.horizontal_ratio(),
+vertical_ratio() and is_blinking() return them (None when the pupils were not located)"""
+
+
+def gaze_result(gaze):
+    """Returns the GazeResult of a refreshed GazeTracking"""
+    return GazeResult(gaze.horizontal_ratio(), gaze.vertical_ratio(), gaze.is_blinking())
+
+
+def refresh_batch(items, backend, timer=NULL_TIMER):
+    """Refreshes several GazeTracking instances at once, each with its own frame.
+
+    Grayscale conversion, face detection and landmark prediction run stage by
+    stage over the whole batch, through the backend's detect_batch() and
+    predict_batch(), instead of frame by frame. Each instance keeps its own
+    calibration and face tracker, so the results are the same as calling
+    gaze.refresh(frame) on each of them.
+
+    Arguments:
+        items (list): (GazeTracking, frame) pairs, an instance appears at most once
+        backend (backends.LandmarkBackend): Backend running the batched stages,
+            not used concurrently by another thread
+        timer (stage_timer.StageTimer): Records the latency of the batched stages
+    """
+    if not items:
+        return
+    with timer.stage("batch_grayscale"):
+        frames = []
+        for gaze, frame in items:
+            gaze.frame = frame
+            frames.append(gaze._grayscale())
+    landmarks = [None] * len(items)
+
+    # Tracked faces: the predictor runs on the box followed since the last keyframe
+    tracked = [i for i, (gaze, _) in enumerate(items)
+               if gaze.face_tracker is not None and not gaze.face_tracker.keyframe_due()]
+    lost = []
+    if tracked:
+        with timer.stage("batch_predict"):
+            points = backend.predict_batch([frames[i] for i in tracked],
+                                           [items[i][0].face_tracker.box for i in tracked])
+        for i, predicted in zip(tracked, points):
+            if items[i][0].face_tracker.track(predicted, frames[i].shape):
+                landmarks[i] = predicted
+            else:
+                lost.append(i)  # Falls back to a full detection on this frame
+
+    # Full frame detection on keyframes, untracked sessions and lost tracks
+    tracked = set(tracked)
+    detect = sorted(set(i for i in range(len(items)) if i not in tracked) | set(lost))
+    if detect:
+        with timer.stage("batch_detect"):
+            faces = backend.detect_batch([frames[i] for i in detect])
+        found = []
+        for i, boxes in zip(detect, faces):
+            if boxes:
+                found.append((i, boxes[0]))
+            elif items[i][0].face_tracker is not None:
+                items[i][0].face_tracker.reset()
+        if found:
+            with timer.stage("batch_predict"):
+                points = backend.predict_batch([frames[i] for i, _ in found], [box for _, box in found])
+            for (i, box), predicted in zip(found, points):
+                landmarks[i] = predicted
+                tracker = items[i][0].face_tracker
+                if tracker is not None:
+                    tracker.start(box, predicted)
+
+    # Eye isolation, calibration and pupil detection are per eye and stay per session
+    for (gaze, _), frame, predicted in zip(items, frames, landmarks):
+        gaze._locate_eyes(frame, predicted)
+
+
+class BatchGazeTracking(object):
+    """
+    Gaze tracking of many sessions analysed together, e.g. all the tablets of
+    a host's classrooms:
+
+        batch = BatchGazeTracking()
+        results = batch.refresh([("room1-3", frame), ("room2-7", other_frame)])
+        results["room1-3"].horizontal_ratio
+
+    Every session has its own GazeTracking (calibration and face tracking),
+    created on its first frame, and all of them share one backend.
+    """
+
+    def __init__(self, backend=None, tracking=False, keyframe_interval=10, timer=None):
+        """
+        Arguments:
+            backend (backends.LandmarkBackend): Backend of the batched stages, dlib when omitted
+            tracking (bool): Track each session's face between keyframes
+            keyframe_interval (int): With tracking, frames between two full detections
+            timer (stage_timer.StageTimer): Records the latency of each stage
+        """
+        self.backend = backend or create_backend()
+        self.tracking = tracking
+        self.keyframe_interval = keyframe_interval
+        self.timer = timer or NULL_TIMER
+        self.sessions = {}
+
+    def session(self, session_id):
+        """Returns the GazeTracking of a session, created on first use"""
+        gaze = self.sessions.get(session_id)
+        if gaze is None:
+            from . import GazeTracking
+            gaze = self.sessions[session_id] = GazeTracking(
+                backend=self.backend, tracking=self.tracking,
+                keyframe_interval=self.keyframe_interval, timer=self.timer,
+            )
+        return gaze
+
+    def close(self, session_id):
+        """Forgets a session and its calibration"""
+        self.sessions.pop(session_id, None)
+
+    def refresh(self, frames):
+        """Analyses one frame per session
+
+        Arguments:
+            frames (list): (session_id, frame) pairs, frames are BGR or grayscale.
+                When a session appears several times, only its last frame is analysed.
+
+        Returns:
+            A {session_id: GazeResult} dict
+        """
+        latest = collections.OrderedDict()
+        for session_id, frame in frames:
+            latest[session_id] = frame
+        refresh_batch([(self.session(sid), frame) for sid, frame in latest.items()],
+                      self.backend, self.timer)
+        return {sid: gaze_result(self.sessions[sid]) for sid in latest}
@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class FaceTracker(object):
+    """
+    This class follows the face from one frame to the next so that the full
+    frame HOG face detection only runs on keyframes. In between, the box given
+    to the landmark predictor is derived from the landmarks of the previous
+    frame, and the track is dropped as soon as their geometry degrades.
+    """
+
+    LEFT_EYE_POINTS = slice(36, 42)
+    RIGHT_EYE_POINTS = slice(42, 48)
+
+    def __init__(self, keyframe_interval=10, max_scale_change=0.2, max_aspect_change=0.3):
+        """
+        Arguments:
+            keyframe_interval (int): Number of frames after which a full detection is forced
+            max_scale_change (float): Relative change of the face width between two
+                frames above which the track is considered lost
+            max_aspect_change (float): Relative change of the landmarks aspect ratio,
+                compared to the keyframe, above which the track is considered lost
+        """
+        self.keyframe_interval = keyframe_interval
+        self.max_scale_change = max_scale_change
+        self.max_aspect_change = max_aspect_change
+        self.keyframes = 0
+        self.tracked_frames = 0
+        self.reset()
+
+    def reset(self):
+        """Forgets the current face, the next frame will be a keyframe"""
+        self.box = None
+        self._frames_since_keyframe = 0
+        self._width = None
+        self._aspect = None
+        self._offset = None
+        self._box_size = None
+
+    def keyframe_due(self):
+        """Returns true if the next frame needs a full frame face detection"""
+        return self.box is None or self._frames_since_keyframe >= self.keyframe_interval
+
+    @staticmethod
+    def _extent(points):
+        min_xy = points.min(axis=0)
+        max_xy = points.max(axis=0)
+        return (min_xy + max_xy) / 2.0, max_xy - min_xy
+
+    def start(self, box, points):
+        """Starts a new track from a detected face
+
+        Arguments:
+            box (tuple): (left, top, right, bottom) of the detected face
+            points (numpy.ndarray): The (68, 2) landmarks predicted in that box
+        """
+        center, size = self._extent(points)
+        width = max(float(size[0]), 1.0)
+        left, top, right, bottom = box
+        box_center = np.array([(left + right) / 2.0, (top + bottom) / 2.0])
+
+        self.box = box
+        self._frames_since_keyframe = 0
+        self._width = width
+        self._aspect = size[1] / width
+        # Detector box expressed relatively to the landmarks, to rebuild it on tracked frames
+        self._offset = (box_center - center) / width
+        self._box_size = np.array([right - left, bottom - top]) / width
+        self.keyframes += 1
+
+    def track(self, points, frame_shape):
+        """Checks the landmarks predicted in the tracked box and moves the box
+        with the face for the next frame.
+
+        Arguments:
+            points (numpy.ndarray): The (68, 2) landmarks predicted in self.box
+            frame_shape (tuple): Shape of the analysed frame
+
+        Returns:
+            False if the geometry degraded and the track has been dropped
+        """
+        height, width = frame_shape[:2]
+        center, size = self._extent(points)
+        face_width = float(size[0])
+
+        lost = (
+            face_width < 1
+            or points.min() < 0
+            or np.any(points[:, 0] >= width)
+            or np.any(points[:, 1] >= height)
+            or abs(face_width / self._width - 1) > self.max_scale_change
+            or abs((size[1] / face_width) / self._aspect - 1) > self.max_aspect_change
+            # The eyes must stay in the same order, otherwise the fit collapsed
+            or points[self.LEFT_EYE_POINTS, 0].mean() >= points[self.RIGHT_EYE_POINTS, 0].mean()
+        )
+        if lost:
+            self.reset()
+            return False
+
+        box_center = center + self._offset * face_width
+        half_size = self._box_size * face_width / 2.0
+        left, top = np.maximum(box_center - half_size, 0).astype(int)
+        right = int(min(box_center[0] + half_size[0], width - 1))
+        bottom = int(min(box_center[1] + half_size[1], height - 1))
+
+        self.box = (int(left), int(top), right, bottom)
+        self._width = face_width
+        self._frames_since_keyframe += 1
+        self.tracked_frames += 1
+        return True
@@ -1,9 +1,11 @@
 from __future__ import division
-import os
 import cv2
-import dlib
 from .eye import Eye
 from .calibration import Calibration
+from .face_tracker import FaceTracker
+from .landmarks import eye_geometry
+from .backends import MODEL_PATH, DlibBackend
+from .stage_timer import NULL_TIMER
 
 
 class GazeTracking(object):
@@ -13,19 +15,39 @@ class GazeTracking(object):
     and pupils and allows to know if the eyes are open or closed
     """
 
-    def __init__(self):
+    def __init__(self, predictor=None, tracking=False, keyframe_interval=10, backend=None, timer=None):
+        """
+        Arguments:
+            predictor (dlib.shape_predictor): Already loaded landmark predictor to
+                share between instances. Loaded from MODEL_PATH when omitted.
+                Only used by the default dlib backend.
+            tracking (bool): Reuse the face found in the previous frame instead of
+                running the face detector on every frame
+            keyframe_interval (int): With tracking, number of frames after which
+                the face detector runs again on the full frame
+            backend (backends.LandmarkBackend): Face detection and landmark
+                prediction, defaults to dlib
+            timer (stage_timer.StageTimer): Records the latency of each stage
+                of the analysis, nothing is recorded when omitted
+        """
         self.frame = None
         self.eye_left = None
         self.eye_right = None
         self.calibration = Calibration()
-
-        # _face_detector is used to detect faces
-        self._face_detector = dlib.get_frontal_face_detector()
-
-        # _predictor is used to get facial landmarks of a given face
-        cwd = os.path.abspath(os.path.dirname(__file__))
-        model_path = os.path.join(cwd, "trained_models", "shape_predictor_68_face_landmarks.dat")
-        self._predictor = dlib.shape_predictor(model_path)
+        self.face_tracker = FaceTracker(keyframe_interval) if tracking else None
+
+        # _backend is used to detect faces and get their facial landmarks
+        if backend is None:
+            backend = DlibBackend(predictor=predictor)
+        self._backend = backend
+        self.timer = timer or NULL_TIMER
+
+    @staticmethod
+    def load_predictor(model_path=MODEL_PATH):
+        """Loads the 68 landmarks predictor. The returned object is read-only once
+        loaded and can be shared by several GazeTracking instances and threads.
+        """
+        return DlibBackend.load_predictor(model_path)
 
     @property
     def pupils_located(self):
@@ -41,23 +63,73 @@ class GazeTracking(object):
 
     def _analyze(self):
         """Detects the face and initialize Eye objects"""
-        frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
-        faces = self._face_detector(frame)
+        frame = self._grayscale()
+        self._locate_eyes(frame, self._predict_landmarks(frame))
 
-        try:
-            landmarks = self._predictor(frame, faces[0])
-            self.eye_left = Eye(frame, landmarks, 0, self.calibration)
-            self.eye_right = Eye(frame, landmarks, 1, self.calibration)
+    def _grayscale(self):
+        """Returns the current frame in grayscale"""
+        if self.frame.ndim == 2:
+            return self.frame  # Already grayscale, e.g. raw luma from the binary transport
+        with self.timer.stage("grayscale"):
+            return cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
 
-        except IndexError:
+    def _locate_eyes(self, frame, landmarks):
+        """Initializes the Eye objects from the facial landmarks, or clears
+        them if no face was found
+
+        Arguments:
+            frame (numpy.ndarray): Grayscale frame
+            landmarks (numpy.ndarray): (68, 2) facial landmarks, or None
+        """
+        if landmarks is not None:
+            # Geometry of both eyes from a single (68, 2) array
+            with self.timer.stage("eye_geometry"):
+                geometry = eye_geometry(landmarks)
+            self.eye_left = Eye(frame, landmarks, 0, self.calibration, geometry, self.timer)
+            self.eye_right = Eye(frame, landmarks, 1, self.calibration, geometry, self.timer)
+        else:
             self.eye_left = None
             self.eye_right = None
 
+    def _predict_landmarks(self, frame):
+        """Returns the (68, 2) facial landmarks of the first face of the frame, or None.
+
+        With tracking, the predictor runs on the box followed by the face tracker
+        (it only reads pixels around that box) and the face detector only runs
+        on keyframes or when the tracked landmarks degrade.
+
+        Arguments:
+            frame (numpy.ndarray): Grayscale frame
+        """
+        tracker = self.face_tracker
+        timer = self.timer
+        if tracker is not None and not tracker.keyframe_due():
+            with timer.stage("predict"):
+                landmarks = self._backend.predict(frame, tracker.box)
+            if tracker.track(landmarks, frame.shape):
+                return landmarks
+            # The track is lost, fall back to a full detection on this frame
+
+        with timer.stage("detect"):
+            faces = self._backend.detect(frame)
+        try:
+            face = faces[0]
+        except IndexError:
+            if tracker is not None:
+                tracker.reset()
+            return None
+
+        with timer.stage("predict"):
+            landmarks = self._backend.predict(frame, face)
+        if tracker is not None:
+            tracker.start(face, landmarks)
+        return landmarks
+
     def refresh(self, frame):
         """Refreshes the frame and analyzes it.
 
         Arguments:
-            frame (numpy.ndarray): The frame to analyze
+            frame (numpy.ndarray): The frame to analyze, BGR or grayscale
         """
         self.frame = frame
         self._analyze()
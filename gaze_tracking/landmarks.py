@@ -0,0 +1,64 @@
+import collections
+import numpy as np
+
+LEFT_EYE_POINTS = [36, 37, 38, 39, 40, 41]
+RIGHT_EYE_POINTS = [42, 43, 44, 45, 46, 47]
+EYE_POINTS = np.array([LEFT_EYE_POINTS, RIGHT_EYE_POINTS])
+
+# Margin, in pixels, kept around the eye polygon when cropping the eye
+EYE_MARGIN = 5
+
+EyeGeometry = collections.namedtuple("EyeGeometry", ["regions", "blinking", "bounds"])
+EyeGeometry.__doc__ = """Geometry of both eyes, indexed by side (0 = left, 1 = right)
+
+    regions (numpy.ndarray): (2, 6, 2) int32 eye polygons
+    blinking (numpy.ndarray): (2,) eye width / eye height ratios, inf or nan
+        when the eye height is zero
+    bounds (numpy.ndarray): (2, 4) crop bounds (min_x, min_y, max_x, max_y)
+"""
+
+
+def landmarks_to_array(landmarks):
+    """Converts dlib facial landmarks into a (68, 2) array of (x, y) points
+
+    Arguments:
+        landmarks (dlib.full_object_detection): Facial landmarks for the face region
+    """
+    return np.array([(point.x, point.y) for point in landmarks.parts()], dtype=np.int32)
+
+
+def as_landmark_array(landmarks):
+    """Returns landmarks as a (68, 2) array, converting dlib landmarks if needed"""
+    if isinstance(landmarks, np.ndarray):
+        return landmarks
+    return landmarks_to_array(landmarks)
+
+
+def eye_geometry(points):
+    """Computes the polygons, blinking ratios and crop bounds of both eyes
+    with vectorised operations. Extra leading dimensions are kept, so a stack
+    of (N, 68, 2) landmarks gives the geometry of N faces at once.
+
+    Arguments:
+        points (numpy.ndarray): (..., 68, 2) facial landmarks
+
+    Returns:
+        An EyeGeometry
+    """
+    regions = points[..., EYE_POINTS, :].astype(np.int32)
+
+    left = regions[..., 0, :]
+    right = regions[..., 3, :]
+    # Middle points are truncated to integers, as int((p1 + p2) / 2)
+    top = np.trunc((regions[..., 1, :] + regions[..., 2, :]) / 2)
+    bottom = np.trunc((regions[..., 5, :] + regions[..., 4, :]) / 2)
+
+    eye_width = np.hypot(*np.moveaxis(left - right, -1, 0))
+    eye_height = np.hypot(*np.moveaxis(top - bottom, -1, 0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        blinking = eye_width / eye_height
+
+    bounds = np.concatenate(
+        [regions.min(axis=-2) - EYE_MARGIN, regions.max(axis=-2) + EYE_MARGIN], axis=-1
+    )
+    return EyeGeometry(regions, blinking, bounds)
@@ -0,0 +1,69 @@
+import importlib
+import sys
+import threading
+import time
+
+
+class ModelRegistry(object):
+    """
+    Process-wide cache of loaded models. Each model is loaded once, lazily, on
+    first use, and then shared by every GazeTracking instance and backend of the
+    process. Models preloaded before forking worker processes are shared with
+    them copy-on-write.
+
+    The registry also records how long imports and model loads took, to
+    instrument the startup of the attention service.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+        self.import_times = {}
+        self.load_times = {}
+
+    def get(self, key, loader):
+        """Returns the model stored under key, calling loader() the first time
+
+        Arguments:
+            key (hashable): Identifies the model, e.g. its kind and file path
+            loader (callable): Loads the model, called at most once per key
+        """
+        try:
+            return self._models[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._models:
+                start = time.perf_counter()
+                self._models[key] = loader()
+                self.load_times[key] = time.perf_counter() - start
+            return self._models[key]
+
+    def loaded(self):
+        """Returns the keys of the models loaded so far"""
+        return list(self._models)
+
+    def clear(self):
+        """Drops every loaded model, they are reloaded on next use"""
+        with self._lock:
+            self._models.clear()
+            self.load_times.clear()
+
+    def import_module(self, name):
+        """Imports a module, recording the import time if it was not imported yet"""
+        if name in sys.modules:
+            return sys.modules[name]
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        self.import_times.setdefault(name, time.perf_counter() - start)
+        return module
+
+    def startup_report(self):
+        """Returns the recorded import and model load times, in seconds"""
+        return {
+            "import": dict(self.import_times),
+            "load": {str(key): seconds for key, seconds in self.load_times.items()},
+        }
+
+
+registry = ModelRegistry()
@@ -0,0 +1,88 @@
+import collections
+import contextlib
+import time
+
+import numpy as np
+
+
+class _Stage(object):
+    """Context manager timing one run of a stage"""
+
+    __slots__ = ("samples", "start")
+
+    def __init__(self, samples):
+        self.samples = samples
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.samples.append(time.perf_counter() - self.start)
+
+
+class StageTimer(object):
+    """
+    Collects the latency of each stage of the gaze pipeline (grayscale
+    conversion, face detection, landmark prediction, eye isolation,
+    calibration, pupil detection), for benchmarks and profiling:
+
+        timer = StageTimer()
+        gaze = GazeTracking(timer=timer)
+        ...
+        timer.summary()
+
+    A GazeTracking created without a timer uses NULL_TIMER, which costs nothing.
+    """
+
+    def __init__(self, max_samples=100000):
+        """
+        Arguments:
+            max_samples (int): Latencies kept per stage, the oldest are dropped
+        """
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=max_samples))
+
+    def stage(self, name):
+        """Returns a context manager recording the time spent in its block under name"""
+        return _Stage(self.samples[name])
+
+    def record(self, name, seconds):
+        self.samples[name].append(seconds)
+
+    def reset(self):
+        self.samples.clear()
+
+    def summary(self):
+        """Returns {stage: {"count", "mean", "p50", "p95", "p99", "max"}}, in seconds"""
+        result = {}
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+            values = np.fromiter(samples, float, len(samples))
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            result[name] = {"count": len(values), "mean": float(values.mean()), "p50": float(p50),
+                            "p95": float(p95), "p99": float(p99), "max": float(values.max())}
+        return result
+
+    def histogram(self, name, bins=12):
+        """Returns (counts, edges) of the latencies of a stage, on log-spaced bins"""
+        values = np.fromiter(self.samples[name], float)
+        if values.size == 0:
+            return np.zeros(0, int), np.zeros(0)
+        low = max(values.min(), 1e-7)
+        high = max(values.max(), low * 1.01)
+        return np.histogram(values, bins=np.geomspace(low, high, bins + 1))
+
+
+class _NullTimer(object):
+    """Timer that records nothing"""
+
+    _stage = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self._stage
+
+    def record(self, name, seconds):
+        pass
+
+
+NULL_TIMER = _NullTimer()
@@ -0,0 +1,341 @@
+# html_postprocess.py
+# Post-processing of the generated games after extract_html: checks that a game
+# has the features prompt_prefix demands, flags or strips the external network
+# references so that it loads offline, and minifies it before it is stored in
+# the session and sent to the browser.
+import os
+import re
+from collections import namedtuple
+
+STRIP_EXTERNAL = os.getenv("POSTPROCESS_STRIP_EXTERNAL", "1") == "1"
+MINIFY = os.getenv("POSTPROCESS_MINIFY", "1") == "1"
+
+# Features demanded by prompt_prefix: name: (where, pattern). The pattern is searched,
+# in lower case, in the words of
+#   "control": each button (label, id, class, value) and the id of each element
+#   "element": the id and class of each element
+#   "script": the whole document
+REQUIRED_FEATURES = {
+    "start button": ("control", r"\b(?:start|begin|play(?! again))\b"),
+    "end button": ("control", r"\b(?:end|stop|quit|finish|exit)\b"),
+    "score": ("element", r"\bscore\b"),
+    "replay": ("control", r"\b(?:replay|restart|play again|try again|reset)\b"),
+    # A key listener, and the arrow keys or key codes it compares
+    "arrow key handling": ("script", r"\A(?=.*key(?:down|up)\b)"
+                                     r"(?=.*(?:\barrow(?:up|down|left|right)\b|\bkeycode\b))"),
+}
+
+PostprocessResult = namedtuple(
+    "PostprocessResult", ["html", "accepted", "missing", "external", "original_bytes", "bytes"]
+)
+
+_BUTTON = re.compile(
+    r"""<button\b([^>]*)>(.*?)</button\s*>|<input\b([^>]*\btype\s*=\s*["']?(?:button|submit|reset)\b[^>]*)>""",
+    re.IGNORECASE | re.DOTALL,
+)
+_ID_OR_CLASS = re.compile(r"""\b(id|class)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.IGNORECASE)
+_CAMEL_CASE = re.compile(r"([a-z0-9])([A-Z])")
+_NOT_WORD = re.compile(r"[^A-Za-z0-9]+")
+# Elements whose content is not HTML, or whose whitespace matters
+_RAW_ELEMENT = re.compile(r"(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)", re.IGNORECASE | re.DOTALL)
+_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+# A tag, whose quoted attribute values may contain ">"
+_TAG = re.compile(r"""(<[A-Za-z!/](?:"[^"]*"|'[^']*'|[^'">])*>)""")
+_QUOTED = re.compile(r"""("[^"]*"|'[^']*')""")
+_TAG_NAME = re.compile(r"<[/!]?([A-Za-z][A-Za-z0-9-]*)")
+# Whitespace next to these tags is not rendered, so it is dropped instead of kept as a space
+_BLOCK_TAGS = frozenset("""
+    address article aside blockquote body br dd details div dl doctype dt fieldset figcaption figure
+    footer form h1 h2 h3 h4 h5 h6 head header hr html li link main meta nav ol p section summary
+    table tbody td tfoot th thead title tr ul
+""".split())
+_WHITESPACE = re.compile(r"\s+")
+_SCRIPT_TYPE = re.compile(r"""\btype\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]*))""", re.IGNORECASE)
+_JS_TYPES = ("", "text/javascript", "application/javascript", "module")
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_PUNCTUATION = re.compile(r"\s*([{};,>])\s*")
+_CSS_COLON = re.compile(r":\s+")  # Not before the colon, "a :hover" differs from "a:hover"
+# A / after these characters or keywords starts a regex, after an operand it is a division
+_REGEX_PRECEDERS = frozenset("(,=:[!&|?{};+-*%<>~^")
+_REGEX_KEYWORDS = frozenset(
+    "return typeof instanceof in of new delete void throw case do else yield await".split()
+)
+
+_EXTERNAL_URL = r"(?:https?:)?//[^\s\"'()<>]+"
+_EXTERNAL_ATTRIBUTE = re.compile(r"""\b(src|href)\s*=\s*(["']?)(""" + _EXTERNAL_URL + r""")\2""", re.IGNORECASE)
+_EXTERNAL_CSS = re.compile(r"""(?:@import\s+|url\(\s*)(["']?)(""" + _EXTERNAL_URL + r""")\1""", re.IGNORECASE)
+_EXTERNAL_SCRIPT = re.compile(
+    r"""<script\b[^>]*\bsrc\s*=\s*["']?""" + _EXTERNAL_URL + r"""[^>]*>\s*</script\s*>""", re.IGNORECASE
+)
+_EXTERNAL_LINK = re.compile(r"""<link\b[^>]*\bhref\s*=\s*["']?""" + _EXTERNAL_URL + r"""[^>]*>""", re.IGNORECASE)
+# External resources the game cannot work without: scripts and stylesheets
+_REQUIRED_RESOURCE = re.compile(
+    r"""<script\b[^>]*\bsrc\s*=\s*["']?(""" + _EXTERNAL_URL + r""")"""
+    r"""|<link\b(?=[^>]*\brel\s*=\s*["']?[^"'>]*stylesheet)[^>]*\bhref\s*=\s*["']?(""" + _EXTERNAL_URL + r")",
+    re.IGNORECASE,
+)
+_EXTERNAL_IMPORT = re.compile(r"""@import\s+(?:url\()?\s*["']?""" + _EXTERNAL_URL + r"""[^;]*;""", re.IGNORECASE)
+_EXTERNAL_CSS_URL = re.compile(r"""url\(\s*(["']?)""" + _EXTERNAL_URL + r"""\1\s*\)""", re.IGNORECASE)
+
+
+def _words(text):
+    """startBtn, start-btn and "Start!" all become "start btn" or "start" """
+    return _NOT_WORD.sub(" ", _CAMEL_CASE.sub(r"\1 \2", text)).strip().lower()
+
+
+def find_controls(html):
+    """Returns the words of each button (label, id, class and value) and of each element id"""
+    controls = []
+    for match in _BUTTON.finditer(html):
+        attributes, label, input_attributes = match.groups()
+        controls.append(_words(" ".join(filter(None, (attributes, re.sub(r"<[^>]*>", " ", label or ""),
+                                                      input_attributes)))))
+    controls += [_words(value) for kind, value in find_ids_and_classes(html) if kind == "id"]
+    return controls
+
+
+def find_ids_and_classes(html):
+    """Returns the (lower case "id" or "class", value) of the elements"""
+    return [(match.group(1).lower(), next(value for value in match.groups()[1:] if value is not None))
+            for match in _ID_OR_CLASS.finditer(html)]
+
+
+def check_structure(html, required=REQUIRED_FEATURES):
+    """Returns the names of the required features not found in the game. Buttons
+    and the score are looked for as elements, so a script merely mentioning
+    e.g. startScore or reset() does not satisfy them."""
+    lowered = html.lower()
+    if "<html" not in lowered and "<body" not in lowered:
+        return ["html document"]
+    texts = {
+        "control": find_controls(html),
+        "element": [_words(value) for _, value in find_ids_and_classes(html)],
+        "script": [lowered],
+    }
+    return [name for name, (where, pattern) in required.items()
+            if not any(re.search(pattern, text, re.DOTALL) for text in texts[where])]
+
+
+def find_external_references(html):
+    """Returns the external URLs (http, https and protocol-relative) the game loads"""
+    urls = [match.group(3) for match in _EXTERNAL_ATTRIBUTE.finditer(html)]
+    urls += [match.group(2) for match in _EXTERNAL_CSS.finditer(html)]
+    # Links to other pages are fine, only <a> anchors may keep them
+    anchors = {match.group(1) for match in re.finditer(
+        r"""<a\b[^>]*\bhref\s*=\s*["']?(""" + _EXTERNAL_URL + r")", html, re.IGNORECASE)}
+    return list(dict.fromkeys(url for url in urls if url not in anchors))
+
+
+def find_required_resources(html):
+    """Returns the URLs of the external scripts and stylesheets of the game.
+    Stripping them breaks the game (e.g. a library loaded from a CDN), so
+    such a game is rejected rather than served without them."""
+    return list(dict.fromkeys(match.group(1) or match.group(2) for match in _REQUIRED_RESOURCE.finditer(html)))
+
+
+def is_javascript(open_tag):
+    """Returns true if a <script> tag holds JavaScript, and not e.g. a JSON or template block"""
+    match = _SCRIPT_TYPE.search(open_tag)
+    if match is None:
+        return True
+    value = next(group for group in match.groups() if group is not None)
+    return value.strip().lower() in _JS_TYPES
+
+
+def strip_external_references(html):
+    """Removes the external scripts, stylesheets and CSS imports, and blanks the
+    other external src attributes and CSS images, so that the game never waits
+    for the network"""
+    html = _EXTERNAL_SCRIPT.sub("", html)
+    html = _EXTERNAL_LINK.sub("", html)
+    html = _EXTERNAL_IMPORT.sub("", html)
+    html = _EXTERNAL_CSS_URL.sub("none", html)
+
+    def blank(match):
+        if match.group(1).lower() == "href":
+            return match.group(0)  # Anchors, a dead link does not block loading
+        return f'{match.group(1)}=""'
+
+    return _EXTERNAL_ATTRIBUTE.sub(blank, html)
+
+
+def minify_css(css):
+    css = _CSS_COMMENT.sub("", css)
+    css = _WHITESPACE.sub(" ", css)
+    css = _CSS_PUNCTUATION.sub(r"\1", css)
+    return _CSS_COLON.sub(":", css).replace(";}", "}").strip()
+
+
+class JsScanner(object):
+    """
+    Follows a script line by line, enough to tell whether a line starts in
+    code or inside a string, template literal, regex or block comment. The
+    state is a stack: a template literal nests code in ${...}, which may nest
+    other template literals.
+    """
+
+    def __init__(self):
+        self.stack = ["code"]
+        self.braces = []  # Braces opened in each ${...}
+        self.previous = ""  # Last significant code character, tells a regex from a division
+        self.word = ""  # Identifier or keyword ending at previous
+        self.gap = True  # Whitespace since previous
+
+    def in_code(self):
+        return self.stack[-1] == "code"
+
+    def feed(self, line):
+        """Scans a line, without its line break"""
+        self.gap = True
+        continued = False
+        index = 0
+        while index < len(line):
+            char = line[index]
+            mode = self.stack[-1]
+            if mode == "code":
+                following = line[index + 1:index + 2]
+                if char in "'\"`":
+                    self.stack.append(char)
+                elif char == "/" and following == "/":
+                    break  # Line comment
+                elif char == "/" and following == "*":
+                    self.stack.append("*")
+                    index += 1
+                elif char == "/" and self._regex_allowed():
+                    self.stack.append("/")
+                elif char == "}" and len(self.stack) > 1 and self.braces[-1] == 0:
+                    # End of a ${...}, back in the template literal
+                    self.stack.pop()
+                    self.braces.pop()
+                elif char.isspace():
+                    self.gap = True
+                else:
+                    if len(self.stack) > 1 and char in "{}":
+                        self.braces[-1] += 1 if char == "{" else -1
+                    self._significant(char)
+            elif char == "\\":
+                index += 1
+                continued = index >= len(line)
+            elif mode == "*":
+                if char == "*" and line[index + 1:index + 2] == "/":
+                    self.stack.pop()
+                    index += 1
+            elif mode == "`" and char == "$" and line[index + 1:index + 2] == "{":
+                self.stack.append("code")
+                self.braces.append(0)
+                index += 1
+            elif mode == "/" and char == "[":
+                self.stack.append("[")  # A / in a character class does not end the regex
+            elif char == ("]" if mode == "[" else mode):
+                self.stack.pop()
+                if mode != "[":
+                    self._significant(")")  # The literal is an operand
+            index += 1
+        # Strings only go on across lines with an escaped line break, regexes never do
+        if self.stack[-1] in ("'", '"') and not continued:
+            self.stack.pop()
+        while self.stack[-1] in ("/", "["):
+            self.stack.pop()
+
+    def _significant(self, char):
+        identifier = char.isalnum() or char in "_$"
+        if identifier and not self.gap and (self.previous.isalnum() or self.previous in ("_", "$")):
+            self.word += char
+        else:
+            self.word = char if identifier else ""
+        self.previous = char
+        self.gap = False
+
+    def _regex_allowed(self):
+        if not self.previous or self.previous in _REGEX_PRECEDERS:
+            return True
+        return self.word in _REGEX_KEYWORDS
+
+
+def minify_js(js):
+    """Drops the indentation, blank lines and whole-line // comments. Line breaks
+    are kept, as the generated code relies on automatic semicolon insertion.
+    Lines starting inside a string, template literal or block comment are left as they are."""
+    scanner = JsScanner()
+    lines = []
+    for line in js.splitlines():
+        if scanner.in_code():
+            line = line.lstrip()
+            if not line or line.startswith("//"):
+                continue
+        scanner.feed(line)
+        if scanner.in_code():
+            line = line.rstrip()
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def minify(html):
+    """Returns html without comments and indentation, with its CSS and JS minified"""
+    parts = []
+    position = 0
+    for match in _RAW_ELEMENT.finditer(html):
+        parts.append(_minify_markup(html[position:match.start()]))
+        open_tag, name, content, close_tag = match.groups()
+        name = name.lower()
+        if name == "style":
+            content = minify_css(content)
+        elif name == "script" and is_javascript(open_tag):
+            content = minify_js(content)
+        parts.append(open_tag + content + close_tag)
+        position = match.end()
+    parts.append(_minify_markup(html[position:]))
+    return "".join(parts).strip()
+
+
+def _minify_markup(markup):
+    pieces = _TAG.split(_COMMENT.sub("", markup))
+    # Odd pieces are tags, even pieces the text around them
+    last = len(pieces) - 1
+    for index, piece in enumerate(pieces):
+        if index % 2:
+            # Quoted attribute values are kept as they are, e.g. multi-line event handlers
+            values = _QUOTED.split(piece)
+            values[::2] = [_WHITESPACE.sub(" ", value) for value in values[::2]]
+            pieces[index] = "".join(values)
+        elif (0 < index < last and not piece.strip()
+              and (_is_block(pieces[index - 1]) or _is_block(pieces[index + 1]))):
+            pieces[index] = ""  # Indentation next to a block, e.g. between two <div>
+        else:
+            # Also between two inline tags: "<b>Score:</b> <span>" keeps its space
+            pieces[index] = _WHITESPACE.sub(" ", piece)
+    return "".join(pieces)
+
+
+def _is_block(tag):
+    match = _TAG_NAME.match(tag)
+    return match is not None and match.group(1).lower() in _BLOCK_TAGS
+
+
+def postprocess(html, strip_external=STRIP_EXTERNAL, minify_html=MINIFY, required=REQUIRED_FEATURES):
+    """Validates and shrinks a game extracted from the action agent's response
+
+    Arguments:
+        html (str): Output of extract_html
+        strip_external (bool): Remove the external references instead of only flagging them
+        minify_html (bool): Minify the HTML, CSS and JS
+        required (dict): Features the game must have, see REQUIRED_FEATURES
+
+    Returns:
+        A PostprocessResult, accepted is False if the game misses a required
+        feature or depends on the network, whether the references are
+        stripped or not. Only images, media and other non-essential
+        references are blanked in an accepted game.
+    """
+    if not html:
+        return PostprocessResult(html, False, ["html document"], [], 0, 0)
+    original_bytes = len(html.encode("utf-8"))
+    missing = check_structure(html, required)
+    missing += [f"external resource {url}" for url in find_required_resources(html)]
+    external = find_external_references(html)
+    if strip_external and external:
+        html = strip_external_references(html)
+    if minify_html:
+        html = minify(html)
+    accepted = not missing and (strip_external or not external)
+    return PostprocessResult(html, accepted, missing, external, original_bytes, len(html.encode("utf-8")))
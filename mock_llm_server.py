@@ -0,0 +1,254 @@
+# mock_llm_server.py
+# Offline stand-in for the OpenAI-compatible chat completions endpoint used by
+# the agents, to load-test and regression-test generation without network:
+#
+#   python mock_llm_server.py --port 8900 --tokens-per-second 50 --latency 0.5 --failure-rate 0.05
+#   OPENAI_API_BASE=http://localhost:8900/v1 OPENAI_API_KEY=mock streamlit run app.py
+#
+# The answer depends on the prompt: the action agent gets a complete game that
+# passes html_postprocess, the decision agent GENERATE_H5_GAME and the
+# perception agent a requirement type. Token rate, time to first token,
+# streaming and failures are configurable.
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+GAME_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Color Match</title>
+<style>
+body {{ font-family: sans-serif; text-align: center; }}
+.cell {{ display: inline-block; width: 40px; height: 40px; margin: 2px; }}
+</style>
+</head>
+<body>
+<h1>Color Match</h1>
+<div>Score: <span id="score">0</span></div>
+<button id="start" onclick="startGame()">Start</button>
+<button id="end" onclick="endGame()">End</button>
+<button id="replay" onclick="restart()">Replay</button>
+<div id="board">{cells}</div>
+<script>
+var score = 0;
+var running = false;
+function startGame() {{ running = true; score = 0; update(); }}
+function endGame() {{ running = false; alert("Game over! Score: " + score); }}
+function restart() {{ startGame(); }}
+function update() {{ document.getElementById("score").textContent = score; }}
+document.addEventListener("keydown", function (e) {{
+    if (["ArrowUp", "ArrowDown", "ArrowLeft", "ArrowRight"].indexOf(e.key) > -1) {{
+        e.preventDefault();
+        if (running) {{ score += 1; update(); }}
+    }}
+}});
+</script>
+</body>
+</html>"""
+
+
+def make_game(size):
+    """Returns a valid game of about size bytes"""
+    cell = '<div class="cell" style="background:#8ad"></div>\n'
+    return GAME_TEMPLATE.format(cells=cell * max(size // len(cell), 1))
+
+
+class MockOptions(object):
+    """Behaviour of the mock server"""
+
+    def __init__(self, tokens_per_second=50.0, latency=0.5, latency_distribution="lognormal",
+                 latency_sigma=0.5, failure_rate=0.0, disconnect_rate=0.0, game_size=8000,
+                 chars_per_token=4, seed=None):
+        """
+        Arguments:
+            tokens_per_second (float): Rate at which tokens are produced, 0 for no delay
+            latency (float): Median seconds before the first token
+            latency_distribution (str): "fixed", "uniform" (0 to 2 x latency) or "lognormal"
+            latency_sigma (float): Sigma of the lognormal latency distribution
+            failure_rate (float): Fraction of the requests answered with an HTTP 500 or 429
+            disconnect_rate (float): Fraction of the streams cut in the middle
+            game_size (int): Bytes of the game returned to the action agent
+            chars_per_token (int): Characters per streamed token
+            seed (int): Random seed, for reproducible runs
+        """
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+        self.tokens_per_second = tokens_per_second
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.disconnect_rate = disconnect_rate
+        self.chars_per_token = chars_per_token
+        self.game = make_game(game_size)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def first_token_delay(self):
+        with self._lock:
+            if self.latency_distribution == "fixed":
+                return self.latency
+            if self.latency_distribution == "uniform":
+                return self._random.uniform(0, 2 * self.latency)
+            return self.latency * self._random.lognormvariate(0, self.latency_sigma)
+
+    def answer(self, prompt):
+        """Returns the completion of a prompt, depending on the agent that sent it"""
+        if "HTML game developer" in prompt:
+            return f"Here is your game:\n\n```html\n{self.game}\n```\n\nHave fun!"
+        if "GENERATE_H5_GAME" in prompt:
+            return "GENERATE_H5_GAME"
+        return "Web Game"
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """Serves POST /v1/chat/completions and GET /v1/models"""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real endpoint
+    options = MockOptions()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        options = self.options
+        if options.random() < options.failure_rate:
+            if options.random() < 0.5:
+                self._send_json(429, {"error": {"message": "Rate limit reached (injected)", "type": "rate_limit"}})
+            else:
+                self._send_json(500, {"error": {"message": "Internal error (injected)", "type": "server_error"}})
+            return
+
+        prompt = "\n".join(str(message.get("content", "")) for message in request.get("messages", []))
+        content = options.answer(prompt)
+        model = request.get("model", "mock")
+        time.sleep(options.first_token_delay())
+        if request.get("stream"):
+            self._stream(content, model)
+        else:
+            if options.tokens_per_second > 0:
+                time.sleep(len(content) / options.chars_per_token / options.tokens_per_second)
+            self._send_json(200, completion(content, model))
+
+    def _stream(self, content, model):
+        options = self.options
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        cut = len(content) // 2 if options.random() < options.disconnect_rate else None
+        interval = 1.0 / options.tokens_per_second if options.tokens_per_second > 0 else 0.0
+        next_token = time.monotonic()
+        for start in range(0, len(content), options.chars_per_token):
+            if cut is not None and start >= cut:
+                return  # Injected disconnect, the stream ends without [DONE]
+            token = content[start:start + options.chars_per_token]
+            self.wfile.write(b"data: " + json.dumps(chunk(token, model)).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+            if interval:
+                next_token += interval
+                delay = next_token - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        self.wfile.write(b"data: " + json.dumps(chunk("", model, finish_reason="stop")).encode("utf-8") + b"\n\n")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def completion(content, model):
+    return {
+        "id": f"chatcmpl-mock-{time.monotonic_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(content) // 4, "total_tokens": len(content) // 4},
+    }
+
+
+def chunk(token, model, finish_reason=None):
+    delta = {"content": token} if token else {}
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def create_server(host="127.0.0.1", port=8900, options=None):
+    """Returns a ThreadingHTTPServer answering with the given MockOptions"""
+    handler = type("ConfiguredMockRequestHandler", (MockRequestHandler,), {"options": options or MockOptions()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_background(host="127.0.0.1", port=0, options=None):
+    """Starts a mock server in a daemon thread, port 0 picks a free port.
+    Returns (server, base_url) where base_url is the OPENAI_API_BASE to use."""
+    server = create_server(host, port, options)
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--latency", type=float, default=0.5, help="Median seconds to the first token")
+    parser.add_argument("--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of HTTP 500/429 answers")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="Fraction of streams cut halfway")
+    parser.add_argument("--game-size", type=int, default=8000, help="Bytes of the generated game")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    options = MockOptions(args.tokens_per_second, args.latency, args.latency_distribution, args.latency_sigma,
+                          args.failure_rate, args.disconnect_rate, args.game_size, seed=args.seed)
+    server = create_server(args.host, args.port, options)
+    print(f"Mock chat completions on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
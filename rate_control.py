@@ -0,0 +1,109 @@
+# rate_control.py
+# Server-driven capture rate of the attention clients: each session is told the
+# frame rate and resolution to capture at, from the analysis capacity of the
+# server, the number of sessions sharing it and how stable the session is.
+import time
+
+# Capture resolutions offered to the clients, largest first
+RESOLUTIONS = [(320, 240), (240, 180), (160, 120)]
+
+
+class RateController(object):
+    """
+    Computes the target fps and capture resolution of a session.
+
+    The capacity of the server is the analysis time per pixel (an exponential
+    moving average of the measured frames) spread over its workers and the open
+    sessions. Within that budget, a session whose attention state just changed
+    is sampled at max_fps, and the rate then decays to min_fps as the state
+    stays stable. When the budget cannot afford the wanted rate at full
+    resolution, a smaller capture resolution is chosen first.
+    """
+
+    def __init__(self, workers, min_fps=1.0, max_fps=8.0, utilisation=0.8, settle_after=5.0,
+                 stable_after=60.0, alpha=0.1, resolutions=RESOLUTIONS):
+        """
+        Arguments:
+            workers (int): Number of analysis workers
+            min_fps (float): Rate of a session stable for stable_after seconds
+            max_fps (float): Rate of a session around a state change
+            utilisation (float): Fraction of the workers' time the sessions may use
+            settle_after (float): Seconds after a state change sampled at max_fps
+            stable_after (float): Seconds after a state change at which min_fps is reached
+            alpha (float): Weight of the newest frame in the analysis time average
+            resolutions (list): Capture resolutions, largest first
+        """
+        self.workers = workers
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.utilisation = utilisation
+        self.settle_after = settle_after
+        self.stable_after = stable_after
+        self.alpha = alpha
+        self.resolutions = resolutions
+        self._seconds_per_pixel = None
+
+    def record_analysis(self, seconds, pixels):
+        """Records the analysis time of a frame of the given number of pixels"""
+        if pixels <= 0:
+            return
+        seconds_per_pixel = seconds / pixels
+        if self._seconds_per_pixel is None:
+            self._seconds_per_pixel = seconds_per_pixel
+        else:
+            self._seconds_per_pixel += self.alpha * (seconds_per_pixel - self._seconds_per_pixel)
+
+    def capacity_fps(self, sessions, resolution):
+        """Frames per second each of the sessions can get at a resolution"""
+        if self._seconds_per_pixel is None:
+            return self.max_fps
+        width, height = resolution
+        frame_seconds = self._seconds_per_pixel * width * height
+        return self.workers * self.utilisation / (frame_seconds * max(sessions, 1))
+
+    def wanted_fps(self, stable_for):
+        """Rate wanted by a session whose state has not changed for stable_for seconds"""
+        if stable_for <= self.settle_after:
+            return self.max_fps
+        progress = min((stable_for - self.settle_after) / (self.stable_after - self.settle_after), 1.0)
+        return self.max_fps - (self.max_fps - self.min_fps) * progress
+
+    def target(self, sessions, stable_for):
+        """Returns the (fps, width, height) a session should capture at
+
+        Arguments:
+            sessions (int): Number of open sessions
+            stable_for (float): Seconds since the last attention state change of the session
+        """
+        wanted = self.wanted_fps(stable_for)
+        for resolution in self.resolutions:
+            capacity = self.capacity_fps(sessions, resolution)
+            if capacity >= wanted:
+                break
+        fps = max(self.min_fps, min(wanted, capacity))
+        return round(fps, 1), resolution[0], resolution[1]
+
+
+class SessionRate(object):
+    """Rate last sent to a session and the time of its last attention change"""
+
+    def __init__(self):
+        self.last_change = time.monotonic()
+        self.sent = None
+
+    def state_changed(self):
+        self.last_change = time.monotonic()
+
+    @property
+    def stable_for(self):
+        return time.monotonic() - self.last_change
+
+    def update(self, target, min_step=0.5):
+        """Returns target if it differs enough from the rate sent last, else None"""
+        if self.sent is not None:
+            fps, width, height = target
+            sent_fps, sent_width, sent_height = self.sent
+            if (width, height) == (sent_width, sent_height) and abs(fps - sent_fps) < min_step:
+                return None
+        self.sent = target
+        return target
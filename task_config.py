@@ -0,0 +1,59 @@
+# task_config.py
+# Task configuration of the Dialogue tab: the WHAT/HOW/LEVEL options the
+# therapist chooses from and the prompt built from them for the action agent.
+import itertools
+
+# By cognitive/functional goal (WHAT)
+WHAT_OPTIONS = {
+    "Perceptual Training": "Task Type: Auditory discrimination, visual tracking, tactile exploration; Functional Goal: Enhance sensory input processing ability; Game Example: Color block dragging",
+    "Emotion Recognition and Regulation": "Task Type: Facial expression matching, emotion classification, self-emotion reporting; Functional Goal: Recognize others/self emotional states; Game Example: Simulated expression selection, emotion bar adjustment task",
+    "Social Communication Skills": "Task Type: Turn-taking dialogue, greeting practice, virtual interaction; Functional Goal: Enhance understanding of social interaction rules; Game Example: NPC dialogue imitation practice",
+    "Attention and Executive Function": "Task Type: Attention maintenance, working memory, multitasking; Functional Goal: Improve task completion and organizational ability; Game Example: Spot the difference, sorting game",
+    "Interest-Guided Learning": "Task Type: Embed specific interest content in tasks; Functional Goal: Increase motivation, improve task acceptance; Game Example: Train number recognition, dinosaur matching"
+}
+
+# By interaction form (HOW)
+HOW_OPTIONS = {
+    "Gamified Task": "Task Feature: Emphasize rules, feedback, and scores; Game Example: Snake, 2048, matching game",
+    "Story-based Task": "Task Feature: Scenario-driven, guide social reasoning; Game Example: 'Go shopping' interactive story",
+    "Daily Simulation Task": "Task Feature: Simulate real-life scenarios; Game Example: Dressing, tooth brushing task guidance"
+}
+
+# By task difficulty and level (LEVEL)
+LEVEL_OPTIONS = {
+    "Low Difficulty": "Task Feature: Single modality, reactive, no social logic; Game Example: Click the appearing image",
+    "Medium Difficulty": "Task Feature: Multimodal, with sequence/feedback rules; Game Example: Drag image to sequence position",
+    "High Difficulty": "Task Feature: Intent reasoning, role-playing; Game Example: Choose the correct response in dialogue"
+}
+
+# Normative prefix of every prompt
+PROMPT_PREFIX = (
+    "Please generate a high-quality H5 web mini-game with the following requirements:"
+    "1. The game must have clear start and end buttons;"
+    "2. The game must have basic functions such as scoring and replay;"
+    "3. The game must disable arrow key scrolling of the webpage, and arrow keys are only for game operation;"
+    "4. When the game ends, only a popup on the current page is allowed, and no popup when switching tabs."
+    "Please strictly follow the above requirements."
+)
+
+
+def combined_prompt(what, how, level):
+    """Returns the task configuration part of the prompt"""
+    return f"{WHAT_OPTIONS[what]} | {HOW_OPTIONS[how]} | {LEVEL_OPTIONS[level]}"
+
+
+def full_prompt(what, how, level, user_input=""):
+    """Returns the prompt sent to the action agent
+
+    Arguments:
+        what (str): Key of WHAT_OPTIONS
+        how (str): Key of HOW_OPTIONS
+        level (str): Key of LEVEL_OPTIONS
+        user_input (str): Free-text requirement of the user
+    """
+    return f"{PROMPT_PREFIX} | Task Configuration: {combined_prompt(what, how, level)} | User Requirement: {user_input}"
+
+
+def cells():
+    """Yields every (what, how, level) combination of the task matrix"""
+    return itertools.product(WHAT_OPTIONS, HOW_OPTIONS, LEVEL_OPTIONS)